@@ -0,0 +1,164 @@
+"""
+Журнал заходов в заметки с дозаписью в конец файла
+"""
+import os
+import json
+from pathlib import Path
+from typing import List, Dict, Optional
+from atomic_io import file_lock
+
+
+# Сколько записей хранится в одном сегменте журнала.
+# Всего хранится от ACCESS_LOG_RETENTION до 2 * ACCESS_LOG_RETENTION записей.
+ACCESS_LOG_RETENTION = 1000
+
+# Размер блока при чтении хвоста файла
+TAIL_BLOCK_SIZE = 8192
+
+
+class AccessLog:
+    """
+    Журнал заходов из двух сегментов в формате JSON Lines
+    
+    Новые записи дописываются в конец текущего сегмента (O(1)). Когда в нем
+    набирается retention записей, он становится предыдущим сегментом, а старый
+    предыдущий удаляется - получается кольцевой буфер без перезаписи данных.
+    """
+    
+    def __init__(self, log_file: Path, retention: int = ACCESS_LOG_RETENTION):
+        """
+        Инициализация журнала
+        
+        Args:
+            log_file: Путь к текущему сегменту журнала
+            retention: Количество записей в сегменте
+        """
+        self.log_file = Path(log_file)
+        self.previous_file = self.log_file.with_suffix('.1' + self.log_file.suffix)
+        self.retention = max(1, retention)
+        # Количество записей в текущем сегменте и его inode (сегмент мог сменить другой процесс)
+        self._count: Optional[int] = None
+        self._inode: Optional[int] = None
+    
+    def _count_lines(self, path: Path) -> int:
+        """Считает записи в сегменте"""
+        try:
+            with open(path, 'rb') as f:
+                return sum(1 for _ in f)
+        except OSError:
+            return 0
+    
+    def _current_inode(self) -> Optional[int]:
+        """Получает inode текущего сегмента"""
+        try:
+            return self.log_file.stat().st_ino
+        except OSError:
+            return None
+    
+    def append(self, entry: Dict) -> bool:
+        """
+        Дописывает запись в журнал
+        
+        Args:
+            entry: Запись {date, note_id, action}
+            
+        Returns:
+            True если успешно
+        """
+        line = json.dumps(entry, ensure_ascii=False) + "\n"
+        # Блокировка файла: дозапись и смена сегментов из нескольких процессов не перемешиваются
+        with file_lock(self.log_file):
+            inode = self._current_inode()
+            if self._count is None or inode != self._inode:
+                self._count = self._count_lines(self.log_file)
+            
+            # Одна запись одним write в режиме дозаписи
+            with open(self.log_file, 'a', encoding='utf-8') as f:
+                f.write(line)
+            self._count += 1
+            self._inode = self._current_inode()
+            
+            if self._count >= self.retention:
+                os.replace(self.log_file, self.previous_file)
+                self._count = 0
+                self._inode = None
+        return True
+    
+    def _read_tail(self, path: Path, limit: int) -> List[Dict]:
+        """
+        Читает последние записи сегмента, не читая файл целиком
+        
+        Args:
+            path: Путь к сегменту
+            limit: Максимальное количество записей
+            
+        Returns:
+            Записи от старых к новым
+        """
+        if limit <= 0:
+            return []
+        
+        try:
+            with open(path, 'rb') as f:
+                f.seek(0, os.SEEK_END)
+                position = f.tell()
+                data = b""
+                # Читаем блоки с конца, пока не наберется limit полных строк
+                while position > 0 and data.count(b"\n") <= limit:
+                    block_size = min(TAIL_BLOCK_SIZE, position)
+                    position -= block_size
+                    f.seek(position)
+                    data = f.read(block_size) + data
+        except OSError:
+            return []
+        
+        lines = data.split(b"\n")
+        if position > 0:
+            # Первая строка может быть обрезана
+            lines = lines[1:]
+        
+        entries = []
+        for line in lines[-(limit + 1):]:
+            if not line.strip():
+                continue
+            try:
+                entries.append(json.loads(line.decode('utf-8')))
+            except ValueError:
+                # Недописанная строка (например, после сбоя) пропускается
+                continue
+        return entries[-limit:]
+    
+    def tail(self, limit: int = 20) -> List[Dict]:
+        """
+        Получает последние записи журнала
+        
+        Args:
+            limit: Максимальное количество записей
+            
+        Returns:
+            Записи от старых к новым
+        """
+        entries = self._read_tail(self.log_file, limit)
+        if len(entries) < limit:
+            entries = self._read_tail(self.previous_file, limit - len(entries)) + entries
+        return entries
+    
+    def is_empty(self) -> bool:
+        """Проверяет, что в журнале нет записей"""
+        return not self.log_file.exists() and not self.previous_file.exists()
+    
+    def get_version(self) -> str:
+        """
+        Получает версию журнала по отпечаткам сегментов (меняется при каждой записи)
+        
+        Returns:
+            Строка для ETag
+        """
+        parts = []
+        for path in (self.log_file, self.previous_file):
+            try:
+                stat = path.stat()
+                parts.append(f"{stat.st_ino:x}.{stat.st_size:x}.{stat.st_mtime_ns:x}")
+            except OSError:
+                parts.append("0")
+        return "-".join(parts)
@@ -1,37 +1,138 @@
-from flask import Flask, render_template, request, jsonify, session, redirect, url_for
+from flask import Flask, Blueprint, current_app, render_template, request, jsonify, session, redirect, url_for, make_response, Response
 from flask_session import Session
 import os
+import json
+import time
+from typing import Dict, Optional
 from auth import AuthManager
 from encryption import EncryptionManager
 from file_manager import FileManager
+from session_registry import SessionRegistry
+from cookie_session import EncryptedCookieSessionInterface
+from note_patch import PatchError, VersionConflict
+from search_index import MAX_MATCHES_PER_NOTE, MAX_MATCH_WINDOW
+from rekey_job import start_rekey, resume_rekey, get_rekey_job
+from atomic_io import file_lock
+from crypto_executor import configure_crypto_executor, get_crypto_executor
 
-app = Flask(__name__)
+bp = Blueprint('main', __name__)
 
-# Генерируем постоянный SECRET_KEY или используем существующий
+# Секретный ключ по умолчанию хранится в файле, чтобы все воркеры и перезапуски использовали один ключ
 SECRET_KEY_FILE = 'secret_key.txt'
-if os.path.exists(SECRET_KEY_FILE):
-    with open(SECRET_KEY_FILE, 'rb') as f:
-        app.config['SECRET_KEY'] = f.read()
-else:
+
+# Размер страницы /api/search по умолчанию и наибольший
+SEARCH_PAGE_SIZE = 50
+MAX_SEARCH_PAGE_SIZE = 200
+
+# Размер страницы списка /api/notes по умолчанию и наибольший
+NOTES_PAGE_SIZE = 50
+MAX_NOTES_PAGE_SIZE = 500
+
+# Параметры, при которых /api/notes отдает страницу вместо полного списка
+NOTES_PAGE_ARGS = ('limit', 'cursor', 'sort', 'order', 'fields')
+
+# Разделы /api/bootstrap
+BOOTSTRAP_SECTIONS = ('graph', 'recent', 'history', 'stats')
+
+# Лента /api/changes: интервал пустых сообщений потока, время жизни потока
+# (EventSource переподключается сам с Last-Event-ID) и ожидание в режиме long-poll
+CHANGES_HEARTBEAT_SECONDS = 15
+CHANGES_STREAM_SECONDS = 300
+CHANGES_POLL_TIMEOUT = 25
+MAX_CHANGES_POLL_TIMEOUT = 60
+
+# Настройки по умолчанию, переопределяются аргументом create_app
+DEFAULT_CONFIG = {
+    # Хранилище сессий: 'filesystem' (flask-session, файл на сессию, выход отзывает сессию)
+    # или 'cookie' (сессия в зашифрованной cookie, без обращений к диску)
+    'SESSION_BACKEND': 'filesystem',
+    'SESSION_PERMANENT': True,
+    'SESSION_COOKIE_SECURE': False,
+    'SESSION_COOKIE_HTTPONLY': True,
+    'SESSION_COOKIE_SAMESITE': 'Lax',
+    'NOTES_DIR': 'notes',
+    'AUTH_CONFIG_FILE': 'auth_config.json',
+    # Потоков для PBKDF2/bcrypt/расшифровки (None - по числу ядер)
+    'CRYPTO_WORKERS': None,
+}
+
+
+def _load_secret_key(path: str) -> bytes:
+    """Читает секретный ключ из файла или создает его (атомарно, если воркеры стартуют одновременно)"""
+    try:
+        fd = os.open(path, os.O_WRONLY | os.O_CREAT | os.O_EXCL, 0o600)
+    except FileExistsError:
+        with open(path, 'rb') as f:
+            return f.read()
     secret_key = os.urandom(24)
-    with open(SECRET_KEY_FILE, 'wb') as f:
+    with os.fdopen(fd, 'wb') as f:
         f.write(secret_key)
-    app.config['SECRET_KEY'] = secret_key
+    return secret_key
 
-app.config['SESSION_TYPE'] = 'filesystem'
-app.config['SESSION_PERMANENT'] = True
-app.config['SESSION_COOKIE_SECURE'] = False
-app.config['SESSION_COOKIE_HTTPONLY'] = True
-app.config['SESSION_COOKIE_SAMESITE'] = 'Lax'
-Session(app)
 
-# Инициализация менеджеров
-auth_manager = AuthManager()
+def _get_auth_manager() -> AuthManager:
+    """Получает менеджер аутентификации приложения"""
+    return current_app.extensions['zametik']['auth_manager']
 
 
-def get_encryption_manager():
+def _get_session_registry() -> SessionRegistry:
+    """
+    Получает реестр менеджеров по сессиям
+    
+    Мастер-ключ, кеш метаданных и индексы живут между запросами
+    и хранятся только в памяти процесса (воркера).
+    """
+    return current_app.extensions['zametik']['session_registry']
+
+
+def _start_key_session(password: str):
+    """Создает контекст менеджеров для нового входа и запоминает его id в сессии"""
+    _end_key_session()
+    context_id, context = _get_session_registry().create(password)
+    # Мастер-ключ выводится в пуле криптографии сразу при входе, а не в первом запросе к заметкам
+    get_crypto_executor().run(context.encryption_manager.derive_master_key)
+    session['context_id'] = context_id
+    return context
+
+
+def _end_key_session():
+    """Выгружает контекст менеджеров текущего входа"""
+    _get_session_registry().drop(session.get('context_id'))
+
+
+def _remember_password_generation(generation: int):
+    """Запоминает в сессии номер пароля, с которым выполнен вход"""
+    session['password_generation'] = generation
+
+
+def _is_stale_session() -> bool:
+    """
+    Проверяет, что вход выполнен со старым паролем
+    
+    Номер пароля хранится в конфигурации аутентификации, общей для всех
+    воркеров, поэтому смена пароля отзывает остальные сессии при любом
+    хранилище сессий: иначе они продолжали бы писать файлы старым ключом.
+    """
+    return session.get('password_generation', 0) != _get_auth_manager().get_generation()
+
+
+def get_session_context():
+    """Получает контекст менеджеров текущей сессии"""
     if 'password' in session:
-        return EncryptionManager(session['password'])
+        password = session['password']
+        context_id = session.get('context_id')
+        if context_id:
+            # В этом воркере контекста может не быть (выгружен по простою, перезапуск
+            # или запрос попал в другой процесс) - создаем его под тем же id
+            return _get_session_registry().attach(context_id, password)
+        return _start_key_session(password)
+    return None
+
+
+def get_encryption_manager():
+    context = get_session_context()
+    if context is not None:
+        return context.encryption_manager
     return None
 
 
@@ -56,9 +157,15 @@ def require_auth(f):
             session.clear()
             return jsonify({"error": "Пароль в сессии пуст"}), 401
         
+        if _is_stale_session():
+            _end_key_session()
+            session.clear()
+            return jsonify({"error": "Пароль изменен, войдите заново"}), 401
+        
         try:
-            enc_mgr = EncryptionManager(password)
-            file_mgr = FileManager(encryption_manager=enc_mgr)
+            context = get_session_context()
+            enc_mgr = context.encryption_manager
+            file_mgr = context.file_manager
         except Exception as e:
             import traceback
             traceback.print_exc()
@@ -72,18 +179,18 @@ def require_auth(f):
     return wrapper
 
 
-@app.route('/')
+@bp.route('/')
 def index():
     return render_template('index.html')
 
 
-@app.route('/home')
+@bp.route('/home')
 @require_auth
 def home(**kwargs):
     return render_template('home.html')
 
 
-@app.route('/api/init', methods=['POST'])
+@bp.route('/api/init', methods=['POST'])
 def init_password():
     data = request.get_json()
     password = data.get('password', '')
@@ -94,14 +201,18 @@ def init_password():
     # Убеждаемся, что пароль - строка (НЕ обрезаем - пароль может содержать пробелы)
     password = str(password)
     
-    if auth_manager.is_initialized():
+    if _get_auth_manager().is_initialized():
         return jsonify({"error": "Система уже инициализирована"}), 400
     
-    if auth_manager.set_password(password):
+    # bcrypt выполняется в пуле криптографии, а не в потоке запроса
+    if get_crypto_executor().run(_get_auth_manager().set_password, password):
         # Очищаем сессию перед установкой нового пароля
+        _end_key_session()
         session.clear()
         session['authenticated'] = True
         session['password'] = password  # Сохраняем БЕЗ обрезки
+        _remember_password_generation(_get_auth_manager().get_generation())
+        _start_key_session(password)
         session.permanent = True
         session.modified = True
         
@@ -110,7 +221,7 @@ def init_password():
         return jsonify({"error": "Ошибка инициализации"}), 500
 
 
-@app.route('/api/login', methods=['POST'])
+@bp.route('/api/login', methods=['POST'])
 def login():
     data = request.get_json()
     password = data.get('password', '')
@@ -118,11 +229,18 @@ def login():
     if not password:
         return jsonify({"error": "Пароль не может быть пустым"}), 400
     
-    if auth_manager.check_password(password):
+    # Номер пароля читаем до проверки: если пароль сменят между ними, сессия окажется устаревшей
+    generation = _get_auth_manager().get_generation()
+    if get_crypto_executor().run(_get_auth_manager().check_password, password):
         # Очищаем сессию перед установкой нового пароля
+        _end_key_session()
         session.clear()
         session['authenticated'] = True
         session['password'] = password  # Сохраняем как строку БЕЗ обрезки
+        _remember_password_generation(generation)
+        # Перешифрование после смены пароля могло прерваться - продолжаем его
+        resume_rekey(current_app.config['NOTES_DIR'], password)
+        _start_key_session(password)
         session.permanent = True
         session.modified = True
         
@@ -131,13 +249,14 @@ def login():
         return jsonify({"error": "Неверный пароль"}), 401
 
 
-@app.route('/api/logout', methods=['POST'])
+@bp.route('/api/logout', methods=['POST'])
 def logout():
+    _end_key_session()
     session.clear()
     return jsonify({"success": True})
 
 
-@app.route('/api/change-password', methods=['POST'])
+@bp.route('/api/change-password', methods=['POST'])
 @require_auth
 def change_password(**kwargs):
     data = request.get_json()
@@ -150,18 +269,34 @@ def change_password(**kwargs):
     if len(new_password) < 6:
         return jsonify({"error": "Новый пароль должен быть не менее 6 символов"}), 400
     
-    if auth_manager.reset_password(old_password, new_password):
-        # Обновляем пароль в сессии
+    if get_crypto_executor().run(_get_auth_manager().reset_password, old_password, new_password):
+        # Обновляем пароль в сессии, ключи старого пароля больше не нужны ни одной сессии.
+        # Остальные сессии получат 401: номер пароля в них устарел
         session['password'] = new_password
-        return jsonify({"success": True})
+        _remember_password_generation(_get_auth_manager().get_generation())
+        _get_session_registry().drop_all()
+        # Файлы перешифровываются в фоне, до конца задачи они читаются и старым ключом
+        job = start_rekey(current_app.config['NOTES_DIR'], old_password, new_password)
+        _start_key_session(new_password)
+        return jsonify({"success": True, "rekey": job.get_progress()})
     else:
         return jsonify({"error": "Неверный текущий пароль"}), 401
 
 
-@app.route('/api/check-auth', methods=['GET'])
+@bp.route('/api/rekey-status', methods=['GET'])
+@require_auth
+def rekey_status(**kwargs):
+    """Прогресс перешифрования после смены пароля"""
+    job = get_rekey_job(current_app.config['NOTES_DIR'])
+    if job is None:
+        return jsonify({"status": "idle"})
+    return jsonify(job.get_progress())
+
+
+@bp.route('/api/check-auth', methods=['GET'])
 def check_auth():
-    is_init = auth_manager.is_initialized()
-    is_auth = session.get('authenticated', False)
+    is_init = _get_auth_manager().is_initialized()
+    is_auth = session.get('authenticated', False) and not _is_stale_session()
     
     return jsonify({
         "initialized": is_init,
@@ -169,27 +304,137 @@ def check_auth():
     })
 
 
-@app.route('/api/notes', methods=['GET'])
+@bp.route('/api/notes', methods=['GET'])
 @require_auth
 def get_notes(file_manager=None, **kwargs):
+    """
+    Список заметок; ?tag=a&tag=b фильтрует по тегам (?tag_mode=any - любой из тегов)
+    
+    С параметрами limit/cursor/sort/order/fields отдается страница:
+    ?sort=modified|created|title&order=desc|asc&limit=50&fields=id,title&cursor=...
+    Ответ {notes, total, next_cursor}; следующая страница - ?cursor=next_cursor
+    с теми же sort и order.
+    """
     try:
-        notes = file_manager.list_notes()
-        return jsonify({"notes": notes})
+        tags = request.args.getlist('tag')
+        match_all = request.args.get('tag_mode', 'all') != 'any'
+        if not any(arg in request.args for arg in NOTES_PAGE_ARGS):
+            return _conditional_response(
+                file_manager.get_notes_etag(),
+                lambda: jsonify({"notes": file_manager.list_notes(tags=tags or None, match_all=match_all)})
+            )
+        
+        limit = min(max(request.args.get('limit', NOTES_PAGE_SIZE, type=int), 1), MAX_NOTES_PAGE_SIZE)
+        fields = request.args.get('fields')
+        fields = [field.strip() for field in fields.split(',') if field.strip()] if fields else None
+        
+        def build():
+            try:
+                page = file_manager.list_notes_page(
+                    sort=request.args.get('sort', 'modified'),
+                    descending=request.args.get('order', 'desc') != 'asc',
+                    limit=limit,
+                    cursor=request.args.get('cursor') or None,
+                    fields=fields,
+                    tags=tags or None,
+                    match_all=match_all
+                )
+            except ValueError as e:
+                return jsonify({"error": str(e)}), 400
+            return jsonify(page)
+        
+        return _conditional_response(file_manager.get_notes_etag(), build)
+    except Exception as e:
+        import traceback
+        traceback.print_exc()
+        return jsonify({"error": str(e)}), 500
+
+
+@bp.route('/api/tags', methods=['GET'])
+@require_auth
+def get_tags(file_manager=None, **kwargs):
+    """Все теги с количеством заметок"""
+    try:
+        return jsonify({"tags": file_manager.get_tag_counts()})
     except Exception as e:
         import traceback
         traceback.print_exc()
         return jsonify({"error": str(e)}), 500
 
 
-@app.route('/api/notes/<note_id>', methods=['GET'])
+def _conditional_response(etag, build):
+    """
+    Отвечает 304 Not Modified, если у клиента актуальная версия, иначе строит ответ
+    
+    Версия вычисляется без расшифровки, поэтому при совпадении If-None-Match
+    данные не читаются вовсе.
+    
+    Args:
+        etag: Версия ресурса (None - ответ без версии)
+        build: Функция без аргументов, возвращающая ответ
+        
+    Returns:
+        Ответ с ETag (для 200 и 304)
+    """
+    if etag is None:
+        return build()
+    if request.if_none_match.contains_weak(etag):
+        response = make_response('', 304)
+    else:
+        response = build()
+        if not isinstance(response, Response) or response.status_code != 200:
+            return response
+    response.set_etag(etag)
+    # Кешировать можно, но перед использованием - проверять версию
+    response.headers['Cache-Control'] = 'no-cache'
+    return response
+
+
+def _stream_note_response(note, chunks):
+    """
+    Отдает заметку потоком JSON {"note": {..., "content": "..."}}, не собирая содержимое в памяти
+    
+    Args:
+        note: Поля заметки без содержимого
+        chunks: Итератор кусков содержимого
+        
+    Returns:
+        Потоковый ответ
+    """
+    def generate():
+        head = json.dumps({"note": note}, ensure_ascii=False)
+        # Открываем строку content внутри объекта заметки
+        yield head[:-2] + ', "content": "'
+        for chunk in chunks:
+            # json.dumps экранирует кусок как строку, кавычки по краям отбрасываем
+            yield json.dumps(chunk, ensure_ascii=False)[1:-1]
+        yield '"}}'
+    
+    return Response(generate(), mimetype='application/json')
+
+
+@bp.route('/api/notes/<note_id>', methods=['GET'])
 @require_auth
 def get_note(note_id, file_manager=None, **kwargs):
     try:
+        # Заметка не изменилась - клиент использует свою копию, файл не расшифровывается
+        etag = file_manager.get_note_etag(note_id)
+        if etag is not None and request.if_none_match.contains_weak(etag):
+            file_manager.log_access(note_id, 'open')
+            return _conditional_response(etag, None)
+        
+        if file_manager.is_large_note(note_id):
+            result = file_manager.get_note_stream(note_id)
+            if result:
+                file_manager.log_access(note_id, 'open')
+                return _conditional_response(etag, lambda: _stream_note_response(*result))
+            return jsonify({"error": "Заметка не найдена"}), 404
+        
         note = file_manager.get_note(note_id)
         if note:
             # Логируем открытие заметки
             file_manager.log_access(note_id, 'open')
-            return jsonify({"note": note})
+            return _conditional_response(etag, lambda: jsonify({"note": note}))
         else:
             return jsonify({"error": "Заметка не найдена"}), 404
     except ValueError as e:
@@ -213,7 +458,7 @@ def get_note(note_id, file_manager=None, **kwargs):
         return jsonify({"error": f"Ошибка загрузки заметки: {str(e)}"}), 500
 
 
-@app.route('/api/notes/<note_id>/recover', methods=['POST'])
+@bp.route('/api/notes/<note_id>/recover', methods=['POST'])
 @require_auth
 def recover_note(note_id, file_manager=None, encryption_manager=None, **kwargs):
     """Восстановление доступа к заметке со старым паролем"""
@@ -230,7 +475,7 @@ def recover_note(note_id, file_manager=None, encryption_manager=None, **kwargs):
         # Создаем менеджер шифрования со старым паролем
         from encryption import EncryptionManager
         old_enc_mgr = EncryptionManager(old_password)
-        old_file_mgr = FileManager(encryption_manager=old_enc_mgr)
+        old_file_mgr = FileManager(file_manager.notes_dir, encryption_manager=old_enc_mgr)
         
         # Пытаемся прочитать заметку со старым паролем
         try:
@@ -242,28 +487,23 @@ def recover_note(note_id, file_manager=None, encryption_manager=None, **kwargs):
         
         # Если успешно прочитали, перешифровываем с новым паролем
         # Используем текущий менеджер шифрования (с новым паролем)
-        encrypted_content = encryption_manager.encrypt(note['content'])
-        
-        # Сохраняем перешифрованную заметку
-        from pathlib import Path
-        notes_dir = Path("notes")
-        file_path = notes_dir / f"{note_id}.enc"
-        with open(file_path, 'w', encoding='utf-8') as f:
-            f.write(encrypted_content)
+        file_path = file_manager._get_file_path(note_id)
+        with file_lock(file_path):
+            file_manager._write_encrypted(file_path, note['content'])
         
         # Возвращаем заметку
         return jsonify({
             "note": note,
             "message": "Заметка успешно восстановлена и перешифрована с новым паролем"
         })
-        
+    
     except Exception as e:
         import traceback
         traceback.print_exc()
         return jsonify({"error": f"Ошибка восстановления: {str(e)}"}), 500
 
 
-@app.route('/api/notes', methods=['POST'])
+@bp.route('/api/notes', methods=['POST'])
 @require_auth
 def create_note(file_manager=None, **kwargs):
     try:
@@ -281,7 +521,7 @@ def create_note(file_manager=None, **kwargs):
         return jsonify({"error": str(e)}), 500
 
 
-@app.route('/api/notes/<note_id>', methods=['PUT'])
+@bp.route('/api/notes/<note_id>', methods=['PUT'])
 @require_auth
 def update_note(note_id, file_manager=None, **kwargs):
     try:
@@ -291,7 +531,8 @@ def update_note(note_id, file_manager=None, **kwargs):
         tags = data.get('tags')
         
         if file_manager.update_note(note_id, title=title, content=content, tags=tags):
-            note = file_manager.get_note(note_id)
+            # Содержимое клиент только что отправил сам, повторно его не расшифровываем
+            note = file_manager.get_note_info(note_id)
             return jsonify({"note": note})
         else:
             return jsonify({"error": "Заметка не найдена"}), 404
@@ -301,7 +542,38 @@ def update_note(note_id, file_manager=None, **kwargs):
         return jsonify({"error": str(e)}), 500
 
 
-@app.route('/api/notes/<note_id>', methods=['DELETE'])
+@bp.route('/api/notes/<note_id>', methods=['PATCH'])
+@require_auth
+def patch_note(note_id, file_manager=None, **kwargs):
+    """Частичное обновление заметки относительно версии base_version"""
+    try:
+        data = request.get_json()
+        base_version = data.get('base_version')
+        if not isinstance(base_version, int):
+            return jsonify({"error": "Не указана base_version"}), 400
+        
+        version = file_manager.patch_note(
+            note_id, base_version,
+            ops=data.get('ops'),
+            json_patch=data.get('json_patch'),
+            title=data.get('title'),
+            tags=data.get('tags')
+        )
+        if version is None:
+            return jsonify({"error": "Заметка не найдена"}), 404
+        return jsonify({"version": version})
+    except VersionConflict as e:
+        # Клиент должен отправить содержимое целиком (PUT)
+        return jsonify({"error": str(e), "version": e.version}), 409
+    except PatchError as e:
+        return jsonify({"error": str(e)}), 422
+    except Exception as e:
+        import traceback
+        traceback.print_exc()
+        return jsonify({"error": str(e)}), 500
+
+
+@bp.route('/api/notes/<note_id>', methods=['DELETE'])
 @require_auth
 def delete_note(note_id, file_manager=None, **kwargs):
     try:
@@ -315,118 +587,301 @@ def delete_note(note_id, file_manager=None, **kwargs):
         return jsonify({"error": str(e)}), 500
 
 
-@app.route('/api/search', methods=['GET'])
+@bp.route('/api/attachments', methods=['POST'])
+@require_auth
+def upload_attachment(file_manager=None, **kwargs):
+    """Загрузка вложения (картинки холста), файл шифруется потоком"""
+    try:
+        upload = request.files.get('file')
+        if upload is None:
+            return jsonify({"error": "Файл не передан"}), 400
+        
+        # Отдаем обратно только картинки, остальное - как двоичные данные
+        mime_type = upload.mimetype if upload.mimetype.startswith('image/') else 'application/octet-stream'
+        attachment = file_manager.save_attachment(upload.stream, mime_type)
+        attachment["url"] = url_for('.get_attachment', attachment_id=attachment["id"])
+        return jsonify({"attachment": attachment}), 201
+    except Exception as e:
+        import traceback
+        traceback.print_exc()
+        return jsonify({"error": str(e)}), 500
+
+
+@bp.route('/api/attachments/<attachment_id>', methods=['GET'])
+@require_auth
+def get_attachment(attachment_id, file_manager=None, **kwargs):
+    try:
+        # Содержимое по ID не меняется, поэтому ETag - сам ID
+        if request.if_none_match.contains(attachment_id):
+            response = make_response('', 304)
+        else:
+            result = file_manager.get_attachment(attachment_id)
+            if not result:
+                return jsonify({"error": "Вложение не найдено"}), 404
+            info, chunks = result
+            response = Response(chunks, mimetype=info["mime"])
+            response.headers['X-Content-Type-Options'] = 'nosniff'
+        response.set_etag(attachment_id)
+        response.headers['Cache-Control'] = 'private, max-age=31536000, immutable'
+        return response
+    except Exception as e:
+        import traceback
+        traceback.print_exc()
+        return jsonify({"error": str(e)}), 500
+
+
+@bp.route('/api/search', methods=['GET'])
 @require_auth
 def search_notes(file_manager=None, **kwargs):
     try:
         query = request.args.get('q', '')
         if not query:
-            return jsonify({"notes": []})
+            return jsonify({"notes": [], "total": 0})
+        
+        limit = min(max(request.args.get('limit', SEARCH_PAGE_SIZE, type=int), 1), MAX_SEARCH_PAGE_SIZE)
+        offset = max(request.args.get('offset', 0, type=int), 0)
         
-        results = file_manager.search_notes(query)
-        return jsonify({"notes": results})
+        # Лучшие совпадения первыми (BM25 по заголовку, тегам и содержимому)
+        total, results = file_manager.rank_notes(query, limit=limit, offset=offset)
+        return jsonify({"notes": results, "total": total, "limit": limit, "offset": offset})
     except Exception as e:
         import traceback
         traceback.print_exc()
         return jsonify({"error": str(e)}), 500
 
 
-@app.route('/api/search-full', methods=['GET'])
+@bp.route('/api/search-full', methods=['GET'])
 @require_auth
 def search_notes_full(file_manager=None, **kwargs):
-    """Расширенный поиск с позициями совпадений для подсветки"""
+    """
+    Расширенный поиск с позициями совпадений для подсветки
+    
+    С ?stream=1 результаты отдаются потоком NDJSON по мере нахождения:
+    строки {"result": {...}} и последняя {"done": {"count", "cancelled"}}.
+    ?token= задает токен отмены: новый потоковый поиск сессии отменяет
+    предыдущий, отменить явно можно через POST /api/search-full/cancel.
+    ?max_matches= ограничивает совпадения в содержимом одной заметки
+    (всего их - match_count, остальные - GET /api/notes/<id>/matches).
+    """
     try:
         query = request.args.get('q', '')
+        limit = request.args.get('limit', None, type=int)
+        max_matches = request.args.get('max_matches', MAX_MATCHES_PER_NOTE, type=int)
+        max_matches = min(max(max_matches, 0), MAX_MATCH_WINDOW)
+        stream = request.args.get('stream') == '1'
         if not query:
+            if stream:
+                return Response(json.dumps({"done": {"count": 0, "cancelled": False}}) + "\n",
+                                mimetype='application/x-ndjson')
             return jsonify({"results": []})
         
-        query_lower = query.lower()
-        results = []
+        if not stream:
+            results = file_manager.search_notes_full(query, limit=limit, max_matches=max_matches)
+            return jsonify({"results": results})
         
-        # Получаем все заметки
-        all_notes = file_manager.list_notes()
+        context = get_session_context()
+        token = request.args.get('token', '')
+        cancel_event = context.start_search(token)
+        results = file_manager.iter_search_full(query, limit=limit, cancel_event=cancel_event,
+                                                max_matches=max_matches)
         
-        for note_meta in all_notes:
-            note = file_manager.get_note(note_meta["id"])
-            if not note:
-                continue
-            
-            matches = []
-            
-            # Ищем в заголовке
-            title_lower = note["title"].lower()
-            if query_lower in title_lower:
-                start = title_lower.find(query_lower)
-                matches.append({
-                    "field": "title",
-                    "start": start,
-                    "end": start + len(query_lower),
-                    "text": note["title"]
-                })
-            
-            # Ищем в содержимом
-            content_lower = note["content"].lower()
-            if query_lower in content_lower:
-                start = 0
-                while True:
-                    pos = content_lower.find(query_lower, start)
-                    if pos == -1:
-                        break
-                    # Получаем контекст (50 символов до и после)
-                    context_start = max(0, pos - 50)
-                    context_end = min(len(note["content"]), pos + len(query_lower) + 50)
-                    context = note["content"][context_start:context_end]
-                    matches.append({
-                        "field": "content",
-                        "start": pos,
-                        "end": pos + len(query_lower),
-                        "context": context,
-                        "context_start": context_start
-                    })
-                    start = pos + 1
-            
-            if matches:
-                results.append({
-                    "id": note["id"],
-                    "title": note["title"],
-                    "tags": note.get("tags", []),
-                    "matches": matches
-                })
+        def generate():
+            count = 0
+            try:
+                for result in results:
+                    count += 1
+                    yield json.dumps({"result": result}, ensure_ascii=False) + "\n"
+                done = {"count": count, "cancelled": cancel_event.is_set()}
+                yield json.dumps({"done": done}) + "\n"
+            finally:
+                # Клиент закрыл соединение или поиск завершен
+                results.close()
+                context.finish_search(token, cancel_event)
+        
+        response = Response(generate(), mimetype='application/x-ndjson')
+        # Прокси не должны буферизовать ответ, иначе результаты придут разом
+        response.headers['X-Accel-Buffering'] = 'no'
+        response.headers['Cache-Control'] = 'no-store'
+        return response
+    except Exception as e:
+        import traceback
+        traceback.print_exc()
+        return jsonify({"error": str(e)}), 500
+
+
+@bp.route('/api/notes/<note_id>/matches', methods=['GET'])
+@require_auth
+def get_note_matches(note_id, file_manager=None, **kwargs):
+    """Следующее окно совпадений поиска в одной заметке (?q=&offset=&limit=)"""
+    try:
+        query = request.args.get('q', '')
+        if not query:
+            return jsonify({"error": "Пустой запрос"}), 400
         
-        return jsonify({"results": results})
+        offset = max(request.args.get('offset', 0, type=int), 0)
+        limit = request.args.get('limit', MAX_MATCHES_PER_NOTE, type=int)
+        limit = min(max(limit, 1), MAX_MATCH_WINDOW)
+        
+        result = file_manager.get_note_matches(note_id, query, offset=offset, limit=limit)
+        if result is None:
+            return jsonify({"error": "Заметка не найдена"}), 404
+        return jsonify(result)
     except Exception as e:
         import traceback
         traceback.print_exc()
         return jsonify({"error": str(e)}), 500
 
 
-@app.route('/api/home', methods=['GET'])
+@bp.route('/api/search-full/cancel', methods=['POST'])
+@require_auth
+def cancel_search_full(**kwargs):
+    """Отменяет потоковый поиск по токену"""
+    data = request.get_json(silent=True) or {}
+    cancelled = get_session_context().cancel_search(str(data.get('token', '')))
+    return jsonify({"success": True, "cancelled": cancelled})
+
+
+@bp.route('/api/home', methods=['GET'])
 @require_auth
 def get_home_data(file_manager=None, **kwargs):
     """Получает данные для главной страницы (граф заметок)"""
     try:
-        graph_data = file_manager.get_graph_data()
-        return jsonify(graph_data)
+        # Граф не изменился - клиент использует свою копию
+        return _conditional_response(file_manager.get_graph_etag(), lambda: jsonify(file_manager.get_graph_data()))
+    except Exception as e:
+        import traceback
+        traceback.print_exc()
+        return jsonify({"error": str(e)}), 500
+
+
+@bp.route('/api/bootstrap', methods=['GET'])
+def get_bootstrap():
+    """
+    Данные главной страницы одним запросом: состояние входа, граф, последние
+    заметки, история заходов и статистика
+    
+    ?sections=graph,recent,history,stats выбирает разделы (по умолчанию все),
+    ?recent_limit и ?history_limit задают размеры списков. Раздел auth есть
+    всегда; без входа отдается только он.
+    """
+    auth = {
+        "initialized": _get_auth_manager().is_initialized(),
+        "authenticated": bool(session.get('authenticated', False))
+    }
+    if not (auth["initialized"] and auth["authenticated"]):
+        return jsonify({"auth": auth})
+    return _get_bootstrap_sections(auth)
+
+
+@require_auth
+def _get_bootstrap_sections(auth, file_manager=None, **kwargs):
+    """Собирает разделы /api/bootstrap для вошедшего пользователя"""
+    try:
+        sections = request.args.get('sections')
+        if sections:
+            sections = [section.strip() for section in sections.split(',') if section.strip()]
+            unknown = [section for section in sections if section not in BOOTSTRAP_SECTIONS]
+            if unknown:
+                return jsonify({"error": f"Неизвестные разделы: {', '.join(unknown)}"}), 400
+        else:
+            sections = list(BOOTSTRAP_SECTIONS)
+        recent_limit = min(max(request.args.get('recent_limit', 5, type=int), 1), MAX_NOTES_PAGE_SIZE)
+        history_limit = min(max(request.args.get('history_limit', 10, type=int), 1), MAX_NOTES_PAGE_SIZE)
+        
+        # Версия данных и параметры запроса: данные не изменились - клиент использует свою копию
+        sections = sorted(set(sections))
+        etag = f"{file_manager.get_home_etag()}-{'.'.join(sections)}-{recent_limit}-{history_limit}"
+        
+        def build():
+            data = file_manager.get_home_data(sections, recent_limit=recent_limit, history_limit=history_limit)
+            data["auth"] = auth
+            return jsonify(data)
+        
+        return _conditional_response(etag, build)
     except Exception as e:
         import traceback
         traceback.print_exc()
         return jsonify({"error": str(e)}), 500
 
 
-@app.route('/api/notes/<note_id>/links', methods=['GET'])
+@bp.route('/api/changes', methods=['GET'])
+@require_auth
+def get_changes(file_manager=None, **kwargs):
+    """
+    Лента изменений заметок, календаря, TODO и словаря
+    
+    По умолчанию - поток Server-Sent Events: у каждого события id равен его
+    номеру, поэтому EventSource при переподключении продолжает с
+    Last-Event-ID. ?since=N - начать после события N (без курсора - с
+    текущего момента). ?mode=poll - long-poll: ответ {events, cursor, reset}
+    после первого события или ?timeout секунд.
+    
+    Событие reset означает, что пропущенные события уже удалены из журнала:
+    клиенту нужно загрузить данные заново.
+    """
+    try:
+        since = request.args.get('since', request.headers.get('Last-Event-ID'))
+        try:
+            cursor = int(since) if since not in (None, '') else file_manager.get_changes_cursor()
+        except ValueError:
+            return jsonify({"error": "Неверный курсор"}), 400
+        
+        if request.args.get('mode') == 'poll':
+            timeout = min(max(request.args.get('timeout', CHANGES_POLL_TIMEOUT, type=float), 0), MAX_CHANGES_POLL_TIMEOUT)
+            events, reset = file_manager.wait_changes(cursor, timeout)
+            if reset:
+                cursor = file_manager.get_changes_cursor()
+            elif events:
+                cursor = events[-1]["seq"]
+            return jsonify({"events": events, "cursor": cursor, "reset": reset})
+        
+        def generate(cursor):
+            # Курсор сразу: клиент без since узнает, с какого события продолжать
+            yield f"retry: 3000\nid: {cursor}\nevent: ready\ndata: {json.dumps({'cursor': cursor})}\n\n"
+            deadline = time.monotonic() + CHANGES_STREAM_SECONDS
+            while time.monotonic() < deadline:
+                try:
+                    events, reset = file_manager.wait_changes(cursor, CHANGES_HEARTBEAT_SECONDS)
+                except Exception as e:
+                    # Например, сессия завершилась и ключ выгружен - клиент переподключится
+                    print(f"Ошибка ленты изменений: {e}")
+                    return
+                if reset:
+                    cursor = file_manager.get_changes_cursor()
+                    yield f"id: {cursor}\nevent: reset\ndata: {json.dumps({'cursor': cursor})}\n\n"
+                elif events:
+                    for event in events:
+                        cursor = event["seq"]
+                        yield f"id: {cursor}\nevent: change\ndata: {json.dumps(event, ensure_ascii=False)}\n\n"
+                else:
+                    # Комментарий не дает прокси закрыть простаивающее соединение
+                    yield ": ping\n\n"
+        
+        response = Response(generate(cursor), mimetype='text/event-stream')
+        response.headers['Cache-Control'] = 'no-cache'
+        response.headers['X-Accel-Buffering'] = 'no'
+        return response
+    except Exception as e:
+        import traceback
+        traceback.print_exc()
+        return jsonify({"error": str(e)}), 500
+
+
+@bp.route('/api/notes/<note_id>/links', methods=['GET'])
 @require_auth
 def get_note_links(note_id, file_manager=None, **kwargs):
     """Получает связи заметки"""
     try:
         links = file_manager.get_note_links(note_id)
-        return jsonify({"links": links})
+        backlinks = file_manager.get_note_backlinks(note_id)
+        return jsonify({"links": links, "backlinks": backlinks})
     except Exception as e:
         import traceback
         traceback.print_exc()
         return jsonify({"error": str(e)}), 500
 
 
-@app.route('/api/notes/<note_id>/links', methods=['PUT'])
+@bp.route('/api/notes/<note_id>/links', methods=['PUT'])
 @require_auth
 def update_note_links(note_id, file_manager=None, **kwargs):
     """Обновляет связи заметки"""
@@ -447,19 +902,21 @@ def update_note_links(note_id, file_manager=None, **kwargs):
         return jsonify({"error": str(e)}), 500
 
 
-@app.route('/api/dictionary', methods=['GET'])
+@bp.route('/api/dictionary', methods=['GET'])
 @require_auth
 def get_dictionary(file_manager=None, **kwargs):
     try:
-        phrases = file_manager.list_phrases()
-        return jsonify({"phrases": phrases})
+        return _conditional_response(
+            file_manager.get_file_etag(file_manager.get_dictionary_file()),
+            lambda: jsonify({"phrases": file_manager.list_phrases()})
+        )
     except Exception as e:
         import traceback
         traceback.print_exc()
         return jsonify({"error": str(e)}), 500
 
 
-@app.route('/api/dictionary/<phrase>', methods=['GET'])
+@bp.route('/api/dictionary/<phrase>', methods=['GET'])
 @require_auth
 def get_phrase(phrase, file_manager=None, **kwargs):
     try:
@@ -476,7 +933,7 @@ def get_phrase(phrase, file_manager=None, **kwargs):
         return jsonify({"error": str(e)}), 500
 
 
-@app.route('/api/dictionary', methods=['POST'])
+@bp.route('/api/dictionary', methods=['POST'])
 @require_auth
 def add_phrase(file_manager=None, **kwargs):
     try:
@@ -497,7 +954,7 @@ def add_phrase(file_manager=None, **kwargs):
         return jsonify({"error": str(e)}), 500
 
 
-@app.route('/api/dictionary/<phrase>', methods=['DELETE'])
+@bp.route('/api/dictionary/<phrase>', methods=['DELETE'])
 @require_auth
 def delete_phrase(phrase, file_manager=None, **kwargs):
     try:
@@ -515,19 +972,21 @@ def delete_phrase(phrase, file_manager=None, **kwargs):
 
 # ========== API ДЛЯ РАБОТЫ С TODO ==========
 
-@app.route('/api/todos/global', methods=['GET'])
+@bp.route('/api/todos/global', methods=['GET'])
 @require_auth
 def get_global_todos(file_manager=None, **kwargs):
     try:
-        todos = file_manager.get_global_todos()
-        return jsonify({"todos": todos})
+        return _conditional_response(
+            file_manager.get_file_etag(file_manager.get_global_todos_file()),
+            lambda: jsonify({"todos": file_manager.get_global_todos()})
+        )
     except Exception as e:
         import traceback
         traceback.print_exc()
         return jsonify({"error": str(e)}), 500
 
 
-@app.route('/api/todos/global', methods=['POST'])
+@bp.route('/api/todos/global', methods=['POST'])
 @require_auth
 def save_global_todos(file_manager=None, **kwargs):
     try:
@@ -544,26 +1003,29 @@ def save_global_todos(file_manager=None, **kwargs):
         return jsonify({"error": str(e)}), 500
 
 
-@app.route('/api/todos/global/<todo_id>', methods=['PUT'])
+@bp.route('/api/todos/global/<todo_id>', methods=['PUT'])
 @require_auth
 def update_global_todo(todo_id, file_manager=None, **kwargs):
     try:
         data = request.get_json()
-        todos = file_manager.get_global_todos()
-        
-        # Находим задачу и обновляем
-        updated = False
-        for todo in todos:
-            if todo.get('id') == todo_id:
-                todo.update(data)
-                todo['modified'] = file_manager._get_timestamp()
-                updated = True
-                break
-        
-        if not updated:
-            return jsonify({"error": "Задача не найдена"}), 404
+        with file_manager.global_todos_lock():
+            todos = file_manager.get_global_todos()
+            
+            # Находим задачу и обновляем
+            updated = False
+            for todo in todos:
+                if todo.get('id') == todo_id:
+                    todo.update(data)
+                    todo['modified'] = file_manager._get_timestamp()
+                    updated = True
+                    break
+            
+            if not updated:
+                return jsonify({"error": "Задача не найдена"}), 404
+            
+            saved = file_manager.save_global_todos(todos)
         
-        if file_manager.save_global_todos(todos):
+        if saved:
             return jsonify({"success": True, "todo": next(t for t in todos if t.get('id') == todo_id)})
         else:
             return jsonify({"error": "Ошибка сохранения"}), 500
@@ -573,18 +1035,21 @@ def update_global_todo(todo_id, file_manager=None, **kwargs):
         return jsonify({"error": str(e)}), 500
 
 
-@app.route('/api/todos/global/<todo_id>', methods=['DELETE'])
+@bp.route('/api/todos/global/<todo_id>', methods=['DELETE'])
 @require_auth
 def delete_global_todo(todo_id, file_manager=None, **kwargs):
     try:
-        todos = file_manager.get_global_todos()
-        original_count = len(todos)
-        todos = [t for t in todos if t.get('id') != todo_id]
-        
-        if len(todos) == original_count:
-            return jsonify({"error": "Задача не найдена"}), 404
+        with file_manager.global_todos_lock():
+            todos = file_manager.get_global_todos()
+            original_count = len(todos)
+            todos = [t for t in todos if t.get('id') != todo_id]
+            
+            if len(todos) == original_count:
+                return jsonify({"error": "Задача не найдена"}), 404
+            
+            saved = file_manager.save_global_todos(todos)
         
-        if file_manager.save_global_todos(todos):
+        if saved:
             return jsonify({"success": True})
         else:
             return jsonify({"error": "Ошибка сохранения"}), 500
@@ -594,7 +1059,7 @@ def delete_global_todo(todo_id, file_manager=None, **kwargs):
         return jsonify({"error": str(e)}), 500
 
 
-@app.route('/api/todos/note/<note_id>', methods=['GET'])
+@bp.route('/api/todos/note/<note_id>', methods=['GET'])
 @require_auth
 def get_note_todos(note_id, file_manager=None, **kwargs):
     try:
@@ -606,7 +1071,7 @@ def get_note_todos(note_id, file_manager=None, **kwargs):
         return jsonify({"error": str(e)}), 500
 
 
-@app.route('/api/todos/note/<note_id>', methods=['POST'])
+@bp.route('/api/todos/note/<note_id>', methods=['POST'])
 @require_auth
 def save_note_todos(note_id, file_manager=None, **kwargs):
     try:
@@ -623,7 +1088,7 @@ def save_note_todos(note_id, file_manager=None, **kwargs):
         return jsonify({"error": str(e)}), 500
 
 
-@app.route('/api/todos/note/<note_id>/<todo_id>', methods=['PUT'])
+@bp.route('/api/todos/note/<note_id>/<todo_id>', methods=['PUT'])
 @require_auth
 def update_note_todo(note_id, todo_id, file_manager=None, **kwargs):
     try:
@@ -652,7 +1117,7 @@ def update_note_todo(note_id, todo_id, file_manager=None, **kwargs):
         return jsonify({"error": str(e)}), 500
 
 
-@app.route('/api/todos/note/<note_id>/<todo_id>', methods=['DELETE'])
+@bp.route('/api/todos/note/<note_id>/<todo_id>', methods=['DELETE'])
 @require_auth
 def delete_note_todo(note_id, todo_id, file_manager=None, **kwargs):
     try:
@@ -675,20 +1140,22 @@ def delete_note_todo(note_id, todo_id, file_manager=None, **kwargs):
 
 # ========== API ДЛЯ КАЛЕНДАРЯ ==========
 
-@app.route('/api/calendar', methods=['GET'])
+@bp.route('/api/calendar', methods=['GET'])
 @require_auth
 def get_calendar(file_manager=None, **kwargs):
     """Получает события календаря"""
     try:
-        events = file_manager.get_calendar_events()
-        return jsonify({"events": events})
+        return _conditional_response(
+            file_manager.get_file_etag(file_manager.get_calendar_file()),
+            lambda: jsonify({"events": file_manager.get_calendar_events()})
+        )
     except Exception as e:
         import traceback
         traceback.print_exc()
         return jsonify({"error": str(e)}), 500
 
 
-@app.route('/api/calendar/events', methods=['POST'])
+@bp.route('/api/calendar/events', methods=['POST'])
 @require_auth
 def add_calendar_event(file_manager=None, **kwargs):
     """Добавляет событие в календарь"""
@@ -714,7 +1181,7 @@ def add_calendar_event(file_manager=None, **kwargs):
         return jsonify({"error": str(e)}), 500
 
 
-@app.route('/api/calendar/events/<event_id>', methods=['PUT'])
+@bp.route('/api/calendar/events/<event_id>', methods=['PUT'])
 @require_auth
 def update_calendar_event(event_id, file_manager=None, **kwargs):
     """Обновляет событие в календаре"""
@@ -736,7 +1203,7 @@ def update_calendar_event(event_id, file_manager=None, **kwargs):
         return jsonify({"error": str(e)}), 500
 
 
-@app.route('/api/calendar/events/<event_id>', methods=['DELETE'])
+@bp.route('/api/calendar/events/<event_id>', methods=['DELETE'])
 @require_auth
 def delete_calendar_event(event_id, file_manager=None, **kwargs):
     """Удаляет событие из календаря"""
@@ -757,7 +1224,7 @@ def delete_calendar_event(event_id, file_manager=None, **kwargs):
         return jsonify({"error": str(e)}), 500
 
 
-@app.route('/api/calendar/mark-important', methods=['POST'])
+@bp.route('/api/calendar/mark-important', methods=['POST'])
 @require_auth
 def mark_day_important(file_manager=None, **kwargs):
     """Отмечает день как важный"""
@@ -781,32 +1248,13 @@ def mark_day_important(file_manager=None, **kwargs):
 
 # ========== API ДЛЯ ИСТОРИИ ЗАХОДОВ ==========
 
-@app.route('/api/access-history', methods=['GET'])
+@bp.route('/api/access-history', methods=['GET'])
 @require_auth
 def get_access_history(file_manager=None, **kwargs):
     """Получает историю заходов"""
     try:
         limit = request.args.get('limit', 20, type=int)
-        history = file_manager.get_access_history(limit)
-        
-        # Обогащаем историю названиями заметок
-        enriched_history = []
-        for entry in history:
-            note_id = entry.get('note_id')
-            note_meta = None
-            if note_id:
-                all_notes = file_manager.list_notes()
-                note_meta = next((n for n in all_notes if n['id'] == note_id), None)
-            
-            enriched_entry = {
-                'date': entry.get('date'),
-                'action': entry.get('action'),
-                'note_id': note_id,
-                'note_title': note_meta['title'] if note_meta else 'Удаленная заметка'
-            }
-            enriched_history.append(enriched_entry)
-        
-        return jsonify({"history": enriched_history})
+        return jsonify({"history": file_manager.get_access_history_titled(limit)})
     except Exception as e:
         import traceback
         traceback.print_exc()
@@ -815,7 +1263,7 @@ def get_access_history(file_manager=None, **kwargs):
 
 # ========== API ДЛЯ СВЯЗИ ЗАМЕТОК И КАЛЕНДАРЯ ==========
 
-@app.route('/api/notes/<note_id>/link-date', methods=['POST'])
+@bp.route('/api/notes/<note_id>/link-date', methods=['POST'])
 @require_auth
 def link_note_to_date(note_id, file_manager=None, **kwargs):
     """Привязывает заметку к дате календаря"""
@@ -836,7 +1284,7 @@ def link_note_to_date(note_id, file_manager=None, **kwargs):
         return jsonify({"error": str(e)}), 500
 
 
-@app.route('/api/notes/<note_id>/unlink-date', methods=['POST'])
+@bp.route('/api/notes/<note_id>/unlink-date', methods=['POST'])
 @require_auth
 def unlink_note_from_date(note_id, file_manager=None, **kwargs):
     """Отвязывает заметку от даты календаря"""
@@ -851,7 +1299,7 @@ def unlink_note_from_date(note_id, file_manager=None, **kwargs):
         return jsonify({"error": str(e)}), 500
 
 
-@app.route('/api/notes/<note_id>/linked-date', methods=['GET'])
+@bp.route('/api/notes/<note_id>/linked-date', methods=['GET'])
 @require_auth
 def get_note_linked_date(note_id, file_manager=None, **kwargs):
     """Получает дату привязанную к заметке"""
@@ -864,7 +1312,7 @@ def get_note_linked_date(note_id, file_manager=None, **kwargs):
         return jsonify({"error": str(e)}), 500
 
 
-@app.route('/api/calendar/notes/<date>', methods=['GET'])
+@bp.route('/api/calendar/notes/<date>', methods=['GET'])
 @require_auth
 def get_notes_for_date(date, file_manager=None, **kwargs):
     """Получает заметки привязанные к дате"""
@@ -877,19 +1325,78 @@ def get_notes_for_date(date, file_manager=None, **kwargs):
         return jsonify({"error": str(e)}), 500
 
 
-@app.route('/api/calendar/all-note-links', methods=['GET'])
+@bp.route('/api/calendar/all-note-links', methods=['GET'])
 @require_auth
 def get_all_date_note_links(file_manager=None, **kwargs):
     """Получает все связи дат и заметок"""
     try:
-        links = file_manager.get_all_date_note_links()
-        return jsonify({"links": links})
+        # Связи строятся по файлу календаря - версия та же, что у /api/calendar
+        return _conditional_response(
+            file_manager.get_file_etag(file_manager.get_calendar_file()),
+            lambda: jsonify({"links": file_manager.get_all_date_note_links()})
+        )
     except Exception as e:
         import traceback
         traceback.print_exc()
         return jsonify({"error": str(e)}), 500
 
 
+def create_app(config: Optional[Dict] = None) -> Flask:
+    """
+    Создает приложение
+    
+    Правило для кешей: в памяти процесса (у каждого воркера свой) лежит только
+    то, что можно восстановить с диска или из сессии и что проверяется по диску
+    перед использованием; все, что должны видеть другие воркеры, записывается
+    на диск под блокировкой файла.
+    
+    Кеши процесса: контексты сессий с ключами шифрования, кеш metadata.json,
+    индексы связей и поисковый индекс в памяти, расшифрованные основы для PATCH,
+    номер пароля из конфигурации аутентификации. Ключи никогда не покидают память процесса.
+    Общие для воркеров данные лежат только на диске: *.enc, metadata.json
+    (запись со слиянием под блокировкой файла), сегменты search_index/, журнал заходов,
+    журнал изменений (номера событий /api/changes), вложения, конфигурация
+    аутентификации (номер пароля отзывает сессии во всех воркерах).
+    Поэтому воркеры могут обслуживать запросы одной сессии по очереди.
+    
+    Сессии (SESSION_BACKEND): по умолчанию 'filesystem' - файлы flask-session в
+    общей директории, выход удаляет сессию на сервере. 'cookie' - сессия целиком
+    в зашифрованной cookie без обращений к диску; выход удаляет только cookie
+    клиента, а отзывают сессию истечение срока и смена пароля.
+    
+    Args:
+        config: Настройки, дополняющие DEFAULT_CONFIG (любые ключи Flask)
+        
+    Returns:
+        Приложение Flask
+    """
+    app = Flask(__name__)
+    app.config.update(DEFAULT_CONFIG)
+    if config:
+        app.config.update(config)
+    if not app.config.get('SECRET_KEY'):
+        app.config['SECRET_KEY'] = _load_secret_key(app.config.get('SECRET_KEY_FILE', SECRET_KEY_FILE))
+    
+    backend = app.config['SESSION_BACKEND']
+    if backend == 'cookie':
+        app.session_interface = EncryptedCookieSessionInterface()
+    elif backend == 'filesystem':
+        app.config['SESSION_TYPE'] = 'filesystem'
+        Session(app)
+    else:
+        raise ValueError(f"Неизвестное хранилище сессий: {backend}")
+    
+    if app.config.get('CRYPTO_WORKERS'):
+        configure_crypto_executor(app.config['CRYPTO_WORKERS'])
+    
+    app.extensions['zametik'] = {
+        'auth_manager': AuthManager(app.config['AUTH_CONFIG_FILE']),
+        'session_registry': SessionRegistry(app.config['NOTES_DIR']),
+    }
+    app.register_blueprint(bp)
+    return app
+
+
 if __name__ == '__main__':
-    app.run(debug=True, host='0.0.0.0', port=5000)
+    create_app().run(debug=True, host='0.0.0.0', port=5000)
 
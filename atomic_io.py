@@ -0,0 +1,189 @@
+"""
+Атомарная запись файлов и блокировки файлов между потоками и процессами
+"""
+import os
+import threading
+from contextlib import contextmanager
+from pathlib import Path
+from typing import BinaryIO, Callable, Dict, Optional
+
+try:
+    import fcntl
+except ImportError:
+    # Windows: блокировки работают только внутри процесса
+    fcntl = None
+
+
+# Файлы блокировок лежат в отдельной поддиректории рядом с защищаемыми файлами
+LOCKS_DIR = ".locks"
+
+
+class _FileLock:
+    """Блокировка файла: RLock для потоков процесса и flock на файле .lock для других процессов"""
+    
+    def __init__(self, lock_path: Path):
+        self.lock_path = lock_path
+        self._rlock = threading.RLock()
+        self._depth = 0
+        self._fd: Optional[int] = None
+    
+    def acquire(self, blocking: bool = True) -> bool:
+        if not self._rlock.acquire(blocking):
+            return False
+        try:
+            # flock берем один раз на внешнем уровне: повторный flock из того же процесса заблокировался бы
+            if self._depth == 0 and fcntl is not None:
+                self.lock_path.parent.mkdir(exist_ok=True)
+                self._fd = os.open(self.lock_path, os.O_RDWR | os.O_CREAT, 0o600)
+                try:
+                    fcntl.flock(self._fd, fcntl.LOCK_EX if blocking else fcntl.LOCK_EX | fcntl.LOCK_NB)
+                except BlockingIOError:
+                    os.close(self._fd)
+                    self._fd = None
+                    self._rlock.release()
+                    return False
+        except Exception:
+            if self._fd is not None:
+                os.close(self._fd)
+                self._fd = None
+            self._rlock.release()
+            raise
+        self._depth += 1
+        return True
+    
+    def release(self):
+        self._depth -= 1
+        if self._depth == 0 and self._fd is not None:
+            fcntl.flock(self._fd, fcntl.LOCK_UN)
+            os.close(self._fd)
+            self._fd = None
+        self._rlock.release()
+
+
+# Блокировки процесса {путь: _FileLock}
+_locks: Dict[str, _FileLock] = {}
+_locks_lock = threading.Lock()
+
+
+def _lock_path(key: str) -> Path:
+    """Получает путь к файлу блокировки: <директория>/.locks/<имя>.lock"""
+    directory, name = os.path.split(key)
+    return Path(directory) / LOCKS_DIR / f"{name}.lock"
+
+
+@contextmanager
+def file_lock(path: Path, blocking: bool = True):
+    """
+    Блокирует файл на время чтения-изменения-записи
+    
+    Блокировка повторно входимая внутри потока и видна другим процессам
+    (воркерам сервера) через flock на файле .locks/<имя>.lock в той же директории.
+    
+    Args:
+        path: Путь к защищаемому файлу
+        blocking: Ждать блокировку (False - не ждать, если ее держит другой поток или процесс)
+        
+    Returns:
+        Контекст, который отдает True, если блокировка получена
+    """
+    key = os.path.abspath(path)
+    with _locks_lock:
+        lock = _locks.get(key)
+        if lock is None:
+            lock = _FileLock(_lock_path(key))
+            _locks[key] = lock
+    
+    if not lock.acquire(blocking):
+        yield False
+        return
+    try:
+        yield True
+    finally:
+        lock.release()
+
+
+def sweep_lock_files(directory: Path) -> int:
+    """
+    Удаляет файлы блокировок файлов, которых больше нет
+    
+    Только при остановленном сервере: файл блокировки, удаленный, пока его
+    держит или ждет другой процесс, дал бы двух владельцев одной блокировки
+    (ожидающий получит flock на удаленном inode, новый - на новом файле).
+    
+    Args:
+        directory: Директория защищаемых файлов
+        
+    Returns:
+        Количество удаленных файлов блокировок
+    """
+    directory = Path(directory)
+    # Файлы блокировок прежнего размещения лежат рядом с файлами
+    lock_files = [(lock_path, directory / lock_path.name[:-len(".lock")])
+                  for lock_path in (directory / LOCKS_DIR).glob("*.lock")]
+    lock_files += [(lock_path, lock_path.with_suffix(""))
+                   for lock_path in directory.glob("*.lock")]
+    
+    removed = 0
+    for lock_path, protected_path in lock_files:
+        if protected_path.exists():
+            continue
+        try:
+            lock_path.unlink()
+            removed += 1
+        except OSError as e:
+            print(f"Ошибка удаления файла блокировки {lock_path.name}: {e}")
+    return removed
+
+
+def _fsync_dir(path: Path):
+    """Сохраняет на диск запись каталога после переименования (где это поддерживается)"""
+    if os.name != 'posix':
+        return
+    try:
+        fd = os.open(path, os.O_RDONLY)
+    except OSError:
+        return
+    try:
+        os.fsync(fd)
+    except OSError:
+        pass
+    finally:
+        os.close(fd)
+
+
+def atomic_write(path: Path, write: Callable[[BinaryIO], None]):
+    """
+    Атомарно заменяет файл: запись во временный файл, fsync и переименование
+    
+    При сбое на диске остается либо старое, либо новое содержимое целиком.
+    
+    Args:
+        path: Путь к файлу
+        write: Функция, записывающая содержимое в открытый файл (режим 'wb')
+    """
+    path = Path(path)
+    tmp_file = path.with_name(f"{path.name}.{os.getpid()}.{threading.get_ident()}.tmp")
+    try:
+        with open(tmp_file, 'wb') as f:
+            write(f)
+            f.flush()
+            os.fsync(f.fileno())
+        os.replace(tmp_file, path)
+    except BaseException:
+        try:
+            tmp_file.unlink()
+        except OSError:
+            pass
+        raise
+    _fsync_dir(path.parent)
+
+
+def atomic_write_bytes(path: Path, data: bytes):
+    """
+    Атомарно записывает байты в файл
+    
+    Args:
+        path: Путь к файлу
+        data: Содержимое
+    """
+    atomic_write(path, lambda f: f.write(data))
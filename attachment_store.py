@@ -0,0 +1,171 @@
+"""
+Хранилище вложений (картинок холстов) с адресацией по HMAC содержимого
+"""
+import os
+import re
+import time
+import hmac
+import hashlib
+from pathlib import Path
+from typing import BinaryIO, Iterable, Iterator, List, Tuple
+from encryption import EncryptionManager
+
+
+# ID вложения - HMAC-SHA256 открытого содержимого в hex (у старых вложений - SHA-256)
+ATTACHMENT_ID_RE = re.compile(r'^[0-9a-f]{64}$')
+# Ссылки на вложения в содержимом заметок: {"attachment": "<id>"} в JSON холста или URL вложения
+ATTACHMENT_REF_RE = re.compile(r'(?:"attachment"\s*:\s*"|/api/attachments/)([0-9a-f]{64})')
+
+# Метка HKDF ключа HMAC для ID вложений
+ATTACHMENT_ID_INFO = b"zametik-attachment-id"
+
+# Сколько секунд хранить вложение без ссылок (его могли загрузить, но заметка еще не сохранена)
+GC_GRACE_PERIOD = 60 * 60
+
+
+def extract_attachment_refs(content: str) -> List[str]:
+    """
+    Находит ссылки на вложения в содержимом заметки
+    
+    Args:
+        content: Содержимое заметки
+        
+    Returns:
+        Отсортированный список ID вложений без повторов
+    """
+    return sorted(set(ATTACHMENT_REF_RE.findall(content or "")))
+
+
+class _HashingReader:
+    """Обертка файлового объекта, считающая HMAC-SHA256 и размер прочитанных данных"""
+    
+    def __init__(self, src: BinaryIO, key: bytes):
+        self.src = src
+        self.mac = hmac.new(key, digestmod=hashlib.sha256)
+        self.size = 0
+    
+    def read(self, size: int = -1) -> bytes:
+        data = self.src.read(size)
+        self.mac.update(data)
+        self.size += len(data)
+        return data
+
+
+class AttachmentStore:
+    """
+    Зашифрованные вложения в отдельных файлах <hmac>.enc
+    
+    Одинаковые картинки в разных заметках хранятся один раз. ID - HMAC
+    содержимого под ключом из мастер-ключа, а не его хеш: по именам файлов
+    и ссылкам в метаданных нельзя проверить, есть ли в хранилище известная
+    картинка. После смены пароля ключ меняется, и новые загрузки уже
+    существующих картинок сохраняются отдельными файлами. Файлы
+    шифруются потоковым форматом, поэтому загрузка и выдача идут
+    сегментами без чтения вложения в память целиком.
+    """
+    
+    def __init__(self, attachments_dir: Path, encryption_manager: EncryptionManager):
+        """
+        Инициализация хранилища
+        
+        Args:
+            attachments_dir: Директория вложений
+            encryption_manager: Менеджер шифрования
+        """
+        self.attachments_dir = Path(attachments_dir)
+        self.attachments_dir.mkdir(parents=True, exist_ok=True)
+        self.encryption_manager = encryption_manager
+    
+    @staticmethod
+    def is_valid_id(attachment_id: str) -> bool:
+        """Проверяет формат ID вложения (защищает от обхода путей)"""
+        return bool(attachment_id) and bool(ATTACHMENT_ID_RE.match(attachment_id))
+    
+    def _get_path(self, attachment_id: str) -> Path:
+        """Получает путь к файлу вложения"""
+        if not self.is_valid_id(attachment_id):
+            raise ValueError(f"Неверный ID вложения: {attachment_id}")
+        return self.attachments_dir / f"{attachment_id}.enc"
+    
+    def exists(self, attachment_id: str) -> bool:
+        """Проверяет, что вложение есть в хранилище"""
+        return self.is_valid_id(attachment_id) and self._get_path(attachment_id).exists()
+    
+    def save(self, src: BinaryIO) -> Tuple[str, int]:
+        """
+        Шифрует и сохраняет вложение из потока
+        
+        Args:
+            src: Файловый объект с содержимым (режим 'rb')
+            
+        Returns:
+            (ID вложения, размер в байтах)
+        """
+        reader = _HashingReader(src, self.encryption_manager.derive_subkey(ATTACHMENT_ID_INFO))
+        tmp_file = self.attachments_dir / f"upload.{os.getpid()}.{os.urandom(4).hex()}.tmp"
+        try:
+            with open(tmp_file, 'wb') as f:
+                self.encryption_manager.encrypt_stream(reader, f)
+                f.flush()
+                os.fsync(f.fileno())
+            
+            attachment_id = reader.mac.hexdigest()
+            file_path = self._get_path(attachment_id)
+            if file_path.exists():
+                # Такое вложение уже есть: продлеваем ему срок до сборки мусора
+                os.utime(file_path)
+            else:
+                os.replace(tmp_file, file_path)
+        finally:
+            if tmp_file.exists():
+                tmp_file.unlink()
+        
+        return attachment_id, reader.size
+    
+    def open(self, attachment_id: str) -> Iterator[bytes]:
+        """
+        Расшифровывает вложение по сегментам
+        
+        Args:
+            attachment_id: ID вложения
+            
+        Returns:
+            Итератор сегментов содержимого
+        """
+        with open(self._get_path(attachment_id), 'rb') as f:
+            yield from self.encryption_manager.decrypt_stream(f)
+    
+    def collect_garbage(self, referenced: Iterable[str], grace_period: float = GC_GRACE_PERIOD) -> List[str]:
+        """
+        Удаляет вложения, на которые не ссылается ни одна заметка
+        
+        Args:
+            referenced: ID вложений, на которые есть ссылки
+            grace_period: Минимальный возраст удаляемого файла (сек)
+            
+        Returns:
+            ID удаленных вложений
+        """
+        referenced = set(referenced)
+        threshold = time.time() - grace_period
+        removed = []
+        for file_path in self.attachments_dir.glob("*.enc"):
+            attachment_id = file_path.stem
+            if attachment_id in referenced or not self.is_valid_id(attachment_id):
+                continue
+            try:
+                if file_path.stat().st_mtime > threshold:
+                    continue
+                file_path.unlink()
+                removed.append(attachment_id)
+            except OSError as e:
+                print(f"Ошибка удаления вложения {attachment_id}: {e}")
+        
+        # Временные файлы прерванных загрузок
+        for tmp_file in self.attachments_dir.glob("upload.*.tmp"):
+            try:
+                if tmp_file.stat().st_mtime <= threshold:
+                    tmp_file.unlink()
+            except OSError:
+                pass
+        return removed
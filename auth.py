@@ -5,7 +5,9 @@
 import os
 import bcrypt
 import json
+import threading
 from pathlib import Path
+from atomic_io import atomic_write_bytes, file_lock
 
 
 class AuthManager:
@@ -20,6 +22,10 @@ class AuthManager:
         """
         self.config_file = config_file
         self.config_path = Path(config_file)
+        # Номер пароля и отпечаток файла конфигурации, при котором он прочитан
+        self._generation = 0
+        self._generation_stat = None
+        self._lock = threading.Lock()
         self._ensure_config_exists()
     
     def _ensure_config_exists(self):
@@ -74,16 +80,19 @@ class AuthManager:
         """
         try:
             hashed = self.hash_password(password)
-            config = {}
-            if self.config_path.exists():
-                with open(self.config_file, 'r', encoding='utf-8') as f:
-                    config = json.load(f)
-            
-            config['password_hash'] = hashed
-            config['initialized'] = True
-            
-            with open(self.config_file, 'w', encoding='utf-8') as f:
-                json.dump(config, f, indent=2)
+            # Блокировка файла: смена пароля в разных воркерах не теряет номер пароля
+            with file_lock(self.config_path):
+                config = {}
+                if self.config_path.exists():
+                    with open(self.config_file, 'r', encoding='utf-8') as f:
+                        config = json.load(f)
+                
+                config['password_hash'] = hashed
+                config['initialized'] = True
+                # Номер пароля растет при каждой смене: сессии со старым номером недействительны
+                config['generation'] = config.get('generation', 0) + 1
+                
+                atomic_write_bytes(self.config_path, json.dumps(config, indent=2).encode('utf-8'))
             
             return True
         except Exception as e:
@@ -132,6 +141,33 @@ class AuthManager:
         except Exception:
             return False
     
+    def get_generation(self) -> int:
+        """
+        Получает номер текущего пароля (растет при каждой установке пароля)
+        
+        Файл конфигурации перечитывается, только если изменился (пароль мог
+        сменить другой воркер), поэтому проверка на каждом запросе стоит одного stat.
+        
+        Returns:
+            Номер пароля (0, если пароль еще не менялся с появления номеров)
+        """
+        try:
+            st = self.config_path.stat()
+        except OSError:
+            return 0
+        stat = (st.st_ino, st.st_mtime_ns, st.st_size)
+        
+        with self._lock:
+            if stat != self._generation_stat:
+                try:
+                    with open(self.config_file, 'r', encoding='utf-8') as f:
+                        self._generation = json.load(f).get('generation', 0)
+                except (OSError, ValueError) as e:
+                    print(f"Ошибка чтения номера пароля: {e}")
+                    return self._generation
+                self._generation_stat = stat
+            return self._generation
+    
     def reset_password(self, old_password: str, new_password: str) -> bool:
         """
         Сбрасывает пароль (требует старый пароль)
@@ -0,0 +1,168 @@
+"""
+Лента изменений данных (заметки, календарь, TODO, словарь) с номерами событий
+"""
+import os
+import time
+import threading
+from datetime import datetime
+from pathlib import Path
+from typing import List, Dict, Optional, Tuple
+from access_log import AccessLog
+from atomic_io import file_lock
+
+
+# Сколько событий хранится в одном сегменте журнала изменений
+CHANGE_RETENTION = 1000
+
+# Как часто ожидающий клиент проверяет журнал на события других процессов (секунды)
+CHANGE_POLL_INTERVAL = 1.0
+
+
+class ChangeFeed:
+    """
+    Шина событий изменений с журналом на диске
+    
+    Каждое событие получает номер seq, который монотонно растет. Номер
+    выдается под блокировкой файла журнала, поэтому он общий для всех
+    воркеров. Клиент продолжает чтение с последнего полученного номера.
+    События своего процесса будят ожидающих сразу. События других
+    процессов замечаются при проверке журнала раз в CHANGE_POLL_INTERVAL.
+    
+    В журнал пишутся только тип, действие, ID заметки и время. Содержимое
+    и даты календаря на диск открытым текстом не попадают.
+    """
+    
+    def __init__(self, log_file: Path, retention: int = CHANGE_RETENTION):
+        """
+        Инициализация ленты
+        
+        Args:
+            log_file: Путь к журналу изменений
+            retention: Количество событий в сегменте журнала
+        """
+        self.log_file = Path(log_file)
+        self._log = AccessLog(self.log_file, retention)
+        self._condition = threading.Condition()
+        # Счетчик событий, опубликованных этим процессом (меняется под self._condition)
+        self._published = 0
+        # Последний номер и отпечаток сегментов, при котором он прочитан
+        self._last_seq = 0
+        self._last_version: Optional[str] = None
+    
+    def last_seq(self) -> int:
+        """Получает номер последнего события (0, если событий еще не было)"""
+        version = self._log.get_version()
+        if version != self._last_version:
+            entries = self._log.tail(1)
+            self._last_seq = entries[-1].get("seq", 0) if entries else 0
+            self._last_version = version
+        return self._last_seq
+    
+    def publish(self, kind: str, action: str, item_id: Optional[str] = None) -> int:
+        """
+        Публикует событие изменения
+        
+        Args:
+            kind: Тип данных (note, calendar, todos, dictionary)
+            action: Действие (created, updated, deleted)
+            item_id: ID измененного объекта (для заметок)
+            
+        Returns:
+            Номер события
+        """
+        try:
+            with file_lock(self.log_file):
+                seq = self.last_seq() + 1
+                self._log.append({
+                    "seq": seq,
+                    "type": kind,
+                    "action": action,
+                    "id": item_id,
+                    "date": datetime.now().isoformat()
+                })
+        except Exception as e:
+            # Изменение уже сохранено: без события клиенты увидят его при следующей полной загрузке
+            print(f"Ошибка записи журнала изменений: {e}")
+            return 0
+        
+        with self._condition:
+            self._published += 1
+            self._condition.notify_all()
+        return seq
+    
+    def read(self, after: int) -> Tuple[List[Dict], bool]:
+        """
+        Получает события после номера after
+        
+        Args:
+            after: Номер последнего полученного события
+            
+        Returns:
+            (события от старых к новым, reset). reset=True означает, что
+            события после after уже удалены из журнала или номер из
+            другого журнала, поэтому клиенту нужно загрузить данные заново
+        """
+        last = self.last_seq()
+        if after > last:
+            return [], True
+        if after == last:
+            return [], False
+        
+        while True:
+            entries = [entry for entry in self._log.tail(last - after) if entry.get("seq", 0) > after]
+            if entries and entries[0].get("seq") == after + 1:
+                return entries, False
+            newest = entries[-1].get("seq", 0) if entries else 0
+            if newest <= last:
+                return [], True
+            # Пока читали, другие процессы дописали события - читаем с запасом
+            last = newest
+    
+    def wait(self, after: int, timeout: float) -> Tuple[List[Dict], bool]:
+        """
+        Ждет события после номера after не дольше timeout секунд
+        
+        Args:
+            after: Номер последнего полученного события
+            timeout: Наибольшее время ожидания
+            
+        Returns:
+            (события, reset) как у read; пустой список, если событий не было
+        """
+        deadline = time.monotonic() + timeout
+        while True:
+            with self._condition:
+                published = self._published
+            # Журнал читается без условия: чтение файлов не задерживает publish и других ожидающих
+            events, reset = self.read(after)
+            remaining = deadline - time.monotonic()
+            if events or reset or remaining <= 0:
+                return events, reset
+            with self._condition:
+                # Событие, опубликованное во время чтения, не теряется: счетчик уже изменился
+                if self._published == published:
+                    self._condition.wait(min(remaining, CHANGE_POLL_INTERVAL))
+
+
+# Ленты изменений процесса {путь журнала: ChangeFeed}
+_feeds: Dict[str, ChangeFeed] = {}
+_feeds_lock = threading.Lock()
+
+
+def get_change_feed(log_file: Path) -> ChangeFeed:
+    """
+    Получает общую для процесса ленту изменений для журнала
+    
+    Args:
+        log_file: Путь к журналу изменений
+        
+    Returns:
+        Лента изменений
+    """
+    key = os.path.abspath(log_file)
+    with _feeds_lock:
+        feed = _feeds.get(key)
+        if feed is None:
+            feed = ChangeFeed(Path(log_file))
+            _feeds[key] = feed
+        return feed
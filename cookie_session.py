@@ -0,0 +1,99 @@
+"""
+Сессия в зашифрованной cookie (без хранения сессий на сервере)
+"""
+import os
+import time
+import base64
+from flask.sessions import SessionInterface, SecureCookieSession
+from flask.json.tag import TaggedJSONSerializer
+from cryptography.hazmat.primitives.ciphers.aead import AESGCM
+from cryptography.hazmat.primitives.kdf.hkdf import HKDF
+from cryptography.hazmat.primitives import hashes
+from cryptography.exceptions import InvalidTag
+
+
+HKDF_INFO = b"zametik-session-cookie"
+
+
+class EncryptedCookieSessionInterface(SessionInterface):
+    """
+    Хранит сессию в cookie, зашифрованной AES-GCM ключом из SECRET_KEY
+    
+    В отличие от стандартной подписанной cookie Flask содержимое (в том числе
+    пароль) не читается на клиенте. Открытие и сохранение сессии не обращаются
+    к диску, поэтому любой воркер обслуживает любой запрос, если у всех один
+    SECRET_KEY.
+    
+    Сервер не хранит список сессий, поэтому выход удаляет cookie только у
+    этого клиента: сохраненная копия действует до конца срока жизни сессии.
+    Все сессии отзывает смена пароля - в сессии записан номер пароля, который
+    require_auth сверяет с конфигурацией аутентификации.
+    """
+    
+    serializer = TaggedJSONSerializer()
+    session_class = SecureCookieSession
+    
+    def _get_cipher(self, app) -> AESGCM:
+        """Выводит ключ шифрования cookie из SECRET_KEY"""
+        secret_key = app.secret_key
+        if isinstance(secret_key, str):
+            secret_key = secret_key.encode('utf-8')
+        hkdf = HKDF(algorithm=hashes.SHA256(), length=32, salt=None, info=HKDF_INFO)
+        return AESGCM(hkdf.derive(secret_key))
+    
+    def open_session(self, app, request):
+        if not app.secret_key:
+            return None
+        
+        value = request.cookies.get(self.get_cookie_name(app))
+        if not value:
+            return self.session_class()
+        
+        try:
+            blob = base64.urlsafe_b64decode(value.encode('ascii'))
+            nonce, ciphertext = blob[:12], blob[12:]
+            # Имя cookie - associated data: содержимое нельзя подставить в другую cookie
+            payload = self._get_cipher(app).decrypt(nonce, ciphertext, self.get_cookie_name(app).encode('utf-8'))
+            expires, serialized = payload.decode('utf-8').split("|", 1)
+            data = self.serializer.loads(serialized)
+        except (ValueError, InvalidTag):
+            # Поврежденная, подделанная или зашифрованная старым ключом cookie
+            return self.session_class()
+        
+        # Срок жизни проверяем сами: браузер мог не удалить cookie
+        if int(expires) and int(expires) < time.time():
+            return self.session_class()
+        
+        return self.session_class(data)
+    
+    def save_session(self, app, session, response):
+        name = self.get_cookie_name(app)
+        domain = self.get_cookie_domain(app)
+        path = self.get_cookie_path(app)
+        secure = self.get_cookie_secure(app)
+        samesite = self.get_cookie_samesite(app)
+        httponly = self.get_cookie_httponly(app)
+        
+        if session.accessed:
+            response.vary.add("Cookie")
+        
+        if not session:
+            if session.modified:
+                response.delete_cookie(name, domain=domain, path=path, secure=secure,
+                                       samesite=samesite, httponly=httponly)
+                response.vary.add("Cookie")
+            return
+        
+        if not self.should_set_cookie(app, session):
+            return
+        
+        expires = self.get_expiration_time(app, session)
+        nonce = os.urandom(12)
+        payload = f"{int(expires.timestamp()) if expires else 0}|{self.serializer.dumps(dict(session))}".encode('utf-8')
+        ciphertext = self._get_cipher(app).encrypt(nonce, payload, name.encode('utf-8'))
+        value = base64.urlsafe_b64encode(nonce + ciphertext).decode('ascii')
+        
+        response.set_cookie(name, value, expires=expires,
+                            httponly=httponly, domain=domain, path=path,
+                            secure=secure, samesite=samesite)
+        response.vary.add("Cookie")
@@ -0,0 +1,171 @@
+"""
+Общий пул потоков для тяжелой криптографии (PBKDF2, bcrypt, расшифровка)
+"""
+import os
+import threading
+from concurrent.futures import FIRST_COMPLETED, Future, ThreadPoolExecutor, wait
+from typing import Callable, Iterable, Iterator, Optional, Tuple, TypeVar
+
+
+T = TypeVar("T")
+R = TypeVar("R")
+
+# Размер пула по умолчанию - число ядер: PBKDF2, bcrypt и AES-GCM выполняются
+# в C/Rust-коде cryptography и bcrypt без GIL, поэтому потоки работают параллельно
+CRYPTO_WORKERS = os.cpu_count() or 2
+
+
+class CryptoExecutor:
+    """
+    Пул потоков для CPU-тяжелых операций
+    
+    Пул потоков, а не процессов: ключи и кеши расшифрованных данных должны
+    оставаться в памяти процесса, а тяжелая часть работы все равно отпускает GIL.
+    Размер пула ограничивает, сколько ядер заняты криптографией одновременно,
+    поэтому одна волна входов или полный поиск не останавливает остальные запросы.
+    """
+    
+    def __init__(self, workers: int = CRYPTO_WORKERS):
+        """
+        Инициализация пула
+        
+        Args:
+            workers: Количество потоков
+        """
+        self.workers = max(1, int(workers))
+        self._executor = ThreadPoolExecutor(max_workers=self.workers, thread_name_prefix="crypto")
+        self._local = threading.local()
+    
+    def _in_worker(self) -> bool:
+        """Проверяет, что код уже выполняется в потоке пула"""
+        return getattr(self._local, "worker", False)
+    
+    def _call(self, fn: Callable[..., R], *args) -> R:
+        self._local.worker = True
+        try:
+            return fn(*args)
+        finally:
+            self._local.worker = False
+    
+    def submit(self, fn: Callable[..., R], *args) -> Future:
+        """
+        Ставит задачу в пул
+        
+        Args:
+            fn: Функция
+            *args: Аргументы функции
+            
+        Returns:
+            Future с результатом
+        """
+        if self._in_worker():
+            # Задача из потока пула выполняется сразу: ожидание пула изнутри пула может зависнуть
+            future = Future()
+            try:
+                future.set_result(fn(*args))
+            except BaseException as e:
+                future.set_exception(e)
+            return future
+        return self._executor.submit(self._call, fn, *args)
+    
+    def run(self, fn: Callable[..., R], *args) -> R:
+        """
+        Выполняет функцию в пуле и ждет результат
+        
+        Args:
+            fn: Функция
+            *args: Аргументы функции
+            
+        Returns:
+            Результат функции (исключение пробрасывается)
+        """
+        return self.submit(fn, *args).result()
+    
+    def map(self, fn: Callable[[T], R], items: Iterable[T]) -> Iterator[R]:
+        """
+        Применяет функцию к элементам параллельно, сохраняя порядок
+        
+        Args:
+            fn: Функция одного аргумента
+            items: Элементы
+            
+        Returns:
+            Итератор результатов (исключение пробрасывается на своем элементе)
+        """
+        futures = [self.submit(fn, item) for item in items]
+        try:
+            for future in futures:
+                yield future.result()
+        finally:
+            # Потребитель прервал перебор - не тратим ядра на ненужные результаты
+            for future in futures:
+                future.cancel()
+    
+    def map_unordered(self, fn: Callable[[T], R], items: Iterable[T]) -> Iterator[Tuple[T, Future]]:
+        """
+        Применяет функцию к элементам параллельно и отдает результаты по мере готовности
+        
+        В работе одновременно не больше двух задач на поток, поэтому длинный
+        перебор (тысячи заметок) не держит в памяти все результаты сразу.
+        
+        Args:
+            fn: Функция одного аргумента
+            items: Элементы
+            
+        Returns:
+            Итератор (элемент, завершенный Future) в порядке завершения
+        """
+        items = iter(items)
+        window = self.workers * 2
+        pending = {}
+        try:
+            while True:
+                for item in items:
+                    pending[self.submit(fn, item)] = item
+                    if len(pending) >= window:
+                        break
+                if not pending:
+                    return
+                done, _ = wait(pending, return_when=FIRST_COMPLETED)
+                for future in done:
+                    yield pending.pop(future), future
+        finally:
+            for future in pending:
+                future.cancel()
+    
+    def shutdown(self):
+        """Останавливает пул"""
+        self._executor.shutdown(wait=False)
+
+
+_executor: Optional[CryptoExecutor] = None
+_executor_lock = threading.Lock()
+
+
+def configure_crypto_executor(workers: int) -> CryptoExecutor:
+    """
+    Задает размер общего пула (вызывается при создании приложения)
+    
+    Args:
+        workers: Количество потоков
+        
+    Returns:
+        Общий пул
+    """
+    global _executor
+    with _executor_lock:
+        if _executor is None or _executor.workers != max(1, int(workers)):
+            old_executor = _executor
+            _executor = CryptoExecutor(workers)
+            if old_executor is not None:
+                old_executor.shutdown()
+        return _executor
+
+
+def get_crypto_executor() -> CryptoExecutor:
+    """Получает общий пул процесса (создается с размером по умолчанию)"""
+    global _executor
+    with _executor_lock:
+        if _executor is None:
+            _executor = CryptoExecutor()
+        return _executor
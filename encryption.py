@@ -1,25 +1,125 @@
 import os
+import io
+import json
 import hashlib
 import base64
+import struct
+import threading
+from pathlib import Path
+from typing import BinaryIO, Dict, Iterator, Optional, Tuple
 from cryptography.hazmat.primitives.ciphers.aead import AESGCM
 from cryptography.hazmat.primitives.kdf.pbkdf2 import PBKDF2HMAC
+from cryptography.hazmat.primitives.kdf.hkdf import HKDF
 from cryptography.hazmat.primitives import hashes
 from cryptography.hazmat.backends import default_backend
+from atomic_io import atomic_write_bytes, file_lock
+
+
+# Формат v3 (двоичный контейнер .enc файлов):
+#   MAGIC (4) + версия (1) + id KDF (1) + итерации KDF (4) + соль мастер-ключа (16)
+#   + соль файла (16) + nonce (12) + шифртекст с тегом AES-GCM
+# Заголовок аутентифицируется как associated data AES-GCM.
+# Формат v4 (потоковый) - заголовок v3, где вместо nonce префикс nonce (7) и размер сегмента (4),
+# затем сегменты по CHUNK_SIZE байт открытого текста, каждый со своим тегом AES-GCM.
+# Nonce сегмента = префикс + номер сегмента (4) + флаг последнего сегмента (1), поэтому
+# перестановка, пропуск и обрезка сегментов обнаруживаются при расшифровке.
+# Формат v2 - то же без id KDF и итераций, в base64 (текстовые файлы).
+# Мастер-ключ выводится через PBKDF2 один раз на соль и хранится только в памяти,
+# ключ файла получается из мастер-ключа через HKDF (дешево). Соль мастер-ключа
+# одна на хранилище и лежит в заголовке хранилища (vault.json), поэтому все новые
+# записи всех сессий и воркеров используют один мастер-ключ.
+# Старый формат salt (16) + nonce (12) + шифртекст + sha256_hex (64) в base64 читается как раньше.
+MAGIC = b"ZMTK"
+FORMAT_V2 = 2
+FORMAT_V3 = 3
+FORMAT_V4 = 4
+KDF_PBKDF2_SHA256 = 1
+PBKDF2_ITERATIONS = 100000
+# Допустимое число итераций из заголовка файла: заголовок проверяется тегом AES-GCM
+# только после вывода ключа, поэтому без границы файл мог бы заставить считать PBKDF2 сколь угодно долго
+MIN_PBKDF2_ITERATIONS = PBKDF2_ITERATIONS
+MAX_PBKDF2_ITERATIONS = 10 * PBKDF2_ITERATIONS
+HKDF_INFO = b"zametik-file-key"
+
+HEADER_V3 = struct.Struct(">4sBBI16s16s12s")
+HEADER_V4 = struct.Struct(">4sBBI16s16s7sI")
+STREAM_NONCE = struct.Struct(">7sIB")
+
+# Размер сегмента открытого текста в потоковом формате
+CHUNK_SIZE = 64 * 1024
+# Максимальный размер сегмента, который примем из заголовка файла
+MAX_CHUNK_SIZE = 16 * 1024 * 1024
+TAG_SIZE = 16
+
+# Сколько мастер-ключей (по разным солям) держать в памяти
+MAX_CACHED_MASTER_KEYS = 16
+
+# Заголовок хранилища: соль мастер-ключа для всех новых записей
+VAULT_HEADER_FILE = "vault.json"
+
+
+def load_vault_salt(notes_dir: Path) -> bytes:
+    """
+    Получает соль мастер-ключа хранилища, создавая заголовок хранилища при первом обращении
+    
+    Соль не секретна; файл создается под блокировкой, чтобы воркеры не
+    записали разные соли одновременно.
+    
+    Args:
+        notes_dir: Директория заметок
+        
+    Returns:
+        Соль мастер-ключа (16 байт)
+    """
+    header_file = Path(notes_dir) / VAULT_HEADER_FILE
+    with file_lock(header_file):
+        try:
+            with open(header_file, 'r', encoding='utf-8') as f:
+                salt = bytes.fromhex(json.load(f)["master_salt"])
+            if len(salt) == 16:
+                return salt
+            print(f"Ошибка заголовка хранилища: соль {len(salt)} байт, создается новая")
+        except FileNotFoundError:
+            pass
+        except (OSError, ValueError, KeyError, TypeError) as e:
+            print(f"Ошибка чтения заголовка хранилища: {e}")
+        
+        salt = os.urandom(16)
+        header = {"version": 1, "kdf": KDF_PBKDF2_SHA256, "iterations": PBKDF2_ITERATIONS, "master_salt": salt.hex()}
+        atomic_write_bytes(header_file, json.dumps(header, indent=2).encode('utf-8'))
+        return salt
 
 
 class EncryptionManager:
     
-    def __init__(self, password: str):
+    def __init__(self, password: str, notes_dir: Optional[str] = None):
+        """
+        Args:
+            password: Пароль пользователя
+            notes_dir: Директория хранилища с заголовком (соль мастер-ключа);
+                без нее соль новых записей случайная на время жизни менеджера
+        """
         self.password = password.encode('utf-8')
+        self.notes_dir = Path(notes_dir) if notes_dir is not None else None
         self.backend = default_backend()
+        # Кеш мастер-ключей {(соль, итерации): ключ}, живет только в памяти процесса
+        self._master_keys: Dict[Tuple[bytes, int], bytes] = {}
+        # Соль мастер-ключа, которой шифруются новые записи
+        self._master_salt: Optional[bytes] = None
+        self._lock = threading.Lock()
+        # Блокировки вывода ключа {(соль, итерации): Lock}: параллельные расшифровки
+        # с одной солью ждут один PBKDF2, а ключи разных солей выводятся одновременно
+        self._derive_locks: Dict[Tuple[bytes, int], threading.Lock] = {}
+        # Менеджер прежнего пароля: пока идет перешифрование, им читаются еще не перешифрованные файлы
+        self.fallback: Optional["EncryptionManager"] = None
     
-    def _derive_key(self, salt: bytes) -> bytes:
-
+    def _derive_key(self, salt: bytes, iterations: int = PBKDF2_ITERATIONS) -> bytes:
+        
         kdf = PBKDF2HMAC(
             algorithm=hashes.SHA256(),
             length=32,
             salt=salt,
-            iterations=100000,
+            iterations=iterations,
             backend=self.backend
         )
         return kdf.derive(self.password)
@@ -28,13 +128,88 @@ class EncryptionManager:
         return os.urandom(16)
     
     def _calculate_hash(self, data: bytes) -> str:
-
+        
         return hashlib.sha256(data).hexdigest()
     
+    def _get_master_key(self, master_salt: bytes, iterations: int = PBKDF2_ITERATIONS) -> bytes:
+        """
+        Возвращает мастер-ключ для соли, выводя его через PBKDF2 только при первом обращении
+        
+        Args:
+            master_salt: Соль мастер-ключа
+            iterations: Количество итераций PBKDF2
+            
+        Returns:
+            Мастер-ключ (32 байта)
+        """
+        cache_key = (master_salt, iterations)
+        key = self._master_keys.get(cache_key)
+        if key is not None:
+            return key
+        
+        with self._lock:
+            derive_lock = self._derive_locks.setdefault(cache_key, threading.Lock())
+        
+        with derive_lock:
+            key = self._master_keys.get(cache_key)
+            if key is not None:
+                return key
+            key = self._derive_key(master_salt, iterations)
+            with self._lock:
+                if len(self._master_keys) >= MAX_CACHED_MASTER_KEYS:
+                    # Вытесняем самый старый ключ, но не текущий ключ записи
+                    for old_key in list(self._master_keys):
+                        if old_key[0] != self._master_salt:
+                            del self._master_keys[old_key]
+                            break
+                self._master_keys[cache_key] = key
+                # Ключ в кеше - блокировка больше не нужна (ждущие потоки держат ссылку на нее)
+                self._derive_locks.pop(cache_key, None)
+        return key
+    
+    def derive_master_key(self):
+        """
+        Заранее выводит мастер-ключ хранилища (PBKDF2), чтобы первое чтение
+        или запись после входа не ждали его вывода
+        """
+        self._get_master_key(self._get_write_salt())
+    
+    def _get_write_salt(self) -> bytes:
+        """Получает соль мастер-ключа для новых записей (соль хранилища)"""
+        with self._lock:
+            if self._master_salt is None:
+                if self.notes_dir is not None:
+                    self._master_salt = load_vault_salt(self.notes_dir)
+                else:
+                    self._master_salt = self._generate_salt()
+            return self._master_salt
+    
+    def _derive_file_key(self, master_key: bytes, file_salt: bytes) -> bytes:
+        """
+        Выводит ключ отдельного файла из мастер-ключа через HKDF
+        
+        Args:
+            master_key: Мастер-ключ
+            file_salt: Случайная соль файла
+            
+        Returns:
+            Ключ файла (32 байта)
+        """
+        hkdf = HKDF(
+            algorithm=hashes.SHA256(),
+            length=32,
+            salt=file_salt,
+            info=HKDF_INFO,
+            backend=self.backend
+        )
+        return hkdf.derive(master_key)
+    
     def encrypt(self, plaintext: str) -> str:
-        salt = self._generate_salt()
+        master_salt = self._get_write_salt()
+        master_key = self._get_master_key(master_salt)
         
-        key = self._derive_key(salt)
+        file_salt = self._generate_salt()
+        key = self._derive_file_key(master_key, file_salt)
         
         aesgcm = AESGCM(key)
         
@@ -43,71 +218,300 @@ class EncryptionManager:
         plaintext_bytes = plaintext.encode('utf-8')
         ciphertext = aesgcm.encrypt(nonce, plaintext_bytes, None)
         
-        data_hash_hex = self._calculate_hash(plaintext_bytes)
-        
-        combined = salt + nonce + ciphertext + data_hash_hex.encode('utf-8')
+        # Целостность обеспечивает тег AES-GCM, отдельный хеш не нужен
+        combined = MAGIC + bytes([FORMAT_V2]) + master_salt + file_salt + nonce + ciphertext
         
         return base64.b64encode(combined).decode('utf-8')
     
-    def decrypt(self, encrypted_data: str) -> str:
-        try:
-            if not encrypted_data or len(encrypted_data.strip()) == 0:
-                raise ValueError("Пустые данные для расшифровки")
-            
-            # Декодируем из base64
-            try:
-                combined = base64.b64decode(encrypted_data.encode('utf-8'))
-            except Exception as e:
-                raise ValueError(f"Ошибка декодирования base64: {str(e)}")
+    def _new_file_key(self) -> Tuple[bytes, bytes, bytes]:
+        """
+        Создает ключ для нового файла
+        
+        Returns:
+            (соль мастер-ключа, соль файла, ключ файла)
+        """
+        master_salt = self._get_write_salt()
+        master_key = self._get_master_key(master_salt)
+        
+        file_salt = self._generate_salt()
+        return master_salt, file_salt, self._derive_file_key(master_key, file_salt)
+    
+    def _read_file_key(self, kdf_id: int, iterations: int, master_salt: bytes, file_salt: bytes) -> bytes:
+        """
+        Получает ключ файла по параметрам из заголовка v3/v4
+        
+        Args:
+            kdf_id: Алгоритм вывода мастер-ключа
+            iterations: Количество итераций KDF
+            master_salt: Соль мастер-ключа
+            file_salt: Соль файла
             
-            # Проверяем минимальный размер данных
-            # salt (16) + nonce (12) + hash (64) = минимум 92 байта
-            if len(combined) < 92:
-                raise ValueError(f"Данные слишком короткие: {len(combined)} байт (минимум 92)")
+        Returns:
+            Ключ файла (32 байта)
+        """
+        if kdf_id != KDF_PBKDF2_SHA256:
+            raise ValueError(f"Неизвестный алгоритм вывода ключа: {kdf_id}")
+        if not MIN_PBKDF2_ITERATIONS <= iterations <= MAX_PBKDF2_ITERATIONS:
+            raise ValueError(f"Недопустимое количество итераций KDF: {iterations}")
+        
+        master_key = self._get_master_key(master_salt, iterations)
+        return self._derive_file_key(master_key, file_salt)
+    
+    def encrypt_bytes(self, data: bytes) -> bytes:
+        """
+        Шифрует данные в двоичный контейнер v3 (для записи в файл в режиме 'wb')
+        
+        Args:
+            data: Открытые данные
             
-            # Извлекаем компоненты
-            salt = combined[0:16]
-            nonce = combined[16:28]
-            # Хеш в hex формате занимает 64 байта (64 символа)
-            hash_bytes = combined[-64:]
-            ciphertext = combined[28:-64]
+        Returns:
+            Заголовок + шифртекст с тегом
+        """
+        master_salt, file_salt, key = self._new_file_key()
+        nonce = os.urandom(12)
+        
+        header = HEADER_V3.pack(MAGIC, FORMAT_V3, KDF_PBKDF2_SHA256, PBKDF2_ITERATIONS,
+                                master_salt, file_salt, nonce)
+        return header + AESGCM(key).encrypt(nonce, data, header)
+    
+    def encrypt_stream(self, src: BinaryIO, dst: BinaryIO, chunk_size: int = CHUNK_SIZE) -> int:
+        """
+        Шифрует поток в формат v4 сегментами, не держа данные в памяти целиком
+        
+        Args:
+            src: Файловый объект с открытыми данными (режим 'rb')
+            dst: Файловый объект для шифртекста (режим 'wb')
+            chunk_size: Размер сегмента открытого текста
             
-            # Проверяем, что есть данные для расшифровки
-            if len(ciphertext) == 0:
-                raise ValueError("Нет данных для расшифровки")
+        Returns:
+            Количество записанных байт
+        """
+        master_salt, file_salt, key = self._new_file_key()
+        nonce_prefix = os.urandom(7)
+        header = HEADER_V4.pack(MAGIC, FORMAT_V4, KDF_PBKDF2_SHA256, PBKDF2_ITERATIONS,
+                                master_salt, file_salt, nonce_prefix, chunk_size)
+        aesgcm = AESGCM(key)
+        
+        dst.write(header)
+        written = len(header)
+        
+        # Читаем на сегмент вперед, чтобы пометить последний сегмент
+        chunk = src.read(chunk_size)
+        counter = 0
+        while True:
+            next_chunk = src.read(chunk_size)
+            is_last = not next_chunk
+            nonce = STREAM_NONCE.pack(nonce_prefix, counter, 1 if is_last else 0)
+            sealed = aesgcm.encrypt(nonce, chunk, header)
+            dst.write(sealed)
+            written += len(sealed)
+            if is_last:
+                return written
+            chunk = next_chunk
+            counter += 1
+    
+    def decrypt_stream(self, src: BinaryIO) -> Iterator[bytes]:
+        """
+        Расшифровывает .enc файл по сегментам
+        
+        Потоковый формат v4 читается сегментами с ограниченной памятью,
+        остальные форматы читаются целиком и отдаются одним куском.
+        
+        Args:
+            src: Файловый объект с шифртекстом (режим 'rb', с поддержкой seek)
             
-            # Выводим ключ из пароля
-            key = self._derive_key(salt)
+        Returns:
+            Итератор сегментов открытых данных
+        """
+        start = src.tell()
+        chunks = self._decrypt_stream_own(src)
+        try:
+            first = next(chunks, None)
+        except ValueError:
+            if self.fallback is None:
+                raise
+            # Файл еще зашифрован прежним паролем
+            src.seek(start)
+            yield from self.fallback.decrypt_stream(src)
+            return
+        
+        if first is not None:
+            yield first
+        yield from chunks
+    
+    def _decrypt_stream_own(self, src: BinaryIO) -> Iterator[bytes]:
+        """Расшифровывает .enc файл по сегментам своим паролем"""
+        head = src.read(len(MAGIC) + 1)
+        if head != MAGIC + bytes([FORMAT_V4]):
+            yield self._decrypt_bytes_own(head + src.read())
+            return
+        
+        header = head + src.read(HEADER_V4.size - len(head))
+        if len(header) < HEADER_V4.size:
+            raise ValueError(f"Данные слишком короткие: {len(header)} байт (минимум {HEADER_V4.size + TAG_SIZE})")
+        _, _, kdf_id, iterations, master_salt, file_salt, nonce_prefix, chunk_size = HEADER_V4.unpack(header)
+        if not 0 < chunk_size <= MAX_CHUNK_SIZE:
+            raise ValueError(f"Недопустимый размер сегмента: {chunk_size}")
+        
+        key = self._read_file_key(kdf_id, iterations, master_salt, file_salt)
+        sealed_size = chunk_size + TAG_SIZE
+        
+        sealed = src.read(sealed_size)
+        if not sealed:
+            raise ValueError("Данные обрезаны: нет сегментов")
+        counter = 0
+        while True:
+            next_sealed = src.read(sealed_size)
+            is_last = not next_sealed
+            nonce = STREAM_NONCE.pack(nonce_prefix, counter, 1 if is_last else 0)
+            yield self._aes_decrypt(key, nonce, sealed, header)
+            if is_last:
+                return
+            sealed = next_sealed
+            counter += 1
+    
+    @staticmethod
+    def is_binary_format(blob: bytes) -> bool:
+        """Проверяет, что данные - двоичный контейнер (v3 или потоковый v4)"""
+        return blob[:len(MAGIC)] == MAGIC and blob[len(MAGIC):len(MAGIC) + 1] in (bytes([FORMAT_V3]), bytes([FORMAT_V4]))
+    
+    def _decrypt_v3(self, blob: bytes) -> bytes:
+        """Расшифровывает двоичный контейнер v3"""
+        if len(blob) < HEADER_V3.size + 16:
+            raise ValueError(f"Данные слишком короткие: {len(blob)} байт (минимум {HEADER_V3.size + 16})")
+        
+        header = blob[:HEADER_V3.size]
+        _, _, kdf_id, iterations, master_salt, file_salt, nonce = HEADER_V3.unpack(header)
+        key = self._read_file_key(kdf_id, iterations, master_salt, file_salt)
+        return self._aes_decrypt(key, nonce, blob[HEADER_V3.size:], header)
+    
+    def decrypt_bytes(self, blob: bytes) -> bytes:
+        """
+        Расшифровывает содержимое .enc файла, определяя формат автоматически
+        
+        Args:
+            blob: Содержимое файла (двоичный контейнер v3 или текст base64 старых форматов)
             
-            # Создаем AES-GCM шифр
-            aesgcm = AESGCM(key)
+        Returns:
+            Открытые данные
+        """
+        try:
+            return self._decrypt_bytes_own(blob)
+        except ValueError:
+            if self.fallback is None:
+                raise
+            # Файл еще зашифрован прежним паролем
+            return self.fallback.decrypt_bytes(blob)
+    
+    def _decrypt_bytes_own(self, blob: bytes) -> bytes:
+        """Расшифровывает содержимое .enc файла своим паролем"""
+        try:
+            if blob[:len(MAGIC) + 1] == MAGIC + bytes([FORMAT_V4]):
+                return b"".join(self._decrypt_stream_own(io.BytesIO(blob)))
+            if self.is_binary_format(blob):
+                return self._decrypt_v3(blob)
             
-            # Расшифровываем
+            # Старые форматы хранились как текст base64
             try:
-                plaintext_bytes = aesgcm.decrypt(nonce, ciphertext, None)
-            except Exception as e:
-                error_type = type(e).__name__
-                error_msg = str(e)
-                # InvalidTag означает неверный пароль или поврежденные данные
-                if error_type == "InvalidTag" or "invalidtag" in error_msg.lower():
-                    raise ValueError(f"Неверный пароль - данные не могут быть расшифрованы с текущим паролем. Возможно, заметка была создана с другим паролем.")
-                elif "decryption failed" in error_msg.lower() or "authentication" in error_msg.lower():
-                    raise ValueError(f"Неверный пароль или поврежденные данные. Детали: {error_type}: {error_msg}")
-                else:
-                    raise ValueError(f"Ошибка AES-GCM расшифровки: {error_type}: {error_msg}")
+                encrypted_data = blob.decode('ascii')
+            except UnicodeDecodeError:
+                raise ValueError("Неизвестный формат зашифрованных данных")
+            return self._decrypt_text(encrypted_data)
+        except ValueError:
+            raise
+        except Exception as e:
+            raise ValueError(f"Неожиданная ошибка расшифровки: {type(e).__name__}: {str(e)}")
+    
+    def _aes_decrypt(self, key: bytes, nonce: bytes, ciphertext: bytes, associated_data: Optional[bytes] = None) -> bytes:
+        """Расшифровывает AES-GCM с понятными сообщениями об ошибках"""
+        aesgcm = AESGCM(key)
+        try:
+            return aesgcm.decrypt(nonce, ciphertext, associated_data)
+        except Exception as e:
+            error_type = type(e).__name__
+            error_msg = str(e)
+            # InvalidTag означает неверный пароль или поврежденные данные
+            if error_type == "InvalidTag" or "invalidtag" in error_msg.lower():
+                raise ValueError(f"Неверный пароль - данные не могут быть расшифрованы с текущим паролем. Возможно, заметка была создана с другим паролем.")
+            elif "decryption failed" in error_msg.lower() or "authentication" in error_msg.lower():
+                raise ValueError(f"Неверный пароль или поврежденные данные. Детали: {error_type}: {error_msg}")
+            else:
+                raise ValueError(f"Ошибка AES-GCM расшифровки: {error_type}: {error_msg}")
+    
+    def _decrypt_v2(self, combined: bytes) -> bytes:
+        """Расшифровывает данные в формате v2 (мастер-ключ + HKDF)"""
+        # MAGIC (4) + версия (1) + соль мастер-ключа (16) + соль файла (16) + nonce (12) + тег (16)
+        header_len = len(MAGIC) + 1 + 16 + 16 + 12
+        if len(combined) < header_len + 16:
+            raise ValueError(f"Данные слишком короткие: {len(combined)} байт (минимум {header_len + 16})")
+        
+        offset = len(MAGIC) + 1
+        master_salt = combined[offset:offset + 16]
+        file_salt = combined[offset + 16:offset + 32]
+        nonce = combined[offset + 32:offset + 44]
+        ciphertext = combined[header_len:]
+        
+        master_key = self._get_master_key(master_salt)
+        key = self._derive_file_key(master_key, file_salt)
+        return self._aes_decrypt(key, nonce, ciphertext)
+    
+    def _decrypt_legacy(self, combined: bytes) -> bytes:
+        """Расшифровывает данные в старом формате salt + nonce + ciphertext + sha256_hex"""
+        # Проверяем минимальный размер данных
+        # salt (16) + nonce (12) + hash (64) = минимум 92 байта
+        if len(combined) < 92:
+            raise ValueError(f"Данные слишком короткие: {len(combined)} байт (минимум 92)")
+        
+        # Извлекаем компоненты
+        salt = combined[0:16]
+        nonce = combined[16:28]
+        # Хеш в hex формате занимает 64 байта (64 символа)
+        hash_bytes = combined[-64:]
+        ciphertext = combined[28:-64]
+        
+        # Проверяем, что есть данные для расшифровки
+        if len(ciphertext) == 0:
+            raise ValueError("Нет данных для расшифровки")
+        
+        # Выводим ключ из пароля (у каждого файла своя соль, кешировать нечего)
+        key = self._derive_key(salt)
+        
+        plaintext_bytes = self._aes_decrypt(key, nonce, ciphertext)
+        
+        # Проверяем целостность
+        expected_hash = self._calculate_hash(plaintext_bytes)
+        try:
+            actual_hash = hash_bytes.decode('utf-8')
+        except Exception as e:
+            raise ValueError(f"Ошибка декодирования хеша: {str(e)}")
+        
+        if expected_hash != actual_hash:
+            raise ValueError("Целостность данных нарушена - хеши не совпадают")
+        
+        return plaintext_bytes
+    
+    def decrypt(self, encrypted_data: str) -> str:
+        return self._decrypt_text(encrypted_data).decode('utf-8')
+    
+    def _decrypt_text(self, encrypted_data: str) -> bytes:
+        """Расшифровывает текстовые форматы (base64): v2 и самый старый"""
+        try:
+            if not encrypted_data or len(encrypted_data.strip()) == 0:
+                raise ValueError("Пустые данные для расшифровки")
             
-            # Проверяем целостность
-            expected_hash = self._calculate_hash(plaintext_bytes)
+            # Декодируем из base64
             try:
-                actual_hash = hash_bytes.decode('utf-8')
+                combined = base64.b64decode(encrypted_data.encode('utf-8'))
             except Exception as e:
-                raise ValueError(f"Ошибка декодирования хеша: {str(e)}")
-            
-            if expected_hash != actual_hash:
-                raise ValueError("Целостность данных нарушена - хеши не совпадают")
+                raise ValueError(f"Ошибка декодирования base64: {str(e)}")
             
-            return plaintext_bytes.decode('utf-8')
+            if combined[:len(MAGIC)] == MAGIC and combined[len(MAGIC):len(MAGIC) + 1] == bytes([FORMAT_V2]):
+                plaintext_bytes = self._decrypt_v2(combined)
+            else:
+                plaintext_bytes = self._decrypt_legacy(combined)
             
+            return plaintext_bytes
+        
         except ValueError as e:
             # Передаем ValueError как есть, без оборачивания
             raise
@@ -115,6 +519,35 @@ class EncryptionManager:
             # Другие исключения оборачиваем
             raise ValueError(f"Неожиданная ошибка расшифровки: {type(e).__name__}: {str(e)}")
     
+    def derive_subkey(self, info: bytes) -> bytes:
+        """
+        Выводит из мастер-ключа хранилища ключ для отдельного назначения (HKDF)
+        
+        Ключ зависит от пароля и соли хранилища, поэтому одинаков во всех
+        сессиях и воркерах и меняется при смене пароля.
+        
+        Args:
+            info: Метка назначения (у каждого назначения своя)
+            
+        Returns:
+            Ключ (32 байта)
+        """
+        master_key = self._get_master_key(self._get_write_salt())
+        hkdf = HKDF(
+            algorithm=hashes.SHA256(),
+            length=32,
+            salt=None,
+            info=info,
+            backend=self.backend
+        )
+        return hkdf.derive(master_key)
+    
+    def forget_keys(self):
+        """Удаляет выведенные мастер-ключи из памяти (выход из системы)"""
+        with self._lock:
+            self._master_keys.clear()
+            self._master_salt = None
+        self.fallback = None
+    
     def hash_data(self, data: str) -> str:
         return self._calculate_hash(data.encode('utf-8'))
-
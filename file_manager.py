@@ -1,49 +1,144 @@
 """
 Менеджер файлов для работы с зашифрованными заметками
 """
+import io
 import os
+import base64
+import copy
 import json
 import re
+import codecs
+import threading
+import zlib
 from pathlib import Path
-from typing import List, Dict, Optional
-from encryption import EncryptionManager
+from typing import BinaryIO, List, Dict, Optional, Iterable, Iterator, Tuple
+from encryption import EncryptionManager, CHUNK_SIZE
+from search_index import SearchIndex, MAX_MATCHES_PER_NOTE, make_matches
+from ranking import RankIndex
+from metadata_store import get_metadata_store
+from access_log import AccessLog, ACCESS_LOG_RETENTION
+from link_index import LinkIndex
+from tag_index import TagIndex
+from change_feed import get_change_feed
+from note_order_index import NoteOrderIndex, SORT_FIELDS
+from plaintext_cache import PlaintextCache
+from attachment_store import AttachmentStore, extract_attachment_refs
+from note_patch import apply_text_ops, apply_json_patch, VersionConflict
+from atomic_io import atomic_write, file_lock
+from crypto_executor import get_crypto_executor
+
+
+# Файлы больше этого размера отдаются клиенту потоком (см. get_note_stream)
+STREAM_NOTE_THRESHOLD = 1024 * 1024
+
+# Сколько раз get_note перечитывает заметку, если ее записали во время расшифровки
+GET_NOTE_ATTEMPTS = 3
+
 
 
 class FileManager:
     """Менеджер для работы с зашифрованными файлами заметок"""
     
-    def __init__(self, notes_dir: str = "notes", encryption_manager: Optional[EncryptionManager] = None):
+    def __init__(self, notes_dir: str = "notes", encryption_manager: Optional[EncryptionManager] = None,
+                 access_log_retention: int = ACCESS_LOG_RETENTION):
         """
         Инициализация менеджера файлов
         
         Args:
             notes_dir: Директория для хранения заметок
             encryption_manager: Менеджер шифрования
+            access_log_retention: Размер сегмента журнала заходов (записей)
         """
         self.notes_dir = Path(notes_dir)
         self.notes_dir.mkdir(exist_ok=True)
         self.encryption_manager = encryption_manager
         self.metadata_file = self.notes_dir / "metadata.json"
+        self.search_index_dir = self.notes_dir / "search_index"
+        # Индекс прежнего формата (одним файлом с текстом заметок) удаляется при первом поиске
+        self.legacy_search_index_file = self.notes_dir / "search_index.enc"
+        self._search_index: Optional[SearchIndex] = None
+        # Индекс ранжирования (только в памяти) и версии проиндексированных заметок
+        # {id: (mtime в поисковом индексе, заголовок, теги)}
+        self._rank_index = RankIndex()
+        self._rank_versions: Dict[str, Tuple] = {}
+        # Номера событий ленты изменений, до которых синхронизированы индексы (None - нужна полная сверка)
+        self._search_seq: Optional[int] = None
+        self._rank_seq: Optional[int] = None
+        # Метка данных метаданных, с которыми сверен индекс ранжирования (меняется при перечитывании с диска)
+        self._rank_stamp: Optional[object] = None
+        # Общий для процесса кеш metadata.json
+        self._metadata_store = get_metadata_store(self.metadata_file)
+        self.access_log_file = self.notes_dir / "access_log.jsonl"
+        self.access_log_retention = access_log_retention
+        self._access_log: Optional[AccessLog] = None
+        # Общая для процесса лента изменений (номера событий общие для всех воркеров)
+        self.changes_file = self.notes_dir / "changes.jsonl"
+        self._change_feed = get_change_feed(self.changes_file)
+        self.attachments_dir = self.notes_dir / "attachments"
+        self._attachment_store: Optional[AttachmentStore] = None
+        # Расшифрованное содержимое недавно открытых/сохраненных заметок:
+        # повторное открытие и PATCH обходятся без расшифровки
+        self._content_cache = PlaintextCache()
         self._ensure_metadata_exists()
     
     def _ensure_metadata_exists(self):
         """Создает файл метаданных, если его нет"""
-        if not self.metadata_file.exists():
-            with open(self.metadata_file, 'w', encoding='utf-8') as f:
-                json.dump({"notes": {}}, f)
+        self._metadata_store.ensure_exists()
     
     def _load_metadata(self) -> Dict:
-        """Загружает метаданные"""
-        try:
-            with open(self.metadata_file, 'r', encoding='utf-8') as f:
-                return json.load(f)
-        except Exception:
-            return {"notes": {}}
+        """
+        Загружает метаданные из кеша (файл перечитывается только при его изменении)
+        
+        Возвращается общий словарь: изменять его можно только под
+        self._metadata_store.lock с последующим вызовом _save_metadata.
+        """
+        return self._metadata_store.load()
     
     def _save_metadata(self, metadata: Dict):
-        """Сохраняет метаданные"""
-        with open(self.metadata_file, 'w', encoding='utf-8') as f:
-            json.dump(metadata, f, indent=2, ensure_ascii=False)
+        """Отмечает метаданные измененными (запись на диск отложенная и атомарная)"""
+        self._metadata_store.mark_dirty()
+    
+    def _get_link_index(self) -> LinkIndex:
+        """Получает общий индекс связей (строится по метаданным при первом обращении)"""
+        return self._metadata_store.get_index("links", lambda data: LinkIndex(data["notes"]))
+    
+    def _get_tag_index(self) -> TagIndex:
+        """Получает общий индекс тегов (строится по метаданным при первом обращении)"""
+        return self._metadata_store.get_index("tags", lambda data: TagIndex(data["notes"]))
+    
+    def _get_order_index(self) -> NoteOrderIndex:
+        """Получает общий индекс порядка заметок (строится по метаданным при первом обращении)"""
+        return self._metadata_store.get_index("order", lambda data: NoteOrderIndex(data["notes"]))
+    
+    def _touch_note(self, note_id: str, note_meta: Dict):
+        """
+        Обновляет дату изменения заметки и ее место в индексе порядка (под self._metadata_store.lock)
+        
+        Событие "note updated" вызывающий код публикует сам, уже после снятия
+        блокировки метаданных: публикация пишет в файл ленты изменений.
+        """
+        note_meta["modified"] = self._get_timestamp()
+        self._get_order_index().set_note(note_id, note_meta)
+    
+    def flush_metadata(self) -> bool:
+        """
+        Немедленно записывает накопленные изменения метаданных на диск
+        
+        Returns:
+            True если успешно
+        """
+        return self._metadata_store.flush()
+    
+    def close(self):
+        """Сохраняет отложенные изменения и освобождает кеши (при завершении сессии)"""
+        if self._search_index is not None:
+            self._search_index.save()
+        self._search_index = None
+        self._rank_index = RankIndex()
+        self._rank_versions = {}
+        self._search_seq = self._rank_seq = self._rank_stamp = None
+        self._content_cache.clear()
+        self.flush_metadata()
     
     def _sanitize_filename(self, filename: str) -> str:
         """
@@ -68,6 +163,100 @@ class FileManager:
         """Получает путь к файлу заметки"""
         return self.notes_dir / f"{note_id}.enc"
     
+    def _get_file_stamp(self, file_path: Path) -> Optional[Tuple[int, int]]:
+        """Получает отпечаток файла (mtime_ns, размер) или None, если файла нет"""
+        try:
+            stat = file_path.stat()
+        except OSError:
+            return None
+        return stat.st_mtime_ns, stat.st_size
+    
+    def _get_file_mtime(self, file_path: Path) -> int:
+        """Получает mtime файла в наносекундах (0 если файла нет)"""
+        try:
+            return file_path.stat().st_mtime_ns
+        except OSError:
+            return 0
+    
+    def _read_note_content(self, note_id: str) -> str:
+        """
+        Читает и расшифровывает содержимое заметки
+        
+        Args:
+            note_id: ID заметки
+            
+        Returns:
+            Расшифрованное содержимое
+        """
+        file_path = self._get_file_path(note_id)
+        
+        # Расшифровываем
+        try:
+            return self._read_encrypted(file_path)
+        except ValueError as e:
+            # Добавляем информацию о файле для диагностики
+            error_msg = str(e)
+            raise ValueError(f"{error_msg} (файл: {note_id}.enc)")
+    
+    def _read_encrypted(self, file_path: Path) -> str:
+        """
+        Читает и расшифровывает .enc файл (двоичный контейнер или старый текстовый формат)
+        
+        Args:
+            file_path: Путь к файлу
+            
+        Returns:
+            Расшифрованный текст
+        """
+        with open(file_path, 'rb') as f:
+            blob = f.read()
+        
+        # Проверяем, что файл не пустой
+        if not blob.strip():
+            raise ValueError("Файл пуст")
+        
+        return self.encryption_manager.decrypt_bytes(blob).decode('utf-8')
+    
+    def _write_encrypted(self, file_path: Path, plaintext: str):
+        """
+        Шифрует текст и записывает его в .enc файл в двоичном формате
+        
+        Args:
+            file_path: Путь к файлу
+            plaintext: Открытый текст
+        """
+        data = plaintext.encode('utf-8')
+        
+        def write(f):
+            if len(data) > CHUNK_SIZE:
+                # Большие файлы (холсты с картинками) шифруем сегментами прямо в файл
+                self.encryption_manager.encrypt_stream(io.BytesIO(data), f)
+            else:
+                f.write(self.encryption_manager.encrypt_bytes(data))
+        
+        # Временный файл + fsync + переименование: при сбое файл не окажется обрезанным
+        atomic_write(file_path, write)
+    
+    def _iter_encrypted(self, file_path: Path) -> Iterator[str]:
+        """
+        Расшифровывает .enc файл по сегментам
+        
+        Args:
+            file_path: Путь к файлу
+            
+        Returns:
+            Итератор кусков расшифрованного текста
+        """
+        decoder = codecs.getincrementaldecoder('utf-8')()
+        with open(file_path, 'rb') as f:
+            for chunk in self.encryption_manager.decrypt_stream(f):
+                text = decoder.decode(chunk)
+                if text:
+                    yield text
+        tail = decoder.decode(b"", final=True)
+        if tail:
+            yield tail
+    
     def create_note(self, title: str, content: str = "", tags: List[str] = None, note_type: str = "text") -> Dict:
         """
         Создает новую заметку
@@ -88,27 +277,36 @@ class FileManager:
         import uuid
         note_id = str(uuid.uuid4())
         
-        # Шифруем содержимое
-        encrypted_content = self.encryption_manager.encrypt(content)
-        
-        # Сохраняем файл
+        # Шифруем и сохраняем файл
         file_path = self._get_file_path(note_id)
-        with open(file_path, 'w', encoding='utf-8') as f:
-            f.write(encrypted_content)
+        self._write_encrypted(file_path, content)
+        stamp = self._get_file_stamp(file_path)
         
         # Обновляем метаданные
-        metadata = self._load_metadata()
-        metadata["notes"][note_id] = {
-            "id": note_id,
-            "title": title,
-            "tags": tags or [],
-            "type": note_type,
-            "created": self._get_timestamp(),
-            "modified": self._get_timestamp()
-        }
-        self._save_metadata(metadata)
+        with self._metadata_store.lock:
+            metadata = self._load_metadata()
+            note_meta = {
+                "id": note_id,
+                "title": title,
+                "tags": tags or [],
+                "type": note_type,
+                "created": self._get_timestamp(),
+                "modified": self._get_timestamp(),
+                "version": 1
+            }
+            attachments = extract_attachment_refs(content)
+            if attachments:
+                note_meta["attachments"] = attachments
+            metadata["notes"][note_id] = note_meta
+            self._get_tag_index().set_tags(note_id, note_meta["tags"])
+            self._get_order_index().set_note(note_id, note_meta)
+            self._save_metadata(metadata)
+        
+        self._change_feed.publish("note", "created", note_id)
+        self._index_note(note_id, content)
+        self._content_cache.put(note_id, stamp, 1, content)
         
-        return metadata["notes"][note_id]
+        return dict(note_meta)
     
     def get_note(self, note_id: str) -> Optional[Dict]:
         """
@@ -124,39 +322,36 @@ class FileManager:
             raise ValueError("EncryptionManager не установлен")
         
         file_path = self._get_file_path(note_id)
-        if not file_path.exists():
-            return None
         
         try:
-            # Читаем зашифрованный файл
-            with open(file_path, 'r', encoding='utf-8') as f:
-                encrypted_content = f.read().strip()
-            
-            # Проверяем, что файл не пустой
-            if not encrypted_content:
-                raise ValueError("Файл заметки пуст")
-            
-            # Расшифровываем
-            try:
-                content = self.encryption_manager.decrypt(encrypted_content)
-            except ValueError as e:
-                # Добавляем информацию о файле для диагностики
-                error_msg = str(e)
-                raise ValueError(f"{error_msg} (файл: {note_id}.enc)")
-            
-            # Получаем метаданные
-            metadata = self._load_metadata()
-            note_meta = metadata["notes"].get(note_id, {})
-            
-            return {
-                "id": note_id,
-                "title": note_meta.get("title", "Untitled"),
-                "content": content,
-                "tags": note_meta.get("tags", []),
-                "type": note_meta.get("type", "text"),
-                "created": note_meta.get("created", ""),
-                "modified": note_meta.get("modified", "")
-            }
+            # Версия читается под блокировкой метаданных, расшифровка идет без нее;
+            # если за время расшифровки заметку записали, читаем заново
+            for _ in range(GET_NOTE_ATTEMPTS):
+                stamp = self._get_file_stamp(file_path)
+                if stamp is None:
+                    return None
+                note = self._get_note_fields(note_id)
+                cached = self._content_cache.get(note_id, stamp)
+                if cached is not None and cached[0] == note["version"]:
+                    note["content"] = cached[1]
+                    return note
+                
+                # Отпечаток снят до чтения: если файл успел измениться, запись кеша просто не совпадет
+                note["content"] = self._read_note_content(note_id)
+                if self._get_note_fields(note_id)["version"] == note["version"]:
+                    self._content_cache.put(note_id, stamp, note["version"], note["content"])
+                    return note
+            
+            # Заметку все время переписывают - читаем под блокировкой файла: запись
+            # (файл и версия в метаданных) ждет, поэтому версия совпадает с содержимым
+            with file_lock(file_path):
+                stamp = self._get_file_stamp(file_path)
+                if stamp is None:
+                    return None
+                note = self._get_note_fields(note_id)
+                note["content"] = self._read_note_content(note_id)
+            self._content_cache.put(note_id, stamp, note["version"], note["content"])
+            return note
         except ValueError as e:
             # Ошибка расшифровки (неверный пароль или поврежденные данные)
             # Не оборачиваем ValueError, передаем как есть
@@ -167,6 +362,101 @@ class FileManager:
             traceback.print_exc()
             raise Exception(f"Ошибка чтения заметки: {type(e).__name__}: {str(e)}")
     
+    def get_notes_batch(self, note_ids: Iterable[str]) -> Iterator[Tuple[str, Optional[Dict], Optional[str]]]:
+        """
+        Получает несколько заметок: файлы читаются и расшифровываются параллельно в пуле
+        
+        Результаты отдаются по мере готовности, а не в порядке note_ids. Ошибка
+        одной заметки (другой пароль, поврежденный файл) не прерывает пакет.
+        Поля берутся из одного снимка метаданных; версии в результатах нет -
+        для PATCH заметку нужно открыть через get_note.
+        
+        Args:
+            note_ids: ID заметок
+            
+        Returns:
+            Итератор (id, заметка или None, текст ошибки или None);
+            для несуществующей заметки - (id, None, None)
+        """
+        if not self.encryption_manager:
+            raise ValueError("EncryptionManager не установлен")
+        
+        with self._metadata_store.lock:
+            fields = {note_id: self._get_note_fields(note_id) for note_id in note_ids}
+        
+        def read_content(note_id: str) -> Optional[str]:
+            if not self._get_file_path(note_id).exists():
+                return None
+            return self._read_note_content(note_id)
+        
+        for note_id, future in get_crypto_executor().map_unordered(read_content, fields):
+            try:
+                content = future.result()
+            except Exception as e:
+                yield note_id, None, str(e)
+                continue
+            if content is None:
+                yield note_id, None, None
+                continue
+            
+            note = fields[note_id]
+            note.pop("version", None)
+            note["content"] = content
+            yield note_id, note, None
+    
+    def _get_note_fields(self, note_id: str) -> Dict:
+        """Получает поля заметки из метаданных (без содержимого)"""
+        with self._metadata_store.lock:
+            note_meta = self._load_metadata()["notes"].get(note_id, {})
+            return {
+                "id": note_id,
+                "title": note_meta.get("title", "Untitled"),
+                "tags": list(note_meta.get("tags", [])),
+                "type": note_meta.get("type", "text"),
+                "created": note_meta.get("created", ""),
+                "modified": note_meta.get("modified", ""),
+                "version": note_meta.get("version", 0)
+            }
+    
+    def is_large_note(self, note_id: str) -> bool:
+        """Проверяет, что файл заметки лучше отдавать потоком"""
+        try:
+            return self._get_file_path(note_id).stat().st_size > STREAM_NOTE_THRESHOLD
+        except OSError:
+            return False
+    
+    def get_note_stream(self, note_id: str) -> Optional[Tuple[Dict, Iterator[str]]]:
+        """
+        Получает заметку с содержимым в виде потока кусков текста
+        
+        Первый сегмент расшифровывается сразу, поэтому неверный пароль
+        обнаруживается до начала ответа клиенту.
+        
+        Args:
+            note_id: ID заметки
+            
+        Returns:
+            (поля заметки без содержимого, итератор кусков содержимого) или None
+        """
+        if not self.encryption_manager:
+            raise ValueError("EncryptionManager не установлен")
+        
+        file_path = self._get_file_path(note_id)
+        if not file_path.exists():
+            return None
+        
+        chunks = self._iter_encrypted(file_path)
+        try:
+            first = next(chunks, "")
+        except ValueError as e:
+            raise ValueError(f"{e} (файл: {note_id}.enc)")
+        
+        def content():
+            yield first
+            yield from chunks
+        
+        return self._get_note_fields(note_id), content()
+    
     def update_note(self, note_id: str, title: Optional[str] = None, content: Optional[str] = None, tags: Optional[List[str]] = None) -> bool:
         """
         Обновляет заметку
@@ -187,107 +477,835 @@ class FileManager:
             return False
         
         try:
+            self._write_note(note_id, title, content, tags)
+            return True
+        except Exception as e:
+            print(f"Ошибка обновления заметки {note_id}: {e}")
+            return False
+    
+    def _write_note(self, note_id: str, title: Optional[str], content: Optional[str], tags: Optional[List[str]]) -> int:
+        """
+        Сохраняет изменения заметки и увеличивает ее версию при смене содержимого
+        
+        Args:
+            note_id: ID заметки
+            title: Новый заголовок (опционально)
+            content: Новое содержимое (опционально)
+            tags: Новые теги (опционально)
+            
+        Returns:
+            Версия заметки после изменения
+        """
+        file_path = self._get_file_path(note_id)
+        attachments_dropped = False
+        
+        # Запись файла и смена версии под блокировкой файла заметки: версию содержимого
+        # меняют только ее держатели. Новая версия записывается в metadata.json до снятия
+        # блокировки, поэтому PATCH в любом воркере сравнивает base_version с ней.
+        # Общая блокировка метаданных берется лишь на обновление метаданных
+        with file_lock(file_path):
+            # Заметку могли удалить, пока ждали блокировку: файл без метаданных не пишем
+            with self._metadata_store.lock:
+                if note_id not in self._load_metadata()["notes"]:
+                    self._content_cache.discard(note_id)
+                    return 0
+            
             # Если обновляется содержимое, перешифровываем
             if content is not None:
-                encrypted_content = self.encryption_manager.encrypt(content)
-                with open(file_path, 'w', encoding='utf-8') as f:
-                    f.write(encrypted_content)
+                self._write_encrypted(file_path, content)
+                stamp = self._get_file_stamp(file_path)
             
             # Обновляем метаданные
-            metadata = self._load_metadata()
-            if note_id in metadata["notes"]:
+            with self._metadata_store.lock:
+                metadata = self._load_metadata()
+                note_meta = metadata["notes"].get(note_id)
+                if note_meta is None:
+                    self._content_cache.discard(note_id)
+                    return 0
                 if title is not None:
-                    metadata["notes"][note_id]["title"] = title
+                    note_meta["title"] = title
                 if tags is not None:
-                    metadata["notes"][note_id]["tags"] = tags
-                metadata["notes"][note_id]["modified"] = self._get_timestamp()
+                    note_meta["tags"] = tags
+                    self._get_tag_index().set_tags(note_id, tags)
+                if content is not None:
+                    attachments_dropped = self._set_attachment_refs(note_meta, content)
+                    note_meta["version"] = note_meta.get("version", 0) + 1
+                    # Сквозная запись: следующее открытие не расшифровывает только что сохраненное
+                    self._content_cache.put(note_id, stamp, note_meta["version"], content)
+                self._touch_note(note_id, note_meta)
+                version = note_meta.get("version", 0)
                 self._save_metadata(metadata)
             
+            if content is not None:
+                # Отложенной записи не ждем: другие воркеры увидят версию после снятия блокировки
+                self._metadata_store.flush()
+            self._change_feed.publish("note", "updated", note_id)
+            if content is not None:
+                self._index_note(note_id, content)
+        
+        if attachments_dropped:
+            self.collect_attachment_garbage()
+        
+        return version
+    
+    def get_note_info(self, note_id: str) -> Optional[Dict]:
+        """
+        Получает поля заметки с версией, не расшифровывая содержимое
+        
+        Args:
+            note_id: ID заметки
+            
+        Returns:
+            Словарь с полями заметки или None
+        """
+        with self._metadata_store.lock:
+            if note_id not in self._load_metadata()["notes"]:
+                return None
+            return self._get_note_fields(note_id)
+    
+    def patch_note(self, note_id: str, base_version: int, ops: Optional[List[Dict]] = None,
+                   json_patch: Optional[List[Dict]] = None, title: Optional[str] = None,
+                   tags: Optional[List[str]] = None) -> Optional[int]:
+        """
+        Применяет изменения к заметке относительно известной клиенту версии
+        
+        Args:
+            note_id: ID заметки
+            base_version: Версия, относительно которой сделаны изменения
+            ops: Правки текста {pos, delete, insert} (для текстовых заметок)
+            json_patch: Операции JSON Patch (для холстов и канбанов)
+            title: Новый заголовок (опционально)
+            tags: Новые теги (опционально)
+            
+        Returns:
+            Новая версия заметки или None, если заметка не найдена
+        """
+        if not self.encryption_manager:
+            raise ValueError("EncryptionManager не установлен")
+        
+        file_path = self._get_file_path(note_id)
+        # Блокировка файла заметки держится от проверки версии до записи (см. _write_note),
+        # расшифровка основы и шифрование идут без общей блокировки метаданных.
+        # load() перечитывает metadata.json, если его записал другой воркер,
+        # поэтому версия здесь - последняя записанная под этой блокировкой
+        with file_lock(file_path):
+            with self._metadata_store.lock:
+                note_meta = self._load_metadata()["notes"].get(note_id)
+                if note_meta is None or not file_path.exists():
+                    return None
+                version = note_meta.get("version", 0)
+            
+            if version != base_version:
+                raise VersionConflict(version)
+            
+            content = None
+            if ops or json_patch:
+                cached = self._content_cache.get(note_id, self._get_file_stamp(file_path))
+                if cached is not None and cached[0] == version:
+                    base = cached[1]
+                else:
+                    base = self._read_note_content(note_id)
+                
+                content = apply_text_ops(base, ops) if ops else base
+                if json_patch:
+                    content = apply_json_patch(content, json_patch)
+            
+            return self._write_note(note_id, title, content, tags)
+    
+    def delete_note(self, note_id: str) -> bool:
+        """
+        Удаляет заметку
+        
+        Args:
+            note_id: ID заметки
+            
+        Returns:
+            True если успешно
+        """
+        try:
+            file_path = self._get_file_path(note_id)
+            attachments_dropped = False
+            deleted = False
+            # Файл и метаданные удаляются под блокировкой файла заметки: запись, ждущая
+            # эту блокировку, увидит, что заметки нет, и не создаст файл заново.
+            # Файл блокировки не удаляется - его может ждать другой поток или процесс
+            with file_lock(file_path):
+                if file_path.exists():
+                    file_path.unlink()
+                
+                # Удаляем из метаданных
+                with self._metadata_store.lock:
+                    metadata = self._load_metadata()
+                    if note_id in metadata["notes"]:
+                        attachments_dropped = bool(metadata["notes"][note_id].get("attachments"))
+                        del metadata["notes"][note_id]
+                        self._get_link_index().remove_note(note_id)
+                        self._get_tag_index().remove_note(note_id)
+                        self._get_order_index().remove_note(note_id)
+                        self._save_metadata(metadata)
+                        deleted = True
+                if deleted:
+                    # Другие воркеры проверяют заметку по metadata.json под этой блокировкой
+                    self._metadata_store.flush()
+            
+            if deleted:
+                self._change_feed.publish("note", "deleted", note_id)
+            self._unindex_note(note_id)
+            self._content_cache.discard(note_id)
+            if attachments_dropped:
+                self.collect_attachment_garbage()
+            
             return True
         except Exception as e:
-            print(f"Ошибка обновления заметки {note_id}: {e}")
+            print(f"Ошибка удаления заметки {note_id}: {e}")
             return False
     
-    def delete_note(self, note_id: str) -> bool:
+    # ========== ВЛОЖЕНИЯ ==========
+    
+    def _get_attachment_store(self) -> AttachmentStore:
+        """Получает хранилище вложений (создается при первом обращении)"""
+        if not self.encryption_manager:
+            raise ValueError("EncryptionManager не установлен")
+        if self._attachment_store is None:
+            self._attachment_store = AttachmentStore(self.attachments_dir, self.encryption_manager)
+        return self._attachment_store
+    
+    def _set_attachment_refs(self, note_meta: Dict, content: str) -> bool:
+        """
+        Обновляет ссылки заметки на вложения (вызывается под self._metadata_store.lock)
+        
+        Args:
+            note_meta: Метаданные заметки
+            content: Новое содержимое заметки
+            
+        Returns:
+            True если заметка перестала ссылаться на какое-то вложение
+        """
+        old_refs = set(note_meta.get("attachments", []))
+        new_refs = extract_attachment_refs(content)
+        if new_refs:
+            note_meta["attachments"] = new_refs
+        else:
+            note_meta.pop("attachments", None)
+        return bool(old_refs - set(new_refs))
+    
+    def save_attachment(self, src: BinaryIO, mime_type: str = "application/octet-stream") -> Dict:
+        """
+        Сохраняет вложение (одинаковое содержимое хранится один раз)
+        
+        Args:
+            src: Файловый объект с содержимым
+            mime_type: MIME-тип содержимого
+            
+        Returns:
+            Словарь с id, size и mime вложения
+        """
+        attachment_id, size = self._get_attachment_store().save(src)
+        
+        with self._metadata_store.lock:
+            metadata = self._load_metadata()
+            attachments = metadata.setdefault("attachments", {})
+            if attachment_id not in attachments:
+                attachments[attachment_id] = {
+                    "mime": mime_type,
+                    "size": size,
+                    "created": self._get_timestamp()
+                }
+                self._save_metadata(metadata)
+            info = dict(attachments[attachment_id])
+        
+        info["id"] = attachment_id
+        return info
+    
+    def get_attachment(self, attachment_id: str) -> Optional[Tuple[Dict, Iterator[bytes]]]:
+        """
+        Получает вложение
+        
+        Args:
+            attachment_id: ID вложения
+            
+        Returns:
+            (информация о вложении, итератор сегментов содержимого) или None
+        """
+        store = self._get_attachment_store()
+        if not store.exists(attachment_id):
+            return None
+        
+        with self._metadata_store.lock:
+            info = dict(self._load_metadata().get("attachments", {}).get(attachment_id, {}))
+        info.setdefault("mime", "application/octet-stream")
+        info["id"] = attachment_id
+        
+        # Первый сегмент расшифровываем сразу, чтобы ошибка ключа была до начала ответа
+        chunks = store.open(attachment_id)
+        first = next(chunks, b"")
+        
+        def content():
+            yield first
+            yield from chunks
+        
+        return info, content()
+    
+    def collect_attachment_garbage(self) -> int:
+        """
+        Удаляет вложения, на которые не ссылается ни одна заметка
+        
+        Returns:
+            Количество удаленных вложений
+        """
+        try:
+            with self._metadata_store.lock:
+                metadata = self._load_metadata()
+                referenced = set()
+                for note_data in metadata["notes"].values():
+                    referenced.update(note_data.get("attachments", []))
+            
+            removed = self._get_attachment_store().collect_garbage(referenced)
+            if removed:
+                with self._metadata_store.lock:
+                    metadata = self._load_metadata()
+                    attachments = metadata.get("attachments", {})
+                    for attachment_id in removed:
+                        attachments.pop(attachment_id, None)
+                    self._save_metadata(metadata)
+            return len(removed)
+        except Exception as e:
+            print(f"Ошибка сборки мусора вложений: {e}")
+            return 0
+    
+    def _get_note_summary(self, note_id: str, note_data: Dict, fields: Optional[List[str]] = None) -> Dict:
+        """
+        Получает поля заметки для списка
+        
+        Args:
+            note_id: ID заметки
+            note_data: Метаданные заметки
+            fields: Нужные поля (None - все поля списка); id есть всегда
+            
+        Returns:
+            Словарь полей заметки
+        """
+        summary = {
+            "id": note_id,
+            "title": note_data.get("title", "Untitled"),
+            "tags": note_data.get("tags", []),
+            "type": note_data.get("type", "text"),
+            "created": note_data.get("created", ""),
+            "modified": note_data.get("modified", "")
+        }
+        if fields is not None:
+            summary = {key: value for key, value in summary.items() if key == "id" or key in fields}
+        return summary
+    
+    def list_notes(self, tags: Optional[List[str]] = None, match_all: bool = True) -> List[Dict]:
+        """
+        Получает список всех заметок или заметок с тегами (новые первыми)
+        
+        Args:
+            tags: Фильтр по тегам (None - без фильтра)
+            match_all: True - нужны все теги фильтра, False - любой из них
+            
+        Returns:
+            Список словарей с метаданными заметок
+        """
+        return self.list_notes_page(tags=tags, match_all=match_all, limit=None)["notes"]
+    
+    def list_notes_page(self, sort: str = "modified", descending: bool = True, limit: Optional[int] = 50,
+                        cursor: Optional[str] = None, fields: Optional[List[str]] = None,
+                        tags: Optional[List[str]] = None, match_all: bool = True) -> Dict:
+        """
+        Получает страницу списка заметок по курсору
+        
+        Порядок берется из поддерживаемого индекса (без сортировки всех заметок
+        на каждый запрос). Курсор - позиция последней заметки страницы, поэтому
+        добавление и удаление заметок не сдвигает следующие страницы.
+        
+        Args:
+            sort: Поле сортировки (modified, created, title)
+            descending: True - по убыванию
+            limit: Размер страницы (None - все)
+            cursor: Курсор из next_cursor предыдущей страницы
+            fields: Нужные поля заметок (None - все)
+            tags: Фильтр по тегам
+            match_all: True - нужны все теги фильтра, False - любой из них
+            
+        Returns:
+            {notes, total, next_cursor}; next_cursor None на последней странице
+            
+        Raises:
+            ValueError: Неизвестное поле сортировки или неверный курсор
+        """
+        if sort not in SORT_FIELDS:
+            raise ValueError(f"Неизвестное поле сортировки: {sort}")
+        after = self._decode_cursor(cursor, sort, descending) if cursor else None
+        
+        with self._metadata_store.lock:
+            notes = self._load_metadata()["notes"]
+            order_index = self._get_order_index()
+            note_ids = None
+            if tags:
+                # По индексу тегов: сортируется только найденный набор, а не все заметки
+                note_ids = self._get_tag_index().find(tags, match_all=match_all)
+            total = len(order_index) if note_ids is None else len(note_ids)
+            
+            # Берем на одну заметку больше, чтобы понять, есть ли следующая страница
+            page_ids = order_index.page(sort, descending, after=after,
+                                        limit=None if limit is None else limit + 1, note_ids=note_ids)
+            has_more = limit is not None and len(page_ids) > limit
+            page_ids = page_ids[:limit] if limit is not None else page_ids
+            
+            page = [self._get_note_summary(note_id, notes[note_id], fields)
+                    for note_id in page_ids if note_id in notes]
+            next_cursor = None
+            if has_more and page_ids:
+                position = order_index.get_position(page_ids[-1], sort)
+                next_cursor = self._encode_cursor(sort, descending, position)
+        
+        return {"notes": page, "total": total, "next_cursor": next_cursor}
+    
+    @staticmethod
+    def _encode_cursor(sort: str, descending: bool, position: Tuple[str, str]) -> str:
+        """Кодирует позицию в списке в непрозрачный курсор"""
+        raw = json.dumps([sort, descending, position[0], position[1]], ensure_ascii=False)
+        return base64.urlsafe_b64encode(raw.encode('utf-8')).decode('ascii').rstrip("=")
+    
+    @staticmethod
+    def _decode_cursor(cursor: str, sort: str, descending: bool) -> Tuple[str, str]:
+        """Декодирует курсор; курсор другой сортировки считается неверным"""
+        try:
+            padded = cursor + "=" * (-len(cursor) % 4)
+            cursor_sort, cursor_descending, key, note_id = json.loads(base64.urlsafe_b64decode(padded))
+        except Exception:
+            raise ValueError("Неверный курсор")
+        if cursor_sort != sort or cursor_descending != descending:
+            raise ValueError("Курсор относится к другой сортировке")
+        return str(key), str(note_id)
+    
+    def get_tag_counts(self) -> List[Dict]:
+        """
+        Получает все теги с количеством заметок
+        
+        Returns:
+            Список {tag, count}, самые частые теги первыми
+        """
+        with self._metadata_store.lock:
+            counts = self._get_tag_index().get_counts()
+        return [{"tag": tag, "count": count}
+                for tag, count in sorted(counts.items(), key=lambda item: (-item[1], item[0]))]
+    
+    def get_titles(self, note_ids: List[str]) -> Dict[str, str]:
+        """
+        Получает заголовки нескольких заметок за одно обращение к метаданным
+        
+        Args:
+            note_ids: Список ID заметок
+            
+        Returns:
+            Словарь {id: заголовок} только для существующих заметок
+        """
+        with self._metadata_store.lock:
+            notes = self._load_metadata()["notes"]
+            titles = {}
+            for note_id in note_ids:
+                note_data = notes.get(note_id)
+                if note_data is not None:
+                    titles[note_id] = note_data.get("title", "Untitled")
+        return titles
+    
+    def search_notes(self, query: str, limit: Optional[int] = None, offset: int = 0) -> List[Dict]:
+        """
+        Ищет заметки по заголовку, тегам и содержимому, лучшие первыми
+        
+        Args:
+            query: Поисковый запрос
+            limit: Максимальное количество результатов (None - все)
+            offset: Сколько лучших результатов пропустить
+            
+        Returns:
+            Список найденных заметок
+        """
+        return self.rank_notes(query, limit=limit, offset=offset)[1]
+    
+    def rank_notes(self, query: str, limit: Optional[int] = None, offset: int = 0) -> Tuple[int, List[Dict]]:
+        """
+        Ищет заметки с ранжированием BM25 (заголовок, теги, содержимое)
+        
+        Слова запроса приводятся к основе, последнее слово ищется и как префикс.
+        Запрос без букв и цифр ищется подстрокой, в порядке изменения.
+        
+        Args:
+            query: Поисковый запрос
+            limit: Максимальное количество результатов (None - все)
+            offset: Сколько лучших результатов пропустить
+            
+        Returns:
+            (всего найдено, заметки страницы с полем score)
+        """
+        if not self.encryption_manager:
+            return 0, []
+        
+        if not any(char.isalnum() for char in query):
+            # Запрос без букв и цифр (например, "->") ищем подстрокой
+            results = self._search_notes_substring(query)
+            end = None if limit is None else offset + limit
+            return len(results), results[offset:end]
+        
+        rank_index = self._sync_rank_index()
+        if limit is None:
+            limit = len(rank_index.note_ids())
+        total, ranked = rank_index.search(query, limit=limit, offset=offset)
+        
+        # Метаданные нужны только заметкам страницы
+        results = []
+        with self._metadata_store.lock:
+            notes = self._load_metadata()["notes"]
+            for note_id, score in ranked:
+                note_data = notes.get(note_id)
+                if note_data is not None:
+                    results.append(dict(self._get_note_summary(note_id, note_data), score=round(score, 4)))
+        return total, results
+    
+    def _get_changed_notes(self, after: Optional[int]) -> Optional[set]:
+        """
+        Получает ID заметок, измененных после события after (по ленте изменений)
+        
+        Args:
+            after: Номер последнего учтенного события (None - еще не синхронизировались)
+            
+        Returns:
+            Множество ID или None, если нужна полная сверка (первая синхронизация
+            или события уже удалены из журнала)
+        """
+        if after is None:
+            return None
+        events, reset = self._change_feed.read(after)
+        if reset:
+            return None
+        return {event["id"] for event in events if event.get("type") == "note" and event.get("id")}
+    
+    def _sync_rank_index(self) -> RankIndex:
+        """
+        Приводит индекс ранжирования в соответствие с поисковым индексом и метаданными
+        
+        Сверяются только заметки из новых событий ленты изменений; все заметки -
+        при первом запросе, после сброса ленты или перечитывания метаданных с
+        диска (заголовки и теги, измененные другим процессом). Переиндексируются
+        только заметки, у которых изменились файл, заголовок или теги.
+        
+        Returns:
+            Актуальный индекс ранжирования
+        """
+        seq = self._change_feed.last_seq()
+        changed = self._get_changed_notes(self._rank_seq)
+        search_index = self._sync_search_index()
+        with self._metadata_store.lock:
+            metadata_notes = self._load_metadata()["notes"]
+            # Объект живет, пока метаданные не перечитаны с диска
+            stamp = self._metadata_store.get_index("rank_stamp", lambda data: object())
+            if stamp is not self._rank_stamp:
+                changed = None
+            note_ids = set(metadata_notes) | set(self._rank_versions) if changed is None else changed
+            notes = {note_id: (metadata_notes[note_id].get("title", ""), tuple(metadata_notes[note_id].get("tags", [])))
+                     for note_id in note_ids if note_id in metadata_notes}
+        
+        for note_id in note_ids - set(notes):
+            if note_id in self._rank_versions:
+                self._rank_index.remove(note_id)
+                del self._rank_versions[note_id]
+        
+        for note_id, (title, tags) in notes.items():
+            version = (search_index.get_mtime(note_id), title, tags)
+            if self._rank_versions.get(note_id) == version:
+                continue
+            self._rank_index.update(note_id, {
+                "title": title,
+                "tags": " ".join(tags),
+                "body": search_index.get_token_text(note_id) or ""
+            })
+            self._rank_versions[note_id] = version
+        
+        self._rank_seq = seq
+        self._rank_stamp = stamp
+        return self._rank_index
+    
+    def _search_notes_substring(self, query: str) -> List[Dict]:
+        """
+        Ищет заметки по вхождению подстроки в заголовок или содержимое
+        
+        Args:
+            query: Поисковый запрос
+            
+        Returns:
+            Список найденных заметок в порядке изменения
+        """
+        query_lower = query.lower()
+        results = []
+        
+        index = self._sync_search_index()
+        candidates = index.candidates(query_lower)
+        
+        for note_meta in self.list_notes():
+            # Ищем в заголовке
+            if query_lower in note_meta["title"].lower():
+                results.append(note_meta)
+                continue
+            
+            # Ищем в содержимом (по позициям в индексе, без расшифровки заметок)
+            if note_meta["id"] in candidates and self._find_in_index(index, note_meta["id"], query_lower):
+                results.append(note_meta)
+        
+        return results
+    
+    def search_notes_full(self, query: str, limit: Optional[int] = None,
+                          max_matches: int = MAX_MATCHES_PER_NOTE) -> List[Dict]:
+        """
+        Ищет заметки и возвращает позиции совпадений для подсветки
+        
+        Args:
+            query: Поисковый запрос
+            limit: Максимальное количество результатов
+            max_matches: Максимальное количество совпадений в содержимом одной заметки
+            
+        Returns:
+            Список {id, title, tags, matches, match_count}
+        """
+        return list(self.iter_search_full(query, limit=limit, max_matches=max_matches))
+    
+    def iter_search_full(self, query: str, limit: Optional[int] = None,
+                         cancel_event: Optional[threading.Event] = None,
+                         max_matches: int = MAX_MATCHES_PER_NOTE) -> Iterator[Dict]:
+        """
+        Ищет заметки и отдает результаты по одному, как только заметка совпала
+        
+        В содержимом возвращаются только первые max_matches совпадений,
+        match_count - сколько их всего; остальные - через get_note_matches.
+        
+        Args:
+            query: Поисковый запрос
+            limit: Максимальное количество результатов
+            cancel_event: Событие отмены: поиск прекращается перед следующей заметкой
+            max_matches: Максимальное количество совпадений в содержимом одной заметки
+            
+        Returns:
+            Итератор {id, title, tags, matches, match_count}
+        """
+        if not self.encryption_manager or limit == 0:
+            return
+        
+        query_lower = query.lower()
+        found = 0
+        
+        index = self._sync_search_index()
+        candidates = index.candidates(query_lower)
+        
+        for note_meta in self.list_notes():
+            if cancel_event is not None and cancel_event.is_set():
+                return
+            
+            matches = []
+            match_count = 0
+            
+            # Ищем в заголовке
+            title_lower = note_meta["title"].lower()
+            if query_lower in title_lower:
+                start = title_lower.find(query_lower)
+                matches.append({
+                    "field": "title",
+                    "start": start,
+                    "end": start + len(query_lower),
+                    "text": note_meta["title"]
+                })
+            
+            # Ищем в содержимом; расшифровывается только заметка с совпадениями - для контекста
+            if note_meta["id"] in candidates:
+                positions = self._find_in_index(index, note_meta["id"], query_lower)
+                match_count = len(positions)
+                if positions:
+                    content = self._get_search_content(note_meta["id"]) or ""
+                    matches.extend(make_matches(content, positions[:max_matches], len(query_lower)))
+            
+            if matches:
+                yield {
+                    "id": note_meta["id"],
+                    "title": note_meta["title"],
+                    "tags": note_meta.get("tags", []),
+                    "matches": matches,
+                    "match_count": match_count
+                }
+                found += 1
+                if limit is not None and found >= limit:
+                    return
+    
+    def get_note_matches(self, note_id: str, query: str, offset: int = 0,
+                         limit: int = MAX_MATCHES_PER_NOTE) -> Optional[Dict]:
+        """
+        Получает окно совпадений запроса в содержимом одной заметки
+        
+        Args:
+            note_id: ID заметки
+            query: Поисковый запрос
+            offset: Сколько первых совпадений пропустить
+            limit: Размер окна
+            
+        Returns:
+            {matches, total, offset, limit} или None, если заметки нет
+        """
+        if not self.encryption_manager:
+            return None
+        
+        with self._metadata_store.lock:
+            if note_id not in self._load_metadata()["notes"]:
+                return None
+        
+        query_lower = query.lower()
+        index = self._sync_search_index()
+        positions = self._find_in_index(index, note_id, query_lower)
+        window = positions[offset:offset + limit]
+        content = (self._get_search_content(note_id) or "") if window else ""
+        return {
+            "matches": make_matches(content, window, len(query_lower)),
+            "total": len(positions),
+            "offset": offset,
+            "limit": limit
+        }
+    
+    # ========== МЕТОДЫ ДЛЯ РАБОТЫ С ПОИСКОВЫМ ИНДЕКСОМ ==========
+    
+    def _get_search_index(self) -> SearchIndex:
+        """Получает поисковый индекс, загружая его с диска при первом обращении"""
+        if self._search_index is None:
+            index = SearchIndex(self.search_index_dir, self.encryption_manager)
+            index.load()
+            self._search_index = index
+            try:
+                self.legacy_search_index_file.unlink()
+            except FileNotFoundError:
+                pass
+            except OSError as e:
+                print(f"Ошибка удаления старого поискового индекса: {e}")
+        return self._search_index
+    
+    def _get_search_content(self, note_id: str) -> Optional[str]:
         """
-        Удаляет заметку
+        Получает содержимое заметки для контекста совпадений (индекс текст не хранит)
         
         Args:
             note_id: ID заметки
             
         Returns:
-            True если успешно
+            Содержимое или None, если заметку не удалось прочитать
         """
         try:
-            file_path = self._get_file_path(note_id)
-            if file_path.exists():
-                file_path.unlink()
-            
-            # Удаляем из метаданных
-            metadata = self._load_metadata()
-            if note_id in metadata["notes"]:
-                del metadata["notes"][note_id]
-                self._save_metadata(metadata)
-            
-            return True
+            note = self.get_note(note_id)
         except Exception as e:
-            print(f"Ошибка удаления заметки {note_id}: {e}")
-            return False
+            print(f"Ошибка чтения заметки {note_id} для поиска: {e}")
+            return None
+        return note["content"] if note else None
     
-    def list_notes(self) -> List[Dict]:
+    def _find_in_index(self, index: SearchIndex, note_id: str, query_lower: str) -> List[int]:
         """
-        Получает список всех заметок
+        Находит позиции вхождений запроса в содержимое заметки
         
+        Args:
+            index: Поисковый индекс
+            note_id: ID заметки
+            query_lower: Запрос в нижнем регистре
+            
         Returns:
-            Список словарей с метаданными заметок
+            Отсортированные позиции вхождений
         """
-        metadata = self._load_metadata()
-        notes = []
-        for note_id, note_data in metadata["notes"].items():
-            notes.append({
-                "id": note_id,
-                "title": note_data.get("title", "Untitled"),
-                "tags": note_data.get("tags", []),
-                "type": note_data.get("type", "text"),
-                "created": note_data.get("created", ""),
-                "modified": note_data.get("modified", "")
-            })
-        # Сортируем по дате изменения (новые первыми)
-        notes.sort(key=lambda x: x.get("modified", ""), reverse=True)
-        return notes
+        # Запрос без букв и цифр по позициям токенов не проверить - нужен текст
+        text = self._get_search_content(note_id) if index.needs_text(query_lower) else None
+        return index.match_positions(note_id, query_lower, text)
     
-    def search_notes(self, query: str) -> List[Dict]:
+    def _index_note(self, note_id: str, content: str):
         """
-        Ищет заметки по содержимому
+        Обновляет поисковый индекс после записи заметки
         
         Args:
-            query: Поисковый запрос
-            
-        Returns:
-            Список найденных заметок
+            note_id: ID заметки
+            content: Новое содержимое заметки
         """
-        if not self.encryption_manager:
-            return []
+        # Если индекса еще нет, он будет построен при первом поиске
+        if not self.search_index_dir.exists():
+            return
         
-        query_lower = query.lower()
-        results = []
+        try:
+            # Сохранение отложенное: индекс записывается таймером или при закрытии сессии
+            index = self._get_search_index()
+            index.update(note_id, content, self._get_file_mtime(self._get_file_path(note_id)))
+        except Exception as e:
+            print(f"Ошибка обновления поискового индекса для заметки {note_id}: {e}")
+    
+    def _unindex_note(self, note_id: str):
+        """
+        Удаляет заметку из поискового индекса
         
-        # Получаем все заметки
-        all_notes = self.list_notes()
+        Args:
+            note_id: ID заметки
+        """
+        if not self.search_index_dir.exists():
+            return
         
-        for note_meta in all_notes:
-            note = self.get_note(note_meta["id"])
-            if note:
-                # Ищем в заголовке
-                if query_lower in note["title"].lower():
-                    results.append(note_meta)
-                    continue
-                
-                # Ищем в содержимом
-                if query_lower in note["content"].lower():
-                    results.append(note_meta)
+        try:
+            self._get_search_index().remove(note_id)
+        except Exception as e:
+            print(f"Ошибка обновления поискового индекса для заметки {note_id}: {e}")
+    
+    def _sync_search_index(self) -> SearchIndex:
+        """
+        Приводит поисковый индекс в соответствие с файлами заметок
         
-        return results
+        Свои изменения попадают в индекс сразу (_index_note), изменения других
+        сессий и процессов - по событиям ленты изменений: проверяются только
+        заметки из новых событий и еще не проиндексированные. Все файлы
+        сверяются по mtime только при первой синхронизации или сбросе ленты.
+        Расшифровываются только новые или измененные в обход индекса заметки.
+        
+        Returns:
+            Актуальный поисковый индекс
+        """
+        seq = self._change_feed.last_seq()
+        index = self._get_search_index()
+        changed = self._get_changed_notes(self._search_seq)
+        with self._metadata_store.lock:
+            metadata_ids = set(self._load_metadata()["notes"])
+        
+        if changed is None:
+            note_ids = metadata_ids
+            # Удаляем из индекса заметки, которых больше нет
+            for note_id in index.indexed_ids() - metadata_ids:
+                index.remove(note_id)
+        else:
+            # Заметка могла появиться в метаданных позже своего события (отложенная запись другого процесса)
+            note_ids = changed | (metadata_ids - index.indexed_ids())
+        
+        stale = {}
+        for note_id in note_ids:
+            file_path = self._get_file_path(note_id)
+            mtime = self._get_file_mtime(file_path)
+            if not mtime:
+                index.remove(note_id)
+                continue
+            if not index.is_current(note_id, mtime):
+                stale[note_id] = mtime
+        
+        # Измененные заметки расшифровываются параллельно в общем пуле,
+        # индекс обновляется в этом потоке
+        for note_id, note, error in self.get_notes_batch(stale):
+            if note is not None:
+                index.update(note_id, note["content"], stale[note_id])
+            elif error is not None:
+                # Заметка зашифрована другим паролем или повреждена - не ищем по ней до изменения файла
+                print(f"Ошибка индексации заметки {note_id}: {error}")
+                index.mark_unreadable(note_id, stale[note_id])
+        
+        # Первое построение сохраняем сразу: после него изменения заметок попадают в индекс
+        if not index.exists():
+            index.save()
+        
+        self._search_seq = seq
+        return index
     
     def _get_timestamp(self) -> str:
         """Получает текущую временную метку"""
@@ -313,10 +1331,7 @@ class FileManager:
             return {}
         
         try:
-            with open(dict_file, 'r', encoding='utf-8') as f:
-                encrypted_content = f.read()
-            
-            decrypted_content = self.encryption_manager.decrypt(encrypted_content)
+            decrypted_content = self._read_encrypted(dict_file)
             return json.loads(decrypted_content)
         except Exception as e:
             print(f"Ошибка чтения словаря: {e}")
@@ -337,12 +1352,11 @@ class FileManager:
         
         try:
             dict_json = json.dumps(dictionary, ensure_ascii=False, indent=2)
-            encrypted_content = self.encryption_manager.encrypt(dict_json)
-            
             dict_file = self.get_dictionary_file()
-            with open(dict_file, 'w', encoding='utf-8') as f:
-                f.write(encrypted_content)
+            with file_lock(dict_file):
+                self._write_encrypted(dict_file, dict_json)
             
+            self._change_feed.publish("dictionary", "updated")
             return True
         except Exception as e:
             print(f"Ошибка сохранения словаря: {e}")
@@ -359,9 +1373,10 @@ class FileManager:
         Returns:
             True если успешно
         """
-        dictionary = self.get_dictionary()
-        dictionary[phrase] = value
-        return self.save_dictionary(dictionary)
+        with file_lock(self.get_dictionary_file()):
+            dictionary = self.get_dictionary()
+            dictionary[phrase] = value
+            return self.save_dictionary(dictionary)
     
     def get_phrase(self, phrase: str) -> Optional[str]:
         """
@@ -386,11 +1401,12 @@ class FileManager:
         Returns:
             True если успешно
         """
-        dictionary = self.get_dictionary()
-        if phrase in dictionary:
-            del dictionary[phrase]
-            return self.save_dictionary(dictionary)
-        return False
+        with file_lock(self.get_dictionary_file()):
+            dictionary = self.get_dictionary()
+            if phrase in dictionary:
+                del dictionary[phrase]
+                return self.save_dictionary(dictionary)
+            return False
     
     def list_phrases(self) -> List[Dict[str, str]]:
         """
@@ -414,10 +1430,12 @@ class FileManager:
         Returns:
             Список задач TODO
         """
-        metadata = self._load_metadata()
-        if note_id in metadata["notes"]:
-            return metadata["notes"][note_id].get("todos", [])
-        return []
+        with self._metadata_store.lock:
+            metadata = self._load_metadata()
+            if note_id in metadata["notes"]:
+                # Копия, чтобы изменения вызывающего кода не попадали в общий кеш
+                return copy.deepcopy(metadata["notes"][note_id].get("todos", []))
+            return []
     
     def save_note_todos(self, note_id: str, todos: List[Dict]) -> bool:
         """
@@ -431,13 +1449,16 @@ class FileManager:
             True если успешно
         """
         try:
-            metadata = self._load_metadata()
-            if note_id in metadata["notes"]:
+            with self._metadata_store.lock:
+                metadata = self._load_metadata()
+                if note_id not in metadata["notes"]:
+                    return False
                 metadata["notes"][note_id]["todos"] = todos
-                metadata["notes"][note_id]["modified"] = self._get_timestamp()
+                self._touch_note(note_id, metadata["notes"][note_id])
                 self._save_metadata(metadata)
-                return True
-            return False
+            
+            self._change_feed.publish("note", "updated", note_id)
+            return True
         except Exception as e:
             print(f"Ошибка сохранения TODO для заметки {note_id}: {e}")
             return False
@@ -446,6 +1467,10 @@ class FileManager:
         """Получает путь к файлу глобального TODO"""
         return self.notes_dir / "global_todos.enc"
     
+    def global_todos_lock(self):
+        """Блокировка файла глобального TODO для чтения-изменения-записи"""
+        return file_lock(self.get_global_todos_file())
+    
     def get_global_todos(self) -> List[Dict]:
         """
         Получает глобальный TODO из зашифрованного файла
@@ -461,10 +1486,7 @@ class FileManager:
             return []
         
         try:
-            with open(todos_file, 'r', encoding='utf-8') as f:
-                encrypted_content = f.read()
-            
-            decrypted_content = self.encryption_manager.decrypt(encrypted_content)
+            decrypted_content = self._read_encrypted(todos_file)
             return json.loads(decrypted_content)
         except Exception as e:
             print(f"Ошибка чтения глобального TODO: {e}")
@@ -485,12 +1507,10 @@ class FileManager:
         
         try:
             todos_json = json.dumps(todos, ensure_ascii=False, indent=2)
-            encrypted_content = self.encryption_manager.encrypt(todos_json)
-            
-            todos_file = self.get_global_todos_file()
-            with open(todos_file, 'w', encoding='utf-8') as f:
-                f.write(encrypted_content)
+            with self.global_todos_lock():
+                self._write_encrypted(self.get_global_todos_file(), todos_json)
             
+            self._change_feed.publish("todos", "updated")
             return True
         except Exception as e:
             print(f"Ошибка сохранения глобального TODO: {e}")
@@ -508,10 +1528,21 @@ class FileManager:
         Returns:
             Список ID связанных заметок
         """
-        metadata = self._load_metadata()
-        if note_id in metadata["notes"]:
-            return metadata["notes"][note_id].get("links", [])
-        return []
+        with self._metadata_store.lock:
+            return self._get_link_index().get_links(note_id)
+    
+    def get_note_backlinks(self, note_id: str) -> List[str]:
+        """
+        Получает список заметок, которые ссылаются на данную
+        
+        Args:
+            note_id: ID заметки
+            
+        Returns:
+            Список ID заметок с обратными ссылками
+        """
+        with self._metadata_store.lock:
+            return self._get_link_index().get_backlinks(note_id)
     
     def add_note_link(self, note_id: str, linked_note_id: str) -> bool:
         """
@@ -528,19 +1559,24 @@ class FileManager:
             return False  # Нельзя связать заметку с самой собой
         
         try:
-            metadata = self._load_metadata()
-            if note_id not in metadata["notes"]:
-                return False
-            
-            if "links" not in metadata["notes"][note_id]:
-                metadata["notes"][note_id]["links"] = []
-            
-            # Проверяем, что связи еще нет
-            if linked_note_id not in metadata["notes"][note_id]["links"]:
-                metadata["notes"][note_id]["links"].append(linked_note_id)
-                metadata["notes"][note_id]["modified"] = self._get_timestamp()
-                self._save_metadata(metadata)
-            
+            with self._metadata_store.lock:
+                metadata = self._load_metadata()
+                if note_id not in metadata["notes"]:
+                    return False
+                
+                if "links" not in metadata["notes"][note_id]:
+                    metadata["notes"][note_id]["links"] = []
+                
+                # Проверяем, что связи еще нет
+                changed = linked_note_id not in metadata["notes"][note_id]["links"]
+                if changed:
+                    metadata["notes"][note_id]["links"].append(linked_note_id)
+                    self._touch_note(note_id, metadata["notes"][note_id])
+                    self._get_link_index().set_links(note_id, metadata["notes"][note_id]["links"])
+                    self._save_metadata(metadata)
+            
+            if changed:
+                self._change_feed.publish("note", "updated", note_id)
             return True
         except Exception as e:
             print(f"Ошибка добавления связи: {e}")
@@ -558,18 +1594,23 @@ class FileManager:
             True если успешно
         """
         try:
-            metadata = self._load_metadata()
-            if note_id not in metadata["notes"]:
-                return False
-            
-            if "links" not in metadata["notes"][note_id]:
-                return False
-            
-            if linked_note_id in metadata["notes"][note_id]["links"]:
-                metadata["notes"][note_id]["links"].remove(linked_note_id)
-                metadata["notes"][note_id]["modified"] = self._get_timestamp()
-                self._save_metadata(metadata)
-            
+            with self._metadata_store.lock:
+                metadata = self._load_metadata()
+                if note_id not in metadata["notes"]:
+                    return False
+                
+                if "links" not in metadata["notes"][note_id]:
+                    return False
+                
+                changed = linked_note_id in metadata["notes"][note_id]["links"]
+                if changed:
+                    metadata["notes"][note_id]["links"].remove(linked_note_id)
+                    self._touch_note(note_id, metadata["notes"][note_id])
+                    self._get_link_index().set_links(note_id, metadata["notes"][note_id]["links"])
+                    self._save_metadata(metadata)
+            
+            if changed:
+                self._change_feed.publish("note", "updated", note_id)
             return True
         except Exception as e:
             print(f"Ошибка удаления связи: {e}")
@@ -587,17 +1628,20 @@ class FileManager:
             True если успешно
         """
         try:
-            metadata = self._load_metadata()
-            if note_id not in metadata["notes"]:
-                return False
-            
-            # Удаляем связи с самой собой
-            links = [link_id for link_id in links if link_id != note_id]
-            
-            metadata["notes"][note_id]["links"] = links
-            metadata["notes"][note_id]["modified"] = self._get_timestamp()
-            self._save_metadata(metadata)
+            with self._metadata_store.lock:
+                metadata = self._load_metadata()
+                if note_id not in metadata["notes"]:
+                    return False
+                
+                # Удаляем связи с самой собой
+                links = [link_id for link_id in links if link_id != note_id]
+                
+                metadata["notes"][note_id]["links"] = links
+                self._touch_note(note_id, metadata["notes"][note_id])
+                self._get_link_index().set_links(note_id, links)
+                self._save_metadata(metadata)
             
+            self._change_feed.publish("note", "updated", note_id)
             return True
         except Exception as e:
             print(f"Ошибка обновления связей: {e}")
@@ -607,34 +1651,131 @@ class FileManager:
         """
         Получает данные для графа заметок
         
+        Строится за один проход по кешу метаданных и индексу связей.
+        
         Returns:
             Словарь с nodes (заметки) и edges (связи)
         """
-        all_notes = self.list_notes()
         nodes = []
         edges = []
         
-        for note in all_notes:
-            nodes.append({
-                "id": note["id"],
-                "title": note["title"],
-                "tags": note.get("tags", []),
-                "type": note.get("type", "text")
-            })
-            
-            # Получаем связи
-            links = self.get_note_links(note["id"])
-            for linked_id in links:
-                edges.append({
-                    "source": note["id"],
-                    "target": linked_id
+        with self._metadata_store.lock:
+            notes = self._load_metadata()["notes"]
+            link_index = self._get_link_index()
+            
+            # Порядок узлов как в list_notes (новые первыми)
+            for note_id in self._get_order_index().page("modified"):
+                note_data = notes[note_id]
+                nodes.append({
+                    "id": note_id,
+                    "title": note_data.get("title", "Untitled"),
+                    "tags": note_data.get("tags", []),
+                    "type": note_data.get("type", "text")
                 })
+                
+                for linked_id in link_index.outgoing.get(note_id, ()):
+                    edges.append({
+                        "source": note_id,
+                        "target": linked_id
+                    })
         
         return {
             "nodes": nodes,
             "edges": edges
         }
     
+    def get_graph_etag(self) -> str:
+        """
+        Получает версию данных графа (меняется при любом изменении метаданных)
+        
+        Returns:
+            Строка для ETag
+        """
+        return f"graph-{self._metadata_store.version_tag}"
+    
+    def get_notes_etag(self) -> str:
+        """
+        Получает версию списка заметок (меняется при любом изменении метаданных)
+        
+        Returns:
+            Строка для ETag
+        """
+        return f"notes-{self._metadata_store.version_tag}"
+    
+    def get_note_etag(self, note_id: str) -> Optional[str]:
+        """
+        Получает версию заметки без расшифровки: отпечаток файла и поля из метаданных
+        
+        Args:
+            note_id: ID заметки
+            
+        Returns:
+            Строка для ETag или None, если файла заметки нет
+        """
+        stamp = self._get_file_stamp(self._get_file_path(note_id))
+        if stamp is None:
+            return None
+        with self._metadata_store.lock:
+            fields = json.dumps(self._get_note_fields(note_id), sort_keys=True, ensure_ascii=False)
+        return f"note-{stamp[0]:x}-{stamp[1]:x}-{zlib.crc32(fields.encode('utf-8')):08x}"
+    
+    def get_file_etag(self, file_path: Path) -> str:
+        """
+        Получает версию зашифрованного файла данных (календарь, словарь, TODO) без расшифровки
+        
+        Args:
+            file_path: Путь к файлу
+            
+        Returns:
+            Строка для ETag по отпечатку файла (mtime_ns, размер)
+        """
+        stamp = self._get_file_stamp(file_path)
+        if stamp is None:
+            return f"{file_path.stem}-none"
+        return f"{file_path.stem}-{stamp[0]:x}-{stamp[1]:x}"
+    
+    def get_home_etag(self) -> str:
+        """
+        Получает версию данных главной страницы (метаданные и журнал заходов)
+        
+        Returns:
+            Строка для ETag
+        """
+        return f"home-{self._metadata_store.version_tag}-{self._get_access_log().get_version()}"
+    
+    def get_home_data(self, sections: Iterable[str], recent_limit: int = 5, history_limit: int = 10) -> Dict:
+        """
+        Собирает данные главной страницы по одному снимку метаданных
+        
+        Все разделы строятся под одной блокировкой метаданных, поэтому граф,
+        последние заметки и статистика согласованы между собой.
+        
+        Args:
+            sections: Нужные разделы (graph, recent, history, stats)
+            recent_limit: Количество последних заметок
+            history_limit: Количество записей истории заходов
+            
+        Returns:
+            Словарь {раздел: данные} только с запрошенными разделами
+        """
+        sections = set(sections)
+        data = {}
+        with self._metadata_store.lock:
+            if "graph" in sections:
+                # Версия графа отдельно: клиент не сбрасывает раскладку, если изменилась только история
+                data["graph"] = self.get_graph_data()
+                data["graph"]["version"] = self.get_graph_etag()
+            if "recent" in sections:
+                data["recent"] = self.list_notes_page(limit=recent_limit, fields=["title", "modified"])["notes"]
+            if "stats" in sections:
+                data["stats"] = {
+                    "notes_count": len(self._get_order_index()),
+                    "tags_count": len(self._get_tag_index().get_counts())
+                }
+            if "history" in sections:
+                data["history"] = self.get_access_history_titled(history_limit)
+        return data
+    
     # ========== МЕТОДЫ ДЛЯ РАБОТЫ С КАЛЕНДАРЕМ ==========
     
     def get_calendar_file(self) -> Path:
@@ -656,10 +1797,7 @@ class FileManager:
             return {}
         
         try:
-            with open(calendar_file, 'r', encoding='utf-8') as f:
-                encrypted_content = f.read()
-            
-            decrypted_content = self.encryption_manager.decrypt(encrypted_content)
+            decrypted_content = self._read_encrypted(calendar_file)
             return json.loads(decrypted_content)
         except Exception as e:
             print(f"Ошибка чтения календаря: {e}")
@@ -680,12 +1818,11 @@ class FileManager:
         
         try:
             events_json = json.dumps(events, ensure_ascii=False, indent=2)
-            encrypted_content = self.encryption_manager.encrypt(events_json)
-            
             calendar_file = self.get_calendar_file()
-            with open(calendar_file, 'w', encoding='utf-8') as f:
-                f.write(encrypted_content)
+            with file_lock(calendar_file):
+                self._write_encrypted(calendar_file, events_json)
             
+            self._change_feed.publish("calendar", "updated")
             return True
         except Exception as e:
             print(f"Ошибка сохранения календаря: {e}")
@@ -702,12 +1839,13 @@ class FileManager:
         Returns:
             True если успешно
         """
-        events = self.get_calendar_events()
-        if date not in events:
-            events[date] = []
-        
-        events[date].append(event)
-        return self.save_calendar_events(events)
+        with file_lock(self.get_calendar_file()):
+            events = self.get_calendar_events()
+            if date not in events:
+                events[date] = []
+            
+            events[date].append(event)
+            return self.save_calendar_events(events)
     
     def update_calendar_event(self, date: str, event_id: str, event: Dict) -> bool:
         """
@@ -721,16 +1859,17 @@ class FileManager:
         Returns:
             True если успешно
         """
-        events = self.get_calendar_events()
-        if date not in events:
+        with file_lock(self.get_calendar_file()):
+            events = self.get_calendar_events()
+            if date not in events:
+                return False
+            
+            for i, e in enumerate(events[date]):
+                if e.get('id') == event_id:
+                    events[date][i] = event
+                    return self.save_calendar_events(events)
+            
             return False
-        
-        for i, e in enumerate(events[date]):
-            if e.get('id') == event_id:
-                events[date][i] = event
-                return self.save_calendar_events(events)
-        
-        return False
     
     def remove_calendar_event(self, date: str, event_id: str) -> bool:
         """
@@ -743,21 +1882,22 @@ class FileManager:
         Returns:
             True если успешно
         """
-        events = self.get_calendar_events()
-        if date not in events:
+        with file_lock(self.get_calendar_file()):
+            events = self.get_calendar_events()
+            if date not in events:
+                return False
+            
+            original_count = len(events[date])
+            events[date] = [e for e in events[date] if e.get('id') != event_id]
+            new_count = len(events[date])
+            
+            if new_count == 0:
+                del events[date]
+            
+            if new_count != original_count:
+                return self.save_calendar_events(events)
+            
             return False
-        
-        original_count = len(events[date])
-        events[date] = [e for e in events[date] if e.get('id') != event_id]
-        new_count = len(events[date])
-        
-        if new_count == 0:
-            del events[date]
-        
-        if new_count != original_count:
-            return self.save_calendar_events(events)
-        
-        return False
     
     def mark_day_important(self, date: str, important: bool = True) -> bool:
         """
@@ -770,32 +1910,33 @@ class FileManager:
         Returns:
             True если успешно
         """
-        events = self.get_calendar_events()
-        if date not in events:
-            events[date] = []
-        
-        # Ищем специальное событие для отметки важности
-        important_event = None
-        for event in events[date]:
-            if event.get('type') == 'important_marker':
-                important_event = event
-                break
-        
-        if important and not important_event:
-            # Добавляем маркер важности
-            import uuid
-            events[date].append({
-                'id': str(uuid.uuid4()),
-                'type': 'important_marker',
-                'important': True
-            })
-        elif not important and important_event:
-            # Удаляем маркер важности
-            events[date] = [e for e in events[date] if e.get('id') != important_event.get('id')]
-            if len(events[date]) == 0:
-                del events[date]
-        
-        return self.save_calendar_events(events)
+        with file_lock(self.get_calendar_file()):
+            events = self.get_calendar_events()
+            if date not in events:
+                events[date] = []
+            
+            # Ищем специальное событие для отметки важности
+            important_event = None
+            for event in events[date]:
+                if event.get('type') == 'important_marker':
+                    important_event = event
+                    break
+            
+            if important and not important_event:
+                # Добавляем маркер важности
+                import uuid
+                events[date].append({
+                    'id': str(uuid.uuid4()),
+                    'type': 'important_marker',
+                    'important': True
+                })
+            elif not important and important_event:
+                # Удаляем маркер важности
+                events[date] = [e for e in events[date] if e.get('id') != important_event.get('id')]
+                if len(events[date]) == 0:
+                    del events[date]
+            
+            return self.save_calendar_events(events)
     
     def is_day_important(self, date: str) -> bool:
         """
@@ -819,6 +1960,24 @@ class FileManager:
     
     # ========== МЕТОДЫ ДЛЯ РАБОТЫ С ИСТОРИЕЙ ЗАХОДОВ ==========
     
+    def _get_access_log(self) -> AccessLog:
+        """Получает журнал заходов, перенося в него старую историю из метаданных"""
+        if self._access_log is None:
+            access_log = AccessLog(self.access_log_file, self.access_log_retention)
+            
+            # Раньше история хранилась в metadata.json - переносим ее один раз
+            with self._metadata_store.lock:
+                metadata = self._load_metadata()
+                if 'access_history' in metadata:
+                    if access_log.is_empty():
+                        for entry in metadata['access_history']:
+                            access_log.append(entry)
+                    del metadata['access_history']
+                    self._save_metadata(metadata)
+            
+            self._access_log = access_log
+        return self._access_log
+    
     def log_access(self, note_id: str, action: str = 'open') -> bool:
         """
         Логирует действие с заметкой
@@ -831,24 +1990,14 @@ class FileManager:
             True если успешно
         """
         try:
-            metadata = self._load_metadata()
-            if 'access_history' not in metadata:
-                metadata['access_history'] = []
-            
             history_entry = {
                 'date': self._get_timestamp(),
                 'note_id': note_id,
                 'action': action
             }
             
-            metadata['access_history'].append(history_entry)
-            
-            # Ограничиваем историю последними 100 записями
-            if len(metadata['access_history']) > 100:
-                metadata['access_history'] = metadata['access_history'][-100:]
-            
-            self._save_metadata(metadata)
-            return True
+            # Дозапись в конец журнала, метаданные не трогаем
+            return self._get_access_log().append(history_entry)
         except Exception as e:
             print(f"Ошибка логирования доступа: {e}")
             return False
@@ -863,11 +2012,72 @@ class FileManager:
         Returns:
             Список записей истории
         """
-        metadata = self._load_metadata()
-        history = metadata.get('access_history', [])
+        # Читается только хвост журнала
+        return self._get_access_log().tail(limit)
+    
+    def get_access_history_titled(self, limit: int = 20) -> List[Dict]:
+        """
+        Получает историю заходов с названиями заметок
+        
+        Args:
+            limit: Максимальное количество записей
+            
+        Returns:
+            Список {date, action, note_id, note_title}
+        """
+        history = self.get_access_history(limit)
+        
+        # Названия берутся за одно обращение к метаданным
+        titles = self.get_titles([entry.get('note_id') for entry in history if entry.get('note_id')])
+        return [{
+            'date': entry.get('date'),
+            'action': entry.get('action'),
+            'note_id': entry.get('note_id'),
+            'note_title': titles.get(entry.get('note_id'), 'Удаленная заметка')
+        } for entry in history]
+    
+    # ========== ЛЕНТА ИЗМЕНЕНИЙ ==========
+    
+    def get_changes_cursor(self) -> int:
+        """Получает номер последнего события ленты изменений"""
+        return self._change_feed.last_seq()
+    
+    def wait_changes(self, after: int, timeout: float) -> Tuple[List[Dict], bool]:
+        """
+        Ждет изменений после номера after и дополняет события текущими данными
+        
+        Данные прикладываются только к последнему событию каждого объекта в
+        пачке: заметке - ее поля для списка (без содержимого), календарю и
+        глобальному TODO - расшифрованные данные целиком (один раз на пачку).
         
-        # Возвращаем последние записи
-        return history[-limit:] if len(history) > limit else history
+        Args:
+            after: Номер последнего полученного клиентом события
+            timeout: Наибольшее время ожидания (секунды)
+            
+        Returns:
+            (события {seq, type, action, id, date[, note|events|todos]}, reset);
+            reset=True - клиенту нужно загрузить данные заново
+        """
+        events, reset = self._change_feed.wait(after, timeout)
+        if not events:
+            return events, reset
+        
+        events = [dict(event) for event in events]
+        # Последнее событие каждого объекта {(тип, id): событие}
+        latest = {(event.get("type"), event.get("id")): event for event in events}
+        
+        with self._metadata_store.lock:
+            notes = self._load_metadata()["notes"]
+            for (kind, item_id), event in latest.items():
+                if kind == "note" and item_id in notes:
+                    event["note"] = self._get_note_summary(item_id, notes[item_id])
+        
+        # Расшифровка - вне блокировки метаданных
+        if ("calendar", None) in latest:
+            latest[("calendar", None)]["events"] = self.get_calendar_events()
+        if ("todos", None) in latest:
+            latest[("todos", None)]["todos"] = self.get_global_todos()
+        return events, False
     
     # ========== МЕТОДЫ ДЛЯ СВЯЗИ ЗАМЕТОК И КАЛЕНДАРЯ ==========
     
@@ -884,15 +2094,17 @@ class FileManager:
         """
         try:
             # Обновляем метаданные заметки
-            metadata = self._load_metadata()
-            if note_id not in metadata["notes"]:
-                return False
-            
-            metadata["notes"][note_id]["linked_date"] = date
-            self._save_metadata(metadata)
+            with self._metadata_store.lock:
+                metadata = self._load_metadata()
+                if note_id not in metadata["notes"]:
+                    return False
+                
+                metadata["notes"][note_id]["linked_date"] = date
+                self._save_metadata(metadata)
+                
+                note_title = metadata["notes"][note_id].get("title", "Без названия")
             
             # Добавляем событие в календарь
-            note_title = metadata["notes"][note_id].get("title", "Без названия")
             import uuid
             event = {
                 'id': f"note_link_{note_id}",
@@ -901,14 +2113,15 @@ class FileManager:
                 'note_title': note_title
             }
             
-            events = self.get_calendar_events()
-            if date not in events:
-                events[date] = []
-            
-            # Удаляем старую связь этой заметки если есть
-            events[date] = [e for e in events[date] if e.get('note_id') != note_id]
-            events[date].append(event)
-            self.save_calendar_events(events)
+            with file_lock(self.get_calendar_file()):
+                events = self.get_calendar_events()
+                if date not in events:
+                    events[date] = []
+                
+                # Удаляем старую связь этой заметки если есть
+                events[date] = [e for e in events[date] if e.get('note_id') != note_id]
+                events[date].append(event)
+                self.save_calendar_events(events)
             
             return True
         except Exception as e:
@@ -927,25 +2140,27 @@ class FileManager:
         """
         try:
             # Получаем текущую привязанную дату
-            metadata = self._load_metadata()
-            if note_id not in metadata["notes"]:
-                return False
-            
-            linked_date = metadata["notes"][note_id].get("linked_date")
-            
-            # Удаляем привязку из метаданных
-            if "linked_date" in metadata["notes"][note_id]:
-                del metadata["notes"][note_id]["linked_date"]
-                self._save_metadata(metadata)
+            with self._metadata_store.lock:
+                metadata = self._load_metadata()
+                if note_id not in metadata["notes"]:
+                    return False
+                
+                linked_date = metadata["notes"][note_id].get("linked_date")
+                
+                # Удаляем привязку из метаданных
+                if "linked_date" in metadata["notes"][note_id]:
+                    del metadata["notes"][note_id]["linked_date"]
+                    self._save_metadata(metadata)
             
             # Удаляем событие из календаря
             if linked_date:
-                events = self.get_calendar_events()
-                if linked_date in events:
-                    events[linked_date] = [e for e in events[linked_date] if e.get('note_id') != note_id]
-                    if len(events[linked_date]) == 0:
-                        del events[linked_date]
-                    self.save_calendar_events(events)
+                with file_lock(self.get_calendar_file()):
+                    events = self.get_calendar_events()
+                    if linked_date in events:
+                        events[linked_date] = [e for e in events[linked_date] if e.get('note_id') != note_id]
+                        if len(events[linked_date]) == 0:
+                            del events[linked_date]
+                        self.save_calendar_events(events)
             
             return True
         except Exception as e:
@@ -962,10 +2177,11 @@ class FileManager:
         Returns:
             Дата в формате YYYY-MM-DD или None
         """
-        metadata = self._load_metadata()
-        if note_id in metadata["notes"]:
-            return metadata["notes"][note_id].get("linked_date")
-        return None
+        with self._metadata_store.lock:
+            metadata = self._load_metadata()
+            if note_id in metadata["notes"]:
+                return metadata["notes"][note_id].get("linked_date")
+            return None
     
     def get_notes_for_date(self, date: str) -> List[Dict]:
         """
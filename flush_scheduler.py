@@ -0,0 +1,76 @@
+"""
+Отложенная запись на диск одним фоновым потоком
+"""
+import os
+import time
+import threading
+from typing import Any, Callable, Optional
+
+
+class FlushScheduler:
+    """
+    Вызывает функцию записи в фоновом потоке после назначенного срока
+    
+    Поток один на весь срок жизни объекта и создается при первом вызове
+    schedule: серия изменений только сдвигает срок и не запускает новые
+    потоки (в отличие от перезапуска threading.Timer на каждое изменение).
+    """
+    
+    def __init__(self, flush: Callable[[], Any], name: str):
+        """
+        Args:
+            flush: Функция записи (вызывается без блокировок планировщика)
+            name: Имя фонового потока
+        """
+        self._flush = flush
+        self._name = name
+        self._condition = threading.Condition()
+        # Монотонное время, когда нужно записать (None - записывать нечего)
+        self._deadline: Optional[float] = None
+        self._thread: Optional[threading.Thread] = None
+        self._pid = os.getpid()
+    
+    def schedule(self, delay: float):
+        """
+        Назначает запись через delay секунд (заменяет прежний срок)
+        
+        Args:
+            delay: Задержка записи
+        """
+        if self._pid != os.getpid():
+            # После fork (воркеры сервера) потока записи в дочернем процессе нет,
+            # а блокировку мог держать поток родителя
+            self._pid = os.getpid()
+            self._condition = threading.Condition()
+            self._thread = None
+        
+        with self._condition:
+            self._deadline = time.monotonic() + delay
+            if self._thread is None:
+                self._thread = threading.Thread(target=self._run, name=self._name, daemon=True)
+                self._thread.start()
+            self._condition.notify()
+    
+    def cancel(self):
+        """Отменяет назначенную запись (например, данные уже записаны)"""
+        with self._condition:
+            self._deadline = None
+    
+    def _run(self):
+        """Цикл фонового потока: ждет срока и вызывает запись"""
+        while True:
+            with self._condition:
+                while True:
+                    if self._deadline is None:
+                        self._condition.wait()
+                        continue
+                    remaining = self._deadline - time.monotonic()
+                    if remaining <= 0:
+                        break
+                    self._condition.wait(remaining)
+                self._deadline = None
+            
+            try:
+                self._flush()
+            except Exception as e:
+                print(f"Ошибка отложенной записи ({self._name}): {e}")
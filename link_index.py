@@ -0,0 +1,60 @@
+"""
+Индекс связей между заметками (прямые и обратные ссылки)
+"""
+from typing import List, Dict, Set
+
+
+class LinkIndex:
+    """Список смежности графа заметок с обратными ссылками"""
+    
+    def __init__(self, notes: Dict[str, Dict]):
+        """
+        Строит индекс по метаданным заметок
+        
+        Args:
+            notes: Словарь {id: метаданные заметки} из metadata.json
+        """
+        self.outgoing: Dict[str, List[str]] = {}
+        self.incoming: Dict[str, Set[str]] = {}
+        for note_id, note_data in notes.items():
+            self.set_links(note_id, note_data.get("links", []))
+    
+    def set_links(self, note_id: str, links: List[str]):
+        """
+        Заменяет исходящие связи заметки
+        
+        Args:
+            note_id: ID заметки
+            links: Список ID связанных заметок
+        """
+        self.remove_note(note_id)
+        if not links:
+            return
+        self.outgoing[note_id] = list(links)
+        for linked_id in links:
+            self.incoming.setdefault(linked_id, set()).add(note_id)
+    
+    def remove_note(self, note_id: str):
+        """
+        Удаляет исходящие связи заметки
+        
+        Ссылки других заметок на нее остаются, как и в метаданных.
+        
+        Args:
+            note_id: ID заметки
+        """
+        for linked_id in self.outgoing.pop(note_id, []):
+            sources = self.incoming.get(linked_id)
+            if sources is None:
+                continue
+            sources.discard(note_id)
+            if not sources:
+                del self.incoming[linked_id]
+    
+    def get_links(self, note_id: str) -> List[str]:
+        """Получает ID заметок, на которые ссылается заметка"""
+        return list(self.outgoing.get(note_id, []))
+    
+    def get_backlinks(self, note_id: str) -> List[str]:
+        """Получает ID заметок, которые ссылаются на заметку"""
+        return sorted(self.incoming.get(note_id, ()))
@@ -0,0 +1,291 @@
+"""
+Кеш метаданных заметок в памяти с отложенной атомарной записью на диск
+"""
+import os
+import copy
+import json
+import time
+import atexit
+import threading
+from pathlib import Path
+from typing import Dict, Optional, Callable, Any
+from atomic_io import atomic_write_bytes, file_lock
+from flush_scheduler import FlushScheduler
+
+
+# Задержка записи после последнего изменения (сек)
+FLUSH_DELAY = 0.5
+# Максимальное время, которое изменения могут ждать записи (сек)
+MAX_FLUSH_INTERVAL = 5.0
+# Пауза перед повторной попыткой после ошибки записи (сек)
+FLUSH_RETRY_DELAY = 2.0
+
+_MISSING = object()
+
+
+def merge_metadata(base: Dict, ours: Dict, theirs: Dict) -> Dict:
+    """
+    Трехстороннее слияние метаданных при одновременной записи из разных процессов
+    
+    Вложенные словари (notes, attachments и т.п.) сливаются по ключам: берутся
+    наши изменения относительно base, остальное - из версии на диске. Если обе
+    стороны изменили одну заметку, побеждают наши изменения.
+    
+    Args:
+        base: Метаданные на момент нашего чтения с диска
+        ours: Метаданные в памяти
+        theirs: Метаданные, которые сейчас на диске
+        
+    Returns:
+        Слитые метаданные
+    """
+    result = dict(theirs)
+    for key in set(base) | set(ours):
+        base_value = base.get(key, _MISSING)
+        our_value = ours.get(key, _MISSING)
+        if our_value is _MISSING:
+            # Мы удалили ключ
+            result.pop(key, None)
+        elif isinstance(our_value, dict) and isinstance(base_value, dict) and isinstance(theirs.get(key), dict):
+            result[key] = merge_metadata(base_value, our_value, theirs[key])
+        elif base_value is _MISSING or our_value != base_value:
+            result[key] = our_value
+    return result
+
+
+class MetadataStore:
+    """
+    Общий для процесса кеш metadata.json
+    
+    Файл читается один раз и перечитывается, только если изменились его
+    inode/mtime/размер (например, его записал другой процесс). Изменения
+    накапливаются в памяти и записываются одним атомарным сохранением;
+    если до записи файл изменил другой процесс, его изменения сливаются
+    с нашими уже при следующем чтении.
+    """
+    
+    def __init__(self, metadata_file: Path, flush_delay: float = FLUSH_DELAY,
+                 max_flush_interval: float = MAX_FLUSH_INTERVAL):
+        """
+        Инициализация хранилища
+        
+        Args:
+            metadata_file: Путь к metadata.json
+            flush_delay: Задержка записи после последнего изменения
+            max_flush_interval: Максимальная задержка записи с момента первого изменения
+        """
+        self.metadata_file = Path(metadata_file)
+        self.flush_delay = flush_delay
+        self.max_flush_interval = max_flush_interval
+        # Блокировка для чтения/изменения общего словаря метаданных
+        self.lock = threading.RLock()
+        # Номер версии данных в памяти, растет при каждом изменении или перечитывании
+        self.generation = 0
+        # Случайный id экземпляра: версия несохраненных изменений не должна совпасть с чужой
+        self.instance_id = os.urandom(4).hex()
+        # Производные индексы {имя: индекс}, строятся по данным и сбрасываются при перечитывании
+        self._indexes: Dict[str, Any] = {}
+        self._data: Optional[Dict] = None
+        # Копия данных в том виде, в каком они были на диске (основа для слияния)
+        self._base: Dict = {}
+        self._stat: Optional[tuple] = None
+        self._dirty = False
+        self._dirty_since: Optional[float] = None
+        # Один фоновый поток записи на хранилище
+        self._flusher = FlushScheduler(self.flush, "metadata-flush")
+    
+    def _stat_file(self) -> Optional[tuple]:
+        """Получает (inode, mtime_ns, размер) файла или None, если файла нет"""
+        try:
+            st = self.metadata_file.stat()
+        except OSError:
+            return None
+        return (st.st_ino, st.st_mtime_ns, st.st_size)
+    
+    def _read(self) -> Dict:
+        """Читает метаданные с диска"""
+        try:
+            with open(self.metadata_file, 'r', encoding='utf-8') as f:
+                data = json.load(f)
+        except Exception:
+            data = {}
+        data.setdefault("notes", {})
+        return data
+    
+    def ensure_exists(self):
+        """Создает файл метаданных, если его нет"""
+        with self.lock:
+            if self._stat is None and not self.metadata_file.exists():
+                self._data = {"notes": {}}
+                self._dirty = True
+                self.flush()
+    
+    def load(self) -> Dict:
+        """
+        Получает метаданные (общий словарь, изменять только под self.lock)
+        
+        Returns:
+            Словарь метаданных
+        """
+        with self.lock:
+            stat = self._stat_file()
+            if self._dirty:
+                if stat is not None and stat != self._stat:
+                    # Другой процесс записал файл, пока у нас есть несохраненные изменения:
+                    # сливаем сразу, чтобы его изменения были видны до нашей записи.
+                    # Словарь обновляется на месте - вызывающий код может держать ссылку на него
+                    theirs = self._read()
+                    merged = merge_metadata(self._base, self._data, theirs)
+                    self._data.clear()
+                    self._data.update(merged)
+                    self._base = copy.deepcopy(theirs)
+                    self._stat = stat
+                    self.generation += 1
+                    self._indexes.clear()
+                return self._data
+            
+            if self._data is None or stat != self._stat:
+                self._data = self._read()
+                self._base = copy.deepcopy(self._data)
+                self._stat = stat
+                self.generation += 1
+                self._indexes.clear()
+            return self._data
+    
+    def get_index(self, name: str, factory: Callable[[Dict], Any]) -> Any:
+        """
+        Получает производный индекс по метаданным, строя его при первом обращении
+        
+        Индекс обновляется вызывающим кодом при изменениях (под self.lock)
+        и перестраивается целиком, если файл метаданных изменился на диске.
+        
+        Args:
+            name: Имя индекса
+            factory: Функция построения индекса по словарю метаданных
+            
+        Returns:
+            Индекс
+        """
+        with self.lock:
+            data = self.load()
+            index = self._indexes.get(name)
+            if index is None:
+                index = factory(data)
+                self._indexes[name] = index
+            return index
+    
+    @property
+    def version_tag(self) -> str:
+        """
+        Строка версии данных (для ETag)
+        
+        Строится по inode/mtime/размеру файла на диске, поэтому у всех
+        процессов, прочитавших один файл, версия одинаковая и условные
+        запросы работают через любой воркер. Пока есть несохраненные
+        изменения (до отложенной записи), к ней добавляются id процесса и
+        номер изменения - их видит только этот процесс.
+        """
+        with self.lock:
+            self.load()
+            tag = "-".join(f"{value:x}" for value in self._stat) if self._stat else "0"
+            if self._dirty:
+                return f"{tag}-{self.instance_id}-{self.generation}"
+            return tag
+    
+    def mark_dirty(self):
+        """Отмечает метаданные измененными и планирует отложенную запись"""
+        with self.lock:
+            self._dirty = True
+            self.generation += 1
+            if self._dirty_since is None:
+                self._dirty_since = time.monotonic()
+            self._schedule_flush()
+    
+    def _schedule_flush(self, retry: bool = False):
+        """
+        Назначает отложенную запись с учетом максимальной задержки
+        
+        Args:
+            retry: Повтор после ошибки записи (ждем FLUSH_RETRY_DELAY, даже если срок уже прошел)
+        """
+        if retry:
+            delay = FLUSH_RETRY_DELAY
+        else:
+            deadline = self._dirty_since + self.max_flush_interval
+            delay = max(0.0, min(self.flush_delay, deadline - time.monotonic()))
+        self._flusher.schedule(delay)
+    
+    def flush(self) -> bool:
+        """
+        Атомарно записывает накопленные изменения на диск
+        
+        Returns:
+            True если успешно (или записывать нечего)
+        """
+        with self.lock:
+            self._flusher.cancel()
+            
+            if not self._dirty:
+                return True
+            
+            try:
+                # Блокировка файла защищает чтение-слияние-запись от других процессов
+                with file_lock(self.metadata_file):
+                    stat = self._stat_file()
+                    if stat is not None and stat != self._stat:
+                        # Файл записал другой процесс после нашего чтения - сливаем изменения.
+                        # Как и в load(), словарь обновляется на месте
+                        merged = merge_metadata(self._base, self._data, self._read())
+                        self._data.clear()
+                        self._data.update(merged)
+                        self.generation += 1
+                        self._indexes.clear()
+                    
+                    data = json.dumps(self._data, ensure_ascii=False).encode('utf-8')
+                    atomic_write_bytes(self.metadata_file, data)
+                    self._stat = self._stat_file()
+            except Exception as e:
+                print(f"Ошибка сохранения метаданных: {e}")
+                # Повторим попытку позже
+                self._schedule_flush(retry=True)
+                return False
+            
+            self._base = copy.deepcopy(self._data)
+            self._dirty = False
+            self._dirty_since = None
+            return True
+
+
+# Хранилища метаданных процесса {путь: MetadataStore}
+_stores: Dict[str, MetadataStore] = {}
+_stores_lock = threading.Lock()
+
+
+def get_metadata_store(metadata_file: Path) -> MetadataStore:
+    """
+    Получает общее для процесса хранилище метаданных для файла
+    
+    Args:
+        metadata_file: Путь к metadata.json
+        
+    Returns:
+        Хранилище метаданных
+    """
+    key = os.path.abspath(metadata_file)
+    with _stores_lock:
+        store = _stores.get(key)
+        if store is None:
+            store = MetadataStore(Path(metadata_file))
+            _stores[key] = store
+        return store
+
+
+def flush_all():
+    """Записывает несохраненные метаданные всех хранилищ (вызывается при завершении)"""
+    with _stores_lock:
+        stores = list(_stores.values())
+    for store in stores:
+        store.flush()
+
+
+atexit.register(flush_all)
@@ -0,0 +1,108 @@
+"""
+Перевод зашифрованных файлов в двоичный формат v3
+
+Запуск: python migrate_notes.py [--notes-dir notes]
+Пароль запрашивается интерактивно. Файлы, уже записанные в формате v3,
+пропускаются, поэтому скрипт можно запускать повторно.
+
+python migrate_notes.py --sweep-locks [--notes-dir notes] удаляет файлы
+блокировок удаленных заметок (сервер при этом должен быть остановлен).
+"""
+import sys
+import argparse
+import getpass
+from pathlib import Path
+from auth import AuthManager
+from encryption import EncryptionManager
+from atomic_io import LOCKS_DIR, atomic_write_bytes, file_lock, sweep_lock_files
+from crypto_executor import get_crypto_executor
+
+
+def migrate_file(encryption_manager: EncryptionManager, file_path: Path) -> bool:
+    """
+    Перешифровывает один файл в формат v3 с атомарной заменой
+    
+    Args:
+        encryption_manager: Менеджер шифрования
+        file_path: Путь к .enc файлу
+        
+    Returns:
+        True если файл был переведен, False если он уже в формате v3
+    """
+    with file_lock(file_path):
+        with open(file_path, 'rb') as f:
+            blob = f.read()
+        
+        if EncryptionManager.is_binary_format(blob):
+            return False
+        
+        data = encryption_manager.decrypt_bytes(blob)
+        atomic_write_bytes(file_path, encryption_manager.encrypt_bytes(data))
+    return True
+
+
+def migrate(notes_dir: Path, password: str) -> int:
+    """
+    Переводит все .enc файлы директории в формат v3
+    
+    Args:
+        notes_dir: Директория заметок
+        password: Пароль пользователя
+        
+    Returns:
+        Количество файлов, которые не удалось перевести
+    """
+    encryption_manager = EncryptionManager(password, notes_dir)
+    migrated = skipped = failed = 0
+    
+    def migrate_one(file_path: Path):
+        try:
+            return migrate_file(encryption_manager, file_path)
+        except Exception as e:
+            return e
+    
+    # Старые файлы выводят ключ PBKDF2 каждый со своей солью - переводим их параллельно
+    file_paths = sorted(notes_dir.glob("*.enc"))
+    for file_path, result in zip(file_paths, get_crypto_executor().map(migrate_one, file_paths)):
+        if isinstance(result, Exception):
+            print(f"Ошибка перевода {file_path.name}: {result}")
+            failed += 1
+        elif result:
+            migrated += 1
+        else:
+            skipped += 1
+    
+    print(f"Переведено: {migrated}, уже в формате v3: {skipped}, ошибок: {failed}")
+    return failed
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Перевод зашифрованных файлов в двоичный формат v3")
+    parser.add_argument("--notes-dir", default="notes", help="Директория заметок")
+    parser.add_argument("--sweep-locks", action="store_true",
+                        help="Удалить файлы блокировок удаленных файлов (только при остановленном сервере)")
+    args = parser.parse_args()
+    
+    notes_dir = Path(args.notes_dir)
+    if not notes_dir.is_dir():
+        print(f"Директория не найдена: {notes_dir}")
+        return 1
+    
+    if args.sweep_locks:
+        directories = [notes_dir] + [path for path in notes_dir.iterdir()
+                                     if path.is_dir() and path.name != LOCKS_DIR]
+        removed = sum(sweep_lock_files(directory) for directory in directories)
+        print(f"Удалено файлов блокировок: {removed}")
+        return 0
+    
+    password = getpass.getpass("Пароль: ")
+    auth_manager = AuthManager()
+    if auth_manager.is_initialized() and not auth_manager.check_password(password):
+        print("Неверный пароль")
+        return 1
+    
+    return 1 if migrate(notes_dir, password) else 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
@@ -0,0 +1,102 @@
+"""
+Отсортированные индексы заметок для постраничного списка
+"""
+from bisect import bisect_left, bisect_right, insort
+from typing import List, Dict, Optional, Set, Tuple
+
+
+# Поля, по которым можно сортировать список заметок
+SORT_FIELDS = ("modified", "created", "title")
+
+
+def _sort_key(field: str, note_data: Dict) -> str:
+    """Получает значение поля сортировки заметки"""
+    if field == "title":
+        return note_data.get("title", "Untitled").lower()
+    return note_data.get(field, "")
+
+
+class NoteOrderIndex:
+    """Отсортированные списки (значение поля, id) по каждому полю сортировки"""
+    
+    def __init__(self, notes: Dict[str, Dict]):
+        """
+        Строит индекс по метаданным заметок
+        
+        Args:
+            notes: Словарь {id: метаданные заметки} из metadata.json
+        """
+        self.keys: Dict[str, Dict[str, str]] = {}
+        self.sorted: Dict[str, List[Tuple[str, str]]] = {}
+        for note_id, note_data in notes.items():
+            self.keys[note_id] = {field: _sort_key(field, note_data) for field in SORT_FIELDS}
+        for field in SORT_FIELDS:
+            self.sorted[field] = sorted((keys[field], note_id) for note_id, keys in self.keys.items())
+    
+    def __len__(self) -> int:
+        return len(self.keys)
+    
+    def set_note(self, note_id: str, note_data: Dict):
+        """
+        Добавляет заметку или обновляет ее позиции после изменения
+        
+        Args:
+            note_id: ID заметки
+            note_data: Метаданные заметки
+        """
+        keys = {field: _sort_key(field, note_data) for field in SORT_FIELDS}
+        if self.keys.get(note_id) == keys:
+            return
+        self.remove_note(note_id)
+        self.keys[note_id] = keys
+        for field in SORT_FIELDS:
+            insort(self.sorted[field], (keys[field], note_id))
+    
+    def remove_note(self, note_id: str):
+        """
+        Удаляет заметку из индекса
+        
+        Args:
+            note_id: ID заметки
+        """
+        keys = self.keys.pop(note_id, None)
+        if keys is None:
+            return
+        for field in SORT_FIELDS:
+            items = self.sorted[field]
+            i = bisect_left(items, (keys[field], note_id))
+            if i < len(items) and items[i] == (keys[field], note_id):
+                del items[i]
+    
+    def get_position(self, note_id: str, field: str) -> Optional[Tuple[str, str]]:
+        """Получает позицию заметки (значение поля, id) для курсора"""
+        keys = self.keys.get(note_id)
+        return (keys[field], note_id) if keys is not None else None
+    
+    def page(self, field: str, descending: bool = True, after: Optional[Tuple[str, str]] = None,
+             limit: Optional[int] = None, note_ids: Optional[Set[str]] = None) -> List[str]:
+        """
+        Получает страницу ID заметок в порядке сортировки
+        
+        Args:
+            field: Поле сортировки
+            descending: True - по убыванию
+            after: Позиция (значение поля, id), после которой начинается страница
+            limit: Размер страницы (None - до конца)
+            note_ids: Только эти заметки (например, найденные по тегам) - сортируется лишь их набор
+            
+        Returns:
+            Список ID заметок
+        """
+        if note_ids is None:
+            items = self.sorted[field]
+        else:
+            items = sorted((self.keys[note_id][field], note_id) for note_id in note_ids if note_id in self.keys)
+        if descending:
+            end = bisect_left(items, tuple(after)) if after else len(items)
+            start = 0 if limit is None else max(0, end - limit)
+            return [note_id for _, note_id in reversed(items[start:end])]
+        
+        start = bisect_right(items, tuple(after)) if after else 0
+        end = None if limit is None else start + limit
+        return [note_id for _, note_id in items[start:end]]
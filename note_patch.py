@@ -0,0 +1,161 @@
+"""
+Применение изменений к содержимому заметок (правки текста и JSON Patch)
+"""
+import json
+from typing import Any, Dict, List
+
+
+class PatchError(ValueError):
+    """Изменение нельзя применить к содержимому"""
+
+
+class VersionConflict(Exception):
+    """Изменение сделано относительно устаревшей версии заметки"""
+    
+    def __init__(self, version: int):
+        super().__init__(f"Версия заметки изменилась: {version}")
+        self.version = version
+
+
+def apply_text_ops(content: str, ops: List[Dict]) -> str:
+    """
+    Применяет правки текста по порядку
+    
+    Позиции считаются в UTF-16 единицах, как индексы строк в JavaScript,
+    и относятся к тексту после предыдущих правок.
+    
+    Args:
+        content: Исходный текст
+        ops: Список правок {pos, delete, insert}
+        
+    Returns:
+        Новый текст
+    """
+    buffer = bytearray(content.encode('utf-16-le', 'surrogatepass'))
+    for op in ops:
+        try:
+            pos = int(op.get("pos", 0))
+            delete = int(op.get("delete", 0))
+            insert = op.get("insert", "")
+        except (AttributeError, TypeError, ValueError):
+            raise PatchError(f"Неверная правка: {op}")
+        if not isinstance(insert, str):
+            raise PatchError(f"Неверная правка: {op}")
+        if pos < 0 or delete < 0 or (pos + delete) * 2 > len(buffer):
+            raise PatchError(f"Правка выходит за границы текста: {op}")
+        buffer[pos * 2:(pos + delete) * 2] = insert.encode('utf-16-le', 'surrogatepass')
+    
+    try:
+        return buffer.decode('utf-16-le')
+    except UnicodeDecodeError:
+        raise PatchError("Правка разрезает символ")
+
+
+def _parse_pointer(path: str) -> List[str]:
+    """Разбирает JSON Pointer (RFC 6901) на части"""
+    if path == "":
+        return []
+    if not isinstance(path, str) or not path.startswith("/"):
+        raise PatchError(f"Неверный путь: {path}")
+    return [part.replace("~1", "/").replace("~0", "~") for part in path[1:].split("/")]
+
+
+def _array_index(container: List, part: str, allow_end: bool) -> int:
+    """Получает индекс массива из части пути"""
+    if part == "-" and allow_end:
+        return len(container)
+    if not part.isdigit() or (len(part) > 1 and part[0] == "0"):
+        raise PatchError(f"Неверный индекс массива: {part}")
+    index = int(part)
+    if index > len(container) or (index == len(container) and not allow_end):
+        raise PatchError(f"Индекс вне массива: {part}")
+    return index
+
+
+def _resolve(doc: Any, parts: List[str]) -> Any:
+    """Находит значение по частям пути"""
+    for part in parts:
+        if isinstance(doc, list):
+            doc = doc[_array_index(doc, part, False)]
+        elif isinstance(doc, dict):
+            if part not in doc:
+                raise PatchError(f"Путь не найден: {part}")
+            doc = doc[part]
+        else:
+            raise PatchError(f"Путь не найден: {part}")
+    return doc
+
+
+def _add(doc: Any, parts: List[str], value: Any) -> Any:
+    """Операция add, возвращает новый корень документа"""
+    if not parts:
+        return value
+    parent = _resolve(doc, parts[:-1])
+    if isinstance(parent, list):
+        parent.insert(_array_index(parent, parts[-1], True), value)
+    elif isinstance(parent, dict):
+        parent[parts[-1]] = value
+    else:
+        raise PatchError(f"Нельзя добавить значение в {parts}")
+    return doc
+
+
+def _remove(doc: Any, parts: List[str]) -> Any:
+    """Операция remove, возвращает удаленное значение"""
+    if not parts:
+        raise PatchError("Нельзя удалить корень документа")
+    parent = _resolve(doc, parts[:-1])
+    if isinstance(parent, list):
+        return parent.pop(_array_index(parent, parts[-1], False))
+    if isinstance(parent, dict) and parts[-1] in parent:
+        return parent.pop(parts[-1])
+    raise PatchError(f"Путь не найден: {parts}")
+
+
+def apply_json_patch(content: str, patch: List[Dict]) -> str:
+    """
+    Применяет JSON Patch (RFC 6902) к JSON содержимому холста или канбана
+    
+    Args:
+        content: Исходный JSON
+        patch: Список операций add/remove/replace/move/copy/test
+        
+    Returns:
+        Новый JSON
+    """
+    try:
+        doc = json.loads(content) if content.strip() else {}
+    except ValueError:
+        raise PatchError("Содержимое заметки не является JSON")
+    
+    for op in patch:
+        if not isinstance(op, dict):
+            raise PatchError(f"Неверная операция: {op}")
+        name = op.get("op")
+        parts = _parse_pointer(op.get("path"))
+        
+        if name == "add":
+            doc = _add(doc, parts, op.get("value"))
+        elif name == "remove":
+            _remove(doc, parts)
+        elif name == "replace":
+            if not parts:
+                doc = op.get("value")
+            else:
+                _remove(doc, parts)
+                doc = _add(doc, parts, op.get("value"))
+        elif name == "move":
+            from_parts = _parse_pointer(op.get("from"))
+            if parts[:len(from_parts)] == from_parts and parts != from_parts:
+                raise PatchError("Нельзя переместить значение внутрь самого себя")
+            doc = _add(doc, parts, _remove(doc, from_parts))
+        elif name == "copy":
+            value = json.loads(json.dumps(_resolve(doc, _parse_pointer(op.get("from")))))
+            doc = _add(doc, parts, value)
+        elif name == "test":
+            if _resolve(doc, parts) != op.get("value"):
+                raise PatchError(f"Проверка не прошла: {op.get('path')}")
+        else:
+            raise PatchError(f"Неизвестная операция: {name}")
+    
+    return json.dumps(doc, ensure_ascii=False, separators=(',', ':'))
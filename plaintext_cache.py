@@ -0,0 +1,98 @@
+"""
+Кеш расшифрованного содержимого недавно открытых заметок (в памяти сессии)
+"""
+import threading
+from collections import OrderedDict
+from typing import Optional, Tuple
+
+
+# Предел суммарного размера кеша одной сессии (байт UTF-8)
+PLAINTEXT_CACHE_BYTES = 16 * 1024 * 1024
+
+
+class PlaintextCache:
+    """
+    LRU {id заметки: (отпечаток файла, версия, содержимое)} с ограничением по байтам
+    
+    Отпечаток файла - (mtime_ns, размер): если файл изменил другой процесс,
+    запись не совпадет и заметка будет расшифрована заново.
+    
+    Содержимое хранится в bytearray и затирается нулями при вытеснении и
+    очистке. Строки, уже отданные вызывающему коду, Python затереть не
+    позволяет - они живут до сборки мусора.
+    """
+    
+    def __init__(self, max_bytes: int = PLAINTEXT_CACHE_BYTES):
+        """
+        Инициализация кеша
+        
+        Args:
+            max_bytes: Предел суммарного размера содержимого
+        """
+        self.max_bytes = max_bytes
+        self.size = 0
+        self._entries: "OrderedDict[str, Tuple[Tuple[int, int], int, bytearray]]" = OrderedDict()
+        self._lock = threading.Lock()
+    
+    @staticmethod
+    def _wipe(data: bytearray):
+        data[:] = bytes(len(data))
+    
+    def _pop(self, note_id: str):
+        entry = self._entries.pop(note_id, None)
+        if entry is not None:
+            self.size -= len(entry[2])
+            self._wipe(entry[2])
+    
+    def get(self, note_id: str, stamp: Tuple[int, int]) -> Optional[Tuple[int, str]]:
+        """
+        Получает содержимое, если файл не менялся с момента кеширования
+        
+        Args:
+            note_id: ID заметки
+            stamp: Текущий отпечаток файла (mtime_ns, размер)
+            
+        Returns:
+            (версия, содержимое) или None
+        """
+        with self._lock:
+            entry = self._entries.get(note_id)
+            if entry is None:
+                return None
+            if entry[0] != stamp:
+                self._pop(note_id)
+                return None
+            self._entries.move_to_end(note_id)
+            return entry[1], entry[2].decode('utf-8')
+    
+    def put(self, note_id: str, stamp: Tuple[int, int], version: int, content: str):
+        """
+        Запоминает содержимое заметки (запись при чтении или сохранении)
+        
+        Args:
+            note_id: ID заметки
+            stamp: Отпечаток файла после чтения/записи
+            version: Версия заметки из метаданных
+            content: Расшифрованное содержимое
+        """
+        data = bytearray(content.encode('utf-8'))
+        with self._lock:
+            self._pop(note_id)
+            if len(data) > self.max_bytes:
+                self._wipe(data)
+                return
+            self._entries[note_id] = (stamp, version, data)
+            self.size += len(data)
+            while self.size > self.max_bytes:
+                self._pop(next(iter(self._entries)))
+    
+    def discard(self, note_id: str):
+        """Удаляет заметку из кеша"""
+        with self._lock:
+            self._pop(note_id)
+    
+    def clear(self):
+        """Очищает кеш (выход, смена пароля, выгрузка сессии)"""
+        with self._lock:
+            for note_id in list(self._entries):
+                self._pop(note_id)
@@ -0,0 +1,294 @@
+"""
+Ранжированный поиск: стемминг и BM25 по заголовку, тегам и содержимому
+"""
+import re
+import heapq
+import math
+from bisect import bisect_left
+from typing import Dict, List, Optional, Tuple
+
+
+# Слово - последовательность букв/цифр; ё приравнивается к е
+WORD_RE = re.compile(r'\w+', re.UNICODE)
+
+# Параметры BM25
+BM25_K1 = 1.2
+BM25_B = 0.75
+
+# Вес полей: совпадение в заголовке важнее совпадения в тексте
+FIELD_WEIGHTS = {"title": 3.0, "tags": 2.0, "body": 1.0}
+
+# Вес терма, найденного по префиксу последнего слова запроса (пользователь еще печатает)
+PREFIX_WEIGHT = 0.5
+# Сколько термов словаря может раскрыть один префикс
+MAX_PREFIX_EXPANSIONS = 50
+
+
+_VOWELS = set("аеиоуыэюя")
+
+_PERFECTIVE_GERUND_1 = ("вшись", "вши", "в")
+_PERFECTIVE_GERUND_2 = ("ившись", "ывшись", "ивши", "ывши", "ив", "ыв")
+_ADJECTIVE = ("ими", "ыми", "его", "ого", "ему", "ому", "ее", "ие", "ые", "ое", "ей", "ий", "ый",
+              "ой", "ем", "им", "ым", "ом", "их", "ых", "ую", "юю", "ая", "яя", "ою", "ею")
+_PARTICIPLE_1 = ("ем", "нн", "вш", "ющ", "щ")
+_PARTICIPLE_2 = ("ивш", "ывш", "ующ")
+_REFLEXIVE = ("ся", "сь")
+_VERB_1 = ("ете", "йте", "ешь", "нно", "ла", "на", "ли", "ем", "ло", "но", "ет", "ют", "ны", "ть", "й", "л", "н")
+_VERB_2 = ("ейте", "уйте", "ила", "ыла", "ена", "ите", "или", "ыли", "ило", "ыло", "ено", "ует", "уют",
+           "ены", "ить", "ыть", "ишь", "ей", "уй", "ил", "ыл", "им", "ым", "ен", "ят", "ит", "ыт", "ую", "ю")
+_NOUN = ("иями", "ями", "ами", "ией", "иям", "ием", "иях", "ев", "ов", "ие", "ье", "еи", "ии", "ей", "ой",
+         "ий", "ям", "ем", "ам", "ом", "ах", "ях", "ию", "ью", "ия", "ья", "а", "е", "и", "й", "о", "у",
+         "ы", "ь", "ю", "я")
+_SUPERLATIVE = ("ейше", "ейш")
+_DERIVATIONAL = ("ость", "ост")
+
+
+def _regions(word: str) -> Tuple[int, int]:
+    """
+    Находит начало областей RV и R2 слова (алгоритм Портера для русского)
+    
+    Returns:
+        (начало RV, начало R2)
+    """
+    rv = len(word)
+    for i, char in enumerate(word):
+        if char in _VOWELS:
+            rv = i + 1
+            break
+    
+    def next_region(start: int) -> int:
+        for i in range(start + 1, len(word)):
+            if word[i] not in _VOWELS and word[i - 1] in _VOWELS:
+                return i + 1
+        return len(word)
+    
+    r1 = next_region(0)
+    return rv, next_region(r1)
+
+
+def _strip(word: str, start: int, endings: Tuple[str, ...], after_a: Tuple[str, ...] = ()) -> Optional[str]:
+    """
+    Отрезает самое длинное окончание из групп, если оно целиком в области [start:]
+    
+    Окончания after_a отрезаются только после а/я (сама буква остается).
+    
+    Returns:
+        Слово без окончания или None, если окончание не найдено
+    """
+    region = word[start:]
+    best = None
+    for ending in endings + after_a:
+        if region.endswith(ending) and (best is None or len(ending) > len(best)):
+            best = ending
+    if best is None:
+        return None
+    stem = word[:-len(best)]
+    if best not in endings and not (len(stem) > start and stem[-1] in "ая"):
+        return None
+    return stem
+
+
+def stem(word: str) -> str:
+    """
+    Приводит русское слово к основе (упрощенный стеммер Портера, Snowball)
+    
+    Слова без кириллицы возвращаются как есть.
+    
+    Args:
+        word: Слово в нижнем регистре
+        
+    Returns:
+        Основа слова
+    """
+    word = word.replace("ё", "е")
+    if not any("а" <= char <= "я" for char in word):
+        return word
+    
+    rv, r2 = _regions(word)
+    
+    # Шаг 1: деепричастие, иначе возвратность и прилагательное/глагол/существительное
+    result = _strip(word, rv, _PERFECTIVE_GERUND_2, _PERFECTIVE_GERUND_1)
+    if result is None:
+        word = _strip(word, rv, _REFLEXIVE) or word
+        result = _strip(word, rv, _ADJECTIVE)
+        if result is not None:
+            result = _strip(result, rv, _PARTICIPLE_2, _PARTICIPLE_1) or result
+        else:
+            result = _strip(word, rv, _VERB_2, _VERB_1)
+            if result is None:
+                result = _strip(word, rv, _NOUN)
+    if result is not None:
+        word = result
+    
+    # Шаг 2: конечное и
+    if word[rv:].endswith("и"):
+        word = word[:-1]
+    
+    # Шаг 3: словообразовательный суффикс в R2
+    word = _strip(word, r2, _DERIVATIONAL) or word
+    
+    # Шаг 4: нн, превосходная степень, мягкий знак
+    if word[rv:].endswith("нн"):
+        word = word[:-1]
+    else:
+        superlative = _strip(word, rv, _SUPERLATIVE)
+        if superlative is not None:
+            word = superlative
+            if word[rv:].endswith("нн"):
+                word = word[:-1]
+        elif word[rv:].endswith("ь"):
+            word = word[:-1]
+    return word
+
+
+def analyze(text: str) -> List[str]:
+    """
+    Разбивает текст на основы слов
+    
+    Args:
+        text: Исходный текст
+        
+    Returns:
+        Список основ в нижнем регистре
+    """
+    return [stem(word) for word in WORD_RE.findall(text.lower())]
+
+
+class RankIndex:
+    """
+    Индекс для ранжирования: {терм: {id заметки: {поле: частота}}} и длины полей
+    
+    Хранится только в памяти и обновляется по заметкам, поэтому запрос
+    смотрит лишь записи термов запроса, а не все заметки.
+    """
+    
+    def __init__(self):
+        self.postings: Dict[str, Dict[str, Dict[str, int]]] = {}
+        # {id заметки: {поле: длина в термах}}
+        self.lengths: Dict[str, Dict[str, int]] = {}
+        # {id заметки: термы заметки} - чтобы удаление не перебирало весь словарь
+        self.note_terms: Dict[str, set] = {}
+        self.total_lengths: Dict[str, int] = {field: 0 for field in FIELD_WEIGHTS}
+        # Отсортированный словарь для поиска по префиксу (строится при запросе)
+        self._vocabulary: Optional[List[str]] = None
+    
+    def __contains__(self, note_id: str) -> bool:
+        return note_id in self.lengths
+    
+    def note_ids(self) -> List[str]:
+        """Возвращает ID проиндексированных заметок"""
+        return list(self.lengths)
+    
+    def update(self, note_id: str, fields: Dict[str, str]):
+        """
+        Индексирует (или переиндексирует) поля заметки
+        
+        Args:
+            note_id: ID заметки
+            fields: Тексты полей {title, tags, body}
+        """
+        self.remove(note_id)
+        
+        lengths = {}
+        note_terms = set()
+        for field in FIELD_WEIGHTS:
+            terms = analyze(fields.get(field, ""))
+            lengths[field] = len(terms)
+            self.total_lengths[field] += len(terms)
+            note_terms.update(terms)
+            for term in terms:
+                if term not in self.postings:
+                    self._vocabulary = None
+                note_fields = self.postings.setdefault(term, {}).setdefault(note_id, {})
+                note_fields[field] = note_fields.get(field, 0) + 1
+        self.lengths[note_id] = lengths
+        self.note_terms[note_id] = note_terms
+    
+    def remove(self, note_id: str):
+        """
+        Удаляет заметку из индекса
+        
+        Args:
+            note_id: ID заметки
+        """
+        lengths = self.lengths.pop(note_id, None)
+        if lengths is None:
+            return
+        
+        for field, length in lengths.items():
+            self.total_lengths[field] -= length
+        for term in self.note_terms.pop(note_id, ()):
+            del self.postings[term][note_id]
+            if not self.postings[term]:
+                del self.postings[term]
+                self._vocabulary = None
+    
+    def _expand_prefix(self, prefix: str) -> List[str]:
+        """Находит термы словаря, начинающиеся с префикса"""
+        if self._vocabulary is None:
+            self._vocabulary = sorted(self.postings)
+        terms = []
+        i = bisect_left(self._vocabulary, prefix)
+        while i < len(self._vocabulary) and self._vocabulary[i].startswith(prefix):
+            terms.append(self._vocabulary[i])
+            if len(terms) >= MAX_PREFIX_EXPANSIONS:
+                break
+            i += 1
+        return terms
+    
+    def _score_term(self, term: str, weight: float, scores: Dict[str, float]):
+        """Добавляет вклад терма (BM25 по полям с весами) к оценкам заметок"""
+        notes = self.postings.get(term)
+        if not notes:
+            return
+        
+        count = len(self.lengths)
+        idf = math.log(1 + (count - len(notes) + 0.5) / (len(notes) + 0.5))
+        for note_id, frequencies in notes.items():
+            score = 0.0
+            for field, frequency in frequencies.items():
+                average = self.total_lengths[field] / count or 1
+                norm = 1 - BM25_B + BM25_B * self.lengths[note_id][field] / average
+                score += FIELD_WEIGHTS[field] * frequency * (BM25_K1 + 1) / (frequency + BM25_K1 * norm)
+            scores[note_id] = scores.get(note_id, 0.0) + weight * idf * score
+    
+    def search(self, query: str, limit: int = 20, offset: int = 0) -> Tuple[int, List[Tuple[str, float]]]:
+        """
+        Ищет заметки, содержащие все слова запроса, и ранжирует их по BM25
+        
+        Последнее слово запроса ищется и как префикс.
+        
+        Args:
+            query: Поисковый запрос
+            limit: Размер страницы
+            offset: Сколько лучших результатов пропустить
+            
+        Returns:
+            (всего найдено, [(id заметки, оценка)] для страницы по убыванию оценки)
+        """
+        words = WORD_RE.findall(query.lower())
+        if not words or not self.lengths:
+            return 0, []
+        
+        scores: Optional[Dict[str, float]] = None
+        for i, word in enumerate(words):
+            term = stem(word)
+            word_scores: Dict[str, float] = {}
+            self._score_term(term, 1.0, word_scores)
+            if i == len(words) - 1:
+                for prefix_term in self._expand_prefix(word.replace("ё", "е")):
+                    if prefix_term != term:
+                        self._score_term(prefix_term, PREFIX_WEIGHT, word_scores)
+            
+            # Заметка должна содержать каждое слово запроса
+            if scores is None:
+                scores = word_scores
+            else:
+                scores = {note_id: score + word_scores[note_id]
+                          for note_id, score in scores.items() if note_id in word_scores}
+            if not scores:
+                return 0, []
+        
+        # Частичная сортировка: нужны только offset + limit лучших
+        top = heapq.nlargest(offset + limit, scores.items(), key=lambda item: (item[1], item[0]))
+        return len(scores), top[offset:]
@@ -0,0 +1,360 @@
+"""
+Фоновое перешифрование всех файлов после смены пароля
+"""
+import hmac
+import json
+import time
+import base64
+import threading
+from pathlib import Path
+from typing import Dict, Iterator, List, Optional
+from encryption import EncryptionManager, CHUNK_SIZE
+from atomic_io import atomic_write, atomic_write_bytes, file_lock
+from crypto_executor import get_crypto_executor
+
+
+# Файл состояния задачи: позволяет продолжить перешифрование после перезапуска
+REKEY_STATE_FILE = "rekey_state.json"
+# Как часто сохранять прогресс (сек)
+STATE_SAVE_INTERVAL = 2.0
+# Служебные файлы перешифровываются первыми: без них не работают поиск, словарь и календарь
+PRIORITY_FILES = ["dictionary.enc", "calendar.enc", "global_todos.enc"]
+
+
+class _ChunkReader:
+    """Файловый объект поверх итератора сегментов (для encrypt_stream)"""
+    
+    def __init__(self, chunks: Iterator[bytes]):
+        self.chunks = chunks
+        self.buffer = b""
+    
+    def read(self, size: int = -1) -> bytes:
+        while size < 0 or len(self.buffer) < size:
+            chunk = next(self.chunks, None)
+            if chunk is None:
+                break
+            self.buffer += chunk
+        if size < 0:
+            data, self.buffer = self.buffer, b""
+        else:
+            data, self.buffer = self.buffer[:size], self.buffer[size:]
+        return data
+
+
+def _make_manager_chain(passwords: List[str]) -> Optional[EncryptionManager]:
+    """
+    Создает менеджер для старых паролей (от нового к старому) через цепочку fallback
+    
+    Args:
+        passwords: Старые пароли, последний по времени первым
+        
+    Returns:
+        Менеджер первого пароля или None
+    """
+    head = None
+    for password in reversed(passwords):
+        manager = EncryptionManager(password)
+        manager.fallback = head
+        head = manager
+    return head
+
+
+class RekeyJob:
+    """
+    Перешифровывает все .enc файлы (заметки, словарь, календарь, TODO, поисковый
+    индекс, вложения) ключом нового пароля в общем пуле криптографии
+    
+    Файлы, которые уже читаются новым паролем, пропускаются, поэтому задачу
+    можно безопасно повторить. Старые пароли хранятся в файле состояния
+    зашифрованными новым паролем - после сбоя задачу продолжает первый вход.
+    Пока задача идет, она держит блокировку файла состояния: в нескольких
+    воркерах перешифрование выполняет только один из них.
+    """
+    
+    def __init__(self, notes_dir: Path, old_passwords: List[str], new_password: str,
+                 completed: Optional[List[str]] = None):
+        """
+        Инициализация задачи
+        
+        Args:
+            notes_dir: Директория заметок
+            old_passwords: Старые пароли, последний по времени первым
+            new_password: Новый пароль
+            completed: Уже перешифрованные файлы (при продолжении задачи)
+        """
+        self.notes_dir = Path(notes_dir)
+        self.state_file = self.notes_dir / REKEY_STATE_FILE
+        self.old_passwords = list(old_passwords)
+        self.old_manager = _make_manager_chain(self.old_passwords)
+        # Отдельный менеджер без fallback: по нему проверяем, что файл уже перешифрован
+        self.new_manager = EncryptionManager(new_password, self.notes_dir)
+        self.status = "pending"
+        self.total = 0
+        self.completed = set(completed or [])
+        self.failed: Dict[str, str] = {}
+        self._lock = threading.Lock()
+        self._thread: Optional[threading.Thread] = None
+    
+    @property
+    def active(self) -> bool:
+        """Задача еще не завершена"""
+        return self.status in ("pending", "running")
+    
+    def matches(self, password: str) -> bool:
+        """Проверяет, что задача перешифровывает под этот пароль"""
+        return hmac.compare_digest(self.new_manager.password, password.encode('utf-8'))
+    
+    def _list_files(self) -> List[str]:
+        """Получает пути всех зашифрованных файлов относительно директории заметок"""
+        names = [name for name in PRIORITY_FILES if (self.notes_dir / name).exists()]
+        search_index_dir = self.notes_dir / "search_index"
+        if search_index_dir.exists():
+            names += sorted(f"search_index/{p.name}" for p in search_index_dir.glob("*.enc"))
+        names += sorted(p.name for p in self.notes_dir.glob("*.enc") if p.name not in PRIORITY_FILES)
+        attachments_dir = self.notes_dir / "attachments"
+        if attachments_dir.exists():
+            names += sorted(f"attachments/{p.name}" for p in attachments_dir.glob("*.enc"))
+        return names
+    
+    def _save_state(self):
+        """Сохраняет прогресс в файл состояния"""
+        with self._lock:
+            state = {
+                "status": self.status,
+                "total": self.total,
+                "completed": sorted(self.completed),
+                "failed": dict(self.failed)
+            }
+            if self.active:
+                sealed = self.new_manager.encrypt_bytes(json.dumps(self.old_passwords).encode('utf-8'))
+                state["old_passwords"] = base64.b64encode(sealed).decode('ascii')
+        atomic_write_bytes(self.state_file, json.dumps(state, ensure_ascii=False).encode('utf-8'))
+    
+    def _reencrypt_file(self, name: str) -> bool:
+        """
+        Перешифровывает один файл новым ключом
+        
+        Args:
+            name: Путь файла относительно директории заметок
+            
+        Returns:
+            True если файл перешифрован, False если он уже был зашифрован новым паролем
+        """
+        file_path = self.notes_dir / name
+        with file_lock(file_path):
+            if not file_path.exists():
+                return False
+            
+            with open(file_path, 'rb') as f:
+                chunks = self.old_manager.decrypt_stream(f)
+                try:
+                    first = next(chunks)
+                except ValueError:
+                    # Не старый пароль - проверяем, что файл уже читается новым
+                    f.seek(0)
+                    next(self.new_manager.decrypt_stream(f))
+                    return False
+                
+                def all_chunks():
+                    yield first
+                    yield from chunks
+                
+                reader = _ChunkReader(all_chunks())
+                if file_path.stat().st_size > CHUNK_SIZE:
+                    atomic_write(file_path, lambda out: self.new_manager.encrypt_stream(reader, out))
+                else:
+                    data = reader.read()
+                    atomic_write(file_path, lambda out: out.write(self.new_manager.encrypt_bytes(data)))
+            return True
+    
+    def start(self, wait: bool = True):
+        """
+        Запускает задачу в фоновом потоке
+        
+        Args:
+            wait: Ждать задачу, которая уже идет в другом процессе (False - пропустить)
+        """
+        self._thread = threading.Thread(target=self.run, args=(wait,), daemon=True)
+        self._thread.start()
+    
+    def run(self, wait: bool = True):
+        """
+        Перешифровывает все файлы под блокировкой файла состояния
+        
+        Args:
+            wait: Ждать задачу, которая уже идет в другом процессе (False - пропустить)
+        """
+        with file_lock(self.state_file, blocking=wait) as acquired:
+            if not acquired:
+                # Задачу уже выполняет другой процесс
+                with self._lock:
+                    self.status = "skipped"
+                return
+            self._run()
+    
+    def _run(self):
+        """Перешифровывает все файлы (блокировка файла состояния уже получена)"""
+        names = self._list_files()
+        with self._lock:
+            self.status = "running"
+            self.total = len(names)
+        self._save_state()
+        
+        pending = [name for name in names if name not in self.completed]
+        last_save = 0.0
+        # Файлы перешифровываются в общем пуле криптографии процесса
+        for name, future in get_crypto_executor().map_unordered(self._reencrypt_file, pending):
+            with self._lock:
+                try:
+                    future.result()
+                    self.completed.add(name)
+                except Exception as e:
+                    print(f"Ошибка перешифрования {name}: {e}")
+                    self.failed[name] = str(e)
+            
+            now = time.monotonic()
+            if now - last_save >= STATE_SAVE_INTERVAL:
+                last_save = now
+                self._save_state()
+        
+        with self._lock:
+            self.status = "done"
+        # В завершенном состоянии старые пароли не хранятся
+        self._save_state()
+    
+    def get_progress(self) -> Dict:
+        """
+        Получает прогресс задачи
+        
+        Returns:
+            Словарь {status, total, completed, failed, failed_files}
+        """
+        with self._lock:
+            return {
+                "status": self.status,
+                "total": self.total,
+                "completed": len(self.completed),
+                "failed": len(self.failed),
+                "failed_files": sorted(self.failed)[:20]
+            }
+
+
+# Задачи процесса {директория заметок: RekeyJob}
+_jobs: Dict[str, RekeyJob] = {}
+_jobs_lock = threading.Lock()
+
+
+def _read_state(notes_dir: Path) -> Optional[Dict]:
+    """Читает файл состояния незавершенной задачи"""
+    try:
+        with open(Path(notes_dir) / REKEY_STATE_FILE, 'r', encoding='utf-8') as f:
+            state = json.load(f)
+    except (OSError, ValueError):
+        return None
+    return state if state.get("status") in ("pending", "running") else None
+
+
+def _unseal_old_passwords(state: Dict, password: str) -> Optional[List[str]]:
+    """Расшифровывает старые пароли из файла состояния новым паролем"""
+    try:
+        sealed = base64.b64decode(state["old_passwords"])
+        return json.loads(EncryptionManager(password).decrypt_bytes(sealed).decode('utf-8'))
+    except Exception:
+        return None
+
+
+def start_rekey(notes_dir: Path, old_password: str, new_password: str) -> RekeyJob:
+    """
+    Запускает перешифрование после смены пароля
+    
+    Если предыдущая задача еще не закончилась, ее старые пароли переходят в новую,
+    а новая задача начинает работу после ее завершения.
+    
+    Args:
+        notes_dir: Директория заметок
+        old_password: Прежний пароль
+        new_password: Новый пароль
+        
+    Returns:
+        Запущенная задача
+    """
+    key = str(Path(notes_dir).resolve())
+    with _jobs_lock:
+        old_passwords = [old_password]
+        previous = _jobs.get(key)
+        if previous is not None and previous.active:
+            old_passwords += [p for p in previous.old_passwords if p != old_password]
+        else:
+            state = _read_state(notes_dir)
+            if state is not None:
+                old_passwords += [p for p in (_unseal_old_passwords(state, old_password) or [])
+                                  if p != old_password]
+        
+        job = RekeyJob(notes_dir, old_passwords, new_password)
+        _jobs[key] = job
+    job.start()
+    return job
+
+
+def resume_rekey(notes_dir: Path, password: str) -> Optional[RekeyJob]:
+    """
+    Продолжает прерванное перешифрование (вызывается при входе)
+    
+    Если задачу сейчас выполняет другой процесс (держит блокировку файла
+    состояния), задача завершается со статусом "skipped", ничего не делая.
+    
+    Args:
+        notes_dir: Директория заметок
+        password: Пароль вошедшего пользователя (новый пароль задачи)
+        
+    Returns:
+        Задача или None, если продолжать нечего
+    """
+    key = str(Path(notes_dir).resolve())
+    with _jobs_lock:
+        job = _jobs.get(key)
+        if job is not None and job.active:
+            return job
+        
+        state = _read_state(notes_dir)
+        if state is None:
+            return None
+        old_passwords = _unseal_old_passwords(state, password)
+        if not old_passwords:
+            return None
+        
+        job = RekeyJob(notes_dir, old_passwords, password, completed=state.get("completed", []))
+        _jobs[key] = job
+    job.start(wait=False)
+    return job
+
+
+def get_rekey_job(notes_dir: Path) -> Optional[RekeyJob]:
+    """Получает задачу перешифрования директории (в этом процессе)"""
+    with _jobs_lock:
+        return _jobs.get(str(Path(notes_dir).resolve()))
+
+
+def get_rekey_fallback(notes_dir: Path, password: str) -> Optional[EncryptionManager]:
+    """
+    Получает менеджер старых паролей для чтения еще не перешифрованных файлов
+    
+    Задача могла запуститься в другом процессе - тогда старые пароли берутся
+    из файла состояния.
+    
+    Args:
+        notes_dir: Директория заметок
+        password: Текущий пароль
+        
+    Returns:
+        Менеджер старых паролей или None, если перешифрование не идет
+    """
+    job = get_rekey_job(notes_dir)
+    if job is not None and job.active and job.matches(password):
+        return job.old_manager
+    
+    state = _read_state(notes_dir)
+    if state is None:
+        return None
+    old_passwords = _unseal_old_passwords(state, password)
+    return _make_manager_chain(old_passwords) if old_passwords else None
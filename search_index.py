@@ -0,0 +1,539 @@
+"""
+Зашифрованный инвертированный индекс для полнотекстового поиска
+"""
+import json
+import re
+import time
+import zlib
+import threading
+from bisect import bisect_right
+from pathlib import Path
+from typing import List, Dict, Iterable, Optional, Set, Tuple
+from encryption import EncryptionManager
+from atomic_io import atomic_write_bytes, file_lock
+from flush_scheduler import FlushScheduler
+
+
+# Токен - непрерывная последовательность букв/цифр (с учетом кириллицы)
+TOKEN_RE = re.compile(r'\w+', re.UNICODE)
+
+# Длина контекста до и после совпадения
+CONTEXT_CHARS = 50
+
+# Сколько совпадений в содержимом одной заметки возвращает поиск (остальные - по запросу окнами)
+MAX_MATCHES_PER_NOTE = 20
+# Наибольшее окно совпадений за один запрос
+MAX_MATCH_WINDOW = 500
+
+# На сколько файлов-сегментов делится индекс: сохранение переписывает только измененные сегменты
+SEGMENT_COUNT = 64
+
+# Задержка сохранения после последнего изменения (сек)
+SAVE_DELAY = 2.0
+# Максимальное время, которое изменения могут ждать сохранения (сек)
+MAX_SAVE_INTERVAL = 30.0
+# Пауза перед повторной попыткой после ошибки сохранения (сек)
+SAVE_RETRY_DELAY = 5.0
+
+# Длина n-граммы в индексе словаря для поиска токенов по подстроке
+GRAM_SIZE = 3
+
+
+def tokenize(text: str) -> List[tuple]:
+    """
+    Разбивает текст на токены в нижнем регистре
+    
+    Args:
+        text: Исходный текст
+        
+    Returns:
+        Список пар (токен, позиция начала в тексте)
+    """
+    return [(m.group(0), m.start()) for m in TOKEN_RE.finditer(text.lower())]
+
+
+def make_matches(text: str, positions: Iterable[int], length: int) -> List[Dict]:
+    """
+    Строит совпадения с контекстом для подсветки
+    
+    Args:
+        text: Содержимое заметки
+        positions: Позиции начала совпадений
+        length: Длина запроса
+        
+    Returns:
+        Список совпадений {field, start, end, context, context_start}
+    """
+    matches = []
+    for pos in positions:
+        # Получаем контекст (50 символов до и после)
+        context_start = max(0, pos - CONTEXT_CHARS)
+        context_end = min(len(text), pos + length + CONTEXT_CHARS)
+        matches.append({
+            "field": "content",
+            "start": pos,
+            "end": pos + length,
+            "context": text[context_start:context_end],
+            "context_start": context_start
+        })
+    return matches
+
+
+def _occurrences(token: str, part: str) -> Iterable[int]:
+    """Перебирает смещения всех (в том числе перекрывающихся) вхождений part в token"""
+    offset = token.find(part)
+    while offset != -1:
+        yield offset
+        offset = token.find(part, offset + 1)
+
+
+class SearchIndex:
+    """
+    Инвертированный индекс {токен: {id заметки: [позиции]}}, хранится зашифрованным
+    
+    Хранятся только позиции токенов, без текста заметок. Индекс разделен на
+    SEGMENT_COUNT файлов по ID заметки, изменения копятся в памяти и
+    сохраняются с задержкой, причем переписываются только измененные сегменты.
+    """
+    
+    VERSION = 2
+    
+    def __init__(self, index_dir: Path, encryption_manager: EncryptionManager,
+                 save_delay: float = SAVE_DELAY, max_save_interval: float = MAX_SAVE_INTERVAL):
+        """
+        Инициализация индекса
+        
+        Args:
+            index_dir: Директория зашифрованных сегментов индекса
+            encryption_manager: Менеджер шифрования
+            save_delay: Задержка сохранения после последнего изменения
+            max_save_interval: Максимальная задержка сохранения с момента первого изменения
+        """
+        self.index_dir = Path(index_dir)
+        self.encryption_manager = encryption_manager
+        self.save_delay = save_delay
+        self.max_save_interval = max_save_interval
+        # Блокировка данных индекса (запросы сессии и поток сохранения)
+        self.lock = threading.RLock()
+        self.postings: Dict[str, Dict[str, List[int]]] = {}
+        # {id заметки: {"mtime": mtime_ns файла, "length": длина текста, "tokens": {токен: [позиции]}}},
+        # списки позиций общие с postings
+        self.docs: Dict[str, Dict] = {}
+        # Заметки, которые не удалось расшифровать {id: mtime_ns}
+        self.unreadable: Dict[str, int] = {}
+        # Индекс словаря {n-грамма: токены} для поиска по подстроке (строится при первом поиске)
+        self._grams: Optional[Dict[str, Set[str]]] = None
+        # Токены короче n-граммы
+        self._short_tokens: Set[str] = set()
+        self._dirty_segments: Set[int] = set()
+        self._dirty_since: Optional[float] = None
+        self._saver = FlushScheduler(self.save, "search-index-save")
+        # Сохранения идут по очереди, чтобы старый снимок сегмента не записался поверх нового
+        self._save_lock = threading.Lock()
+    
+    @property
+    def dirty(self) -> bool:
+        """Есть несохраненные изменения"""
+        return bool(self._dirty_segments)
+    
+    def exists(self) -> bool:
+        """Проверяет, сохранен ли индекс на диске"""
+        return self.index_dir.is_dir()
+    
+    def _segment(self, note_id: str) -> int:
+        """Получает номер сегмента заметки"""
+        return zlib.crc32(note_id.encode('utf-8')) % SEGMENT_COUNT
+    
+    def _segment_file(self, segment: int) -> Path:
+        """Получает путь к файлу сегмента"""
+        return self.index_dir / f"{segment:02x}.enc"
+    
+    def load(self) -> bool:
+        """
+        Загружает индекс с диска
+        
+        Сегмент, который не удалось прочитать, пропускается: его заметки
+        не считаются актуальными и переиндексируются при синхронизации.
+        
+        Returns:
+            True если все сегменты прочитаны
+        """
+        if not self.exists():
+            return False
+        
+        ok = True
+        with self.lock:
+            for segment_file in sorted(self.index_dir.glob("*.enc")):
+                try:
+                    with open(segment_file, 'rb') as f:
+                        blob = f.read()
+                    
+                    data = json.loads(self.encryption_manager.decrypt_bytes(blob).decode('utf-8'))
+                    if data.get("version") != self.VERSION:
+                        ok = False
+                        continue
+                    
+                    self.docs.update(data.get("docs", {}))
+                    self.unreadable.update(data.get("unreadable", {}))
+                except Exception as e:
+                    # Индекс можно перестроить, поэтому ошибка не критична
+                    print(f"Ошибка чтения сегмента поискового индекса {segment_file.name}: {e}")
+                    ok = False
+            
+            for note_id, doc in self.docs.items():
+                for token, positions in doc["tokens"].items():
+                    self.postings.setdefault(token, {})[note_id] = positions
+            self._grams = None
+        return ok
+    
+    def _mark_dirty(self, note_id: str):
+        """Отмечает сегмент заметки измененным и планирует отложенное сохранение (под self.lock)"""
+        self._dirty_segments.add(self._segment(note_id))
+        if self._dirty_since is None:
+            self._dirty_since = time.monotonic()
+        self._schedule_save()
+    
+    def _schedule_save(self, retry: bool = False):
+        """
+        Назначает отложенное сохранение с учетом максимальной задержки
+        
+        Args:
+            retry: Повтор после ошибки сохранения
+        """
+        if retry:
+            delay = SAVE_RETRY_DELAY
+        else:
+            deadline = self._dirty_since + self.max_save_interval
+            delay = max(0.0, min(self.save_delay, deadline - time.monotonic()))
+        self._saver.schedule(delay)
+    
+    def save(self) -> bool:
+        """
+        Сохраняет измененные сегменты на диск в зашифрованном виде
+        
+        Returns:
+            True если успешно (или сохранять нечего)
+        """
+        with self._save_lock:
+            with self.lock:
+                self._saver.cancel()
+                
+                segments = self._dirty_segments
+                self._dirty_segments = set()
+                self._dirty_since = None
+                
+                # Снимок сегментов под блокировкой, шифрование и запись - без нее
+                contents = {segment: {"version": self.VERSION, "docs": {}, "unreadable": {}}
+                            for segment in segments}
+                for key in ("docs", "unreadable"):
+                    for note_id, value in getattr(self, key).items():
+                        content = contents.get(self._segment(note_id))
+                        if content is not None:
+                            content[key][note_id] = value
+                blobs = {segment: json.dumps(content, ensure_ascii=False).encode('utf-8')
+                         for segment, content in contents.items()}
+            
+            failed = set()
+            try:
+                self.index_dir.mkdir(exist_ok=True)
+            except OSError as e:
+                print(f"Ошибка сохранения поискового индекса: {e}")
+                failed = set(blobs)
+            
+            for segment, data in blobs.items():
+                if segment in failed:
+                    continue
+                segment_file = self._segment_file(segment)
+                try:
+                    with file_lock(segment_file):
+                        atomic_write_bytes(segment_file, self.encryption_manager.encrypt_bytes(data))
+                except Exception as e:
+                    print(f"Ошибка сохранения сегмента поискового индекса {segment_file.name}: {e}")
+                    failed.add(segment)
+            
+            if failed:
+                with self.lock:
+                    self._dirty_segments |= failed
+                    if self._dirty_since is None:
+                        self._dirty_since = time.monotonic()
+                    self._schedule_save(retry=True)
+                return False
+            return True
+    
+    def _add_token(self, token: str):
+        """Добавляет новый токен в индекс словаря (под self.lock)"""
+        if self._grams is None:
+            return
+        if len(token) < GRAM_SIZE:
+            self._short_tokens.add(token)
+            return
+        for i in range(len(token) - GRAM_SIZE + 1):
+            self._grams.setdefault(token[i:i + GRAM_SIZE], set()).add(token)
+    
+    def _drop_token(self, token: str):
+        """Удаляет исчезнувший токен из индекса словаря (под self.lock)"""
+        if self._grams is None:
+            return
+        if len(token) < GRAM_SIZE:
+            self._short_tokens.discard(token)
+            return
+        for i in range(len(token) - GRAM_SIZE + 1):
+            gram = token[i:i + GRAM_SIZE]
+            tokens = self._grams.get(gram)
+            if tokens is not None:
+                tokens.discard(token)
+                if not tokens:
+                    del self._grams[gram]
+    
+    def update(self, note_id: str, content: str, mtime: int = 0):
+        """
+        Индексирует (или переиндексирует) содержимое заметки
+        
+        Args:
+            note_id: ID заметки
+            content: Содержимое заметки
+            mtime: mtime_ns файла заметки на момент индексации
+        """
+        text_lower = content.lower()
+        positions: Dict[str, List[int]] = {}
+        for token, pos in tokenize(text_lower):
+            positions.setdefault(token, []).append(pos)
+        
+        with self.lock:
+            self.remove(note_id)
+            for token, token_positions in positions.items():
+                if token not in self.postings:
+                    self._add_token(token)
+                self.postings.setdefault(token, {})[note_id] = token_positions
+            
+            self.docs[note_id] = {"mtime": mtime, "length": len(text_lower), "tokens": positions}
+            self._mark_dirty(note_id)
+    
+    def mark_unreadable(self, note_id: str, mtime: int):
+        """Запоминает заметку, которую не удалось расшифровать текущим паролем"""
+        with self.lock:
+            self.remove(note_id)
+            self.unreadable[note_id] = mtime
+            self._mark_dirty(note_id)
+    
+    def remove(self, note_id: str):
+        """
+        Удаляет заметку из индекса
+        
+        Args:
+            note_id: ID заметки
+        """
+        with self.lock:
+            if self.unreadable.pop(note_id, None) is not None:
+                self._mark_dirty(note_id)
+            doc = self.docs.pop(note_id, None)
+            if doc is None:
+                return
+            
+            for token in doc["tokens"]:
+                note_positions = self.postings.get(token)
+                if note_positions is None:
+                    continue
+                note_positions.pop(note_id, None)
+                if not note_positions:
+                    del self.postings[token]
+                    self._drop_token(token)
+            self._mark_dirty(note_id)
+    
+    def is_current(self, note_id: str, mtime: int) -> bool:
+        """Проверяет, актуальна ли запись индекса для файла заметки"""
+        with self.lock:
+            if note_id in self.docs:
+                return self.docs[note_id]["mtime"] == mtime
+            return self.unreadable.get(note_id) == mtime
+    
+    def indexed_ids(self) -> Set[str]:
+        """Возвращает ID всех проиндексированных заметок (включая нечитаемые)"""
+        with self.lock:
+            return set(self.docs) | set(self.unreadable)
+    
+    def _matching_tokens(self, part: str) -> Set[str]:
+        """
+        Находит токены словаря, содержащие подстроку, через индекс n-грамм (под self.lock)
+        
+        Args:
+            part: Токен запроса
+            
+        Returns:
+            Множество токенов словаря
+        """
+        if self._grams is None:
+            self._grams = {}
+            self._short_tokens = set()
+            for token in self.postings:
+                self._add_token(token)
+        
+        if len(part) >= GRAM_SIZE:
+            # Токен с подстрокой содержит каждую ее n-грамму - проверяем самую редкую
+            rarest = min((self._grams.get(part[i:i + GRAM_SIZE], set())
+                          for i in range(len(part) - GRAM_SIZE + 1)), key=len)
+            return {token for token in rarest if part in token}
+        
+        # Короткая подстрока: перебираем n-граммы, а не весь словарь
+        result = {token for token in self._short_tokens if part in token}
+        for gram, tokens in self._grams.items():
+            if part in gram:
+                result |= tokens
+        return result
+    
+    def candidates(self, query_lower: str) -> Set[str]:
+        """
+        Находит заметки, в содержимом которых может встречаться запрос
+        
+        Каждый токен запроса должен быть подстрокой какого-либо токена заметки,
+        поэтому итоговый набор - пересечение по токенам запроса.
+        
+        Args:
+            query_lower: Запрос в нижнем регистре
+            
+        Returns:
+            Множество ID заметок-кандидатов
+        """
+        query_tokens = {token for token, _ in tokenize(query_lower)}
+        
+        with self.lock:
+            if not query_tokens:
+                # Запрос без букв и цифр - проверяем все заметки
+                return set(self.docs)
+            
+            result: Optional[Set[str]] = None
+            # Сначала самые длинные токены запроса: у них меньше совпадений
+            for query_token in sorted(query_tokens, key=len, reverse=True):
+                matched: Set[str] = set()
+                for token in self._matching_tokens(query_token):
+                    matched.update(self.postings[token])
+                result = matched if result is None else result & matched
+                if not result:
+                    return set()
+            return result
+    
+    def needs_text(self, query_lower: str) -> bool:
+        """Проверяет, что вхождения запроса ищутся по тексту заметки (в запросе нет букв и цифр)"""
+        return not tokenize(query_lower)
+    
+    def get_mtime(self, note_id: str) -> Optional[int]:
+        """Получает mtime_ns файла заметки, с которым она проиндексирована"""
+        with self.lock:
+            doc = self.docs.get(note_id)
+            return doc["mtime"] if doc is not None else None
+    
+    def get_token_text(self, note_id: str) -> Optional[str]:
+        """
+        Восстанавливает слова заметки по позициям (для индекса ранжирования)
+        
+        Args:
+            note_id: ID заметки
+            
+        Returns:
+            Токены в порядке текста через пробел или None, если заметки нет в индексе
+        """
+        with self.lock:
+            doc = self.docs.get(note_id)
+            if doc is None:
+                return None
+            spans = sorted((pos, token) for token, positions in doc["tokens"].items() for pos in positions)
+        return " ".join(token for _, token in spans)
+    
+    def _verify(self, spans: List[Tuple[int, int, str]], starts: List[int], start: int,
+                query_tokens: List[tuple], length: int, text_length: int) -> bool:
+        """
+        Проверяет по позициям токенов, что запрос встречается с позиции start
+        
+        Токены заметки в окне совпадения должны в точности соответствовать
+        токенам запроса, только первый может начинаться раньше окна, а
+        последний - заканчиваться позже. Символы между токенами не хранятся
+        и сравниваются только по длине.
+        
+        Args:
+            spans: Отсортированные (начало, конец, токен) всех токенов заметки
+            starts: Начала токенов из spans
+            start: Проверяемая позиция начала совпадения
+            query_tokens: Токены запроса с позициями
+            length: Длина запроса
+            text_length: Длина текста заметки
+            
+        Returns:
+            True если совпадение подтверждено
+        """
+        end = start + length
+        if start < 0 or end > text_length:
+            return False
+        
+        i = bisect_right(starts, start) - 1
+        if i < 0 or spans[i][1] <= start:
+            i += 1
+        window = []
+        while i < len(spans) and spans[i][0] < end:
+            window.append(spans[i])
+            i += 1
+        if len(window) != len(query_tokens):
+            return False
+        
+        last = len(query_tokens) - 1
+        for n, ((token_start, token_end, token), (query_token, offset)) in enumerate(zip(window, query_tokens)):
+            query_start = start + offset
+            query_end = query_start + len(query_token)
+            if token_start != query_start and not (n == 0 and offset == 0 and token_start < query_start):
+                return False
+            if token_end != query_end and not (n == last and query_end == end and token_end > query_end):
+                return False
+            if token[query_start - token_start:query_end - token_start] != query_token:
+                return False
+        return True
+    
+    def match_positions(self, note_id: str, query_lower: str, text: Optional[str] = None) -> List[int]:
+        """
+        Находит позиции всех (в том числе перекрывающихся) вхождений запроса в заметку
+        
+        Вхождения ищутся по позициям токенов в индексе; текст заметки нужен
+        только для запроса без букв и цифр (см. needs_text).
+        
+        Args:
+            note_id: ID заметки
+            query_lower: Запрос в нижнем регистре
+            text: Содержимое заметки (для запроса без букв и цифр)
+            
+        Returns:
+            Отсортированные позиции начала вхождений
+        """
+        if not query_lower:
+            return []
+        
+        query_tokens = tokenize(query_lower)
+        if not query_tokens:
+            if text is None:
+                return []
+            # Поиск вперед (?=...) находит перекрывающиеся вхождения без цикла find в Python
+            pattern = re.compile(f"(?={re.escape(query_lower)})")
+            return [m.start() for m in pattern.finditer(text.lower())]
+        
+        with self.lock:
+            doc = self.docs.get(note_id)
+            if doc is None:
+                return []
+            tokens = doc["tokens"]
+            
+            first, first_offset = query_tokens[0]
+            # Запрос из одного слова без других символов - достаточно вхождения в токен
+            simple = len(query_tokens) == 1 and len(first) == len(query_lower)
+            spans = starts = None
+            if not simple:
+                spans = sorted((pos, pos + len(token), token) for token, positions in tokens.items()
+                               for pos in positions)
+                starts = [span[0] for span in spans]
+            
+            result = []
+            for token, positions in tokens.items():
+                for offset in _occurrences(token, first):
+                    for pos in positions:
+                        start = pos + offset - first_offset
+                        if simple or self._verify(spans, starts, start, query_tokens, len(query_lower),
+                                                  doc["length"]):
+                            result.append(start)
+        result.sort()
+        return result
@@ -0,0 +1,225 @@
+"""
+Реестр менеджеров по сессиям пользователей
+"""
+import os
+import hmac
+import time
+import threading
+from typing import Dict, List, Optional, Tuple
+from encryption import EncryptionManager
+from file_manager import FileManager
+from rekey_job import get_rekey_fallback
+
+
+# Через сколько секунд простоя сессия выгружается из памяти
+IDLE_TIMEOUT = 30 * 60
+# Как часто проверять простаивающие сессии (сек)
+SWEEP_INTERVAL = 60
+
+
+class SessionContext:
+    """Менеджеры одной сессии: ключи, кеш метаданных и индексы живут между запросами"""
+    
+    def __init__(self, password: str, notes_dir: str = "notes"):
+        """
+        Инициализация контекста сессии
+        
+        Args:
+            password: Пароль пользователя
+            notes_dir: Директория заметок
+        """
+        self.encryption_manager = EncryptionManager(password, notes_dir)
+        # Пока идет перешифрование после смены пароля, часть файлов читается старым ключом
+        self.encryption_manager.fallback = get_rekey_fallback(notes_dir, password)
+        self.file_manager = FileManager(notes_dir, encryption_manager=self.encryption_manager)
+        self.last_used = time.monotonic()
+        # Потоковые поиски сессии {токен отмены: событие}
+        self._searches: Dict[str, threading.Event] = {}
+        self._searches_lock = threading.Lock()
+    
+    def matches(self, password: str) -> bool:
+        """Проверяет, что контекст создан для этого пароля"""
+        return hmac.compare_digest(self.encryption_manager.password, password.encode('utf-8'))
+    
+    def start_search(self, token: str) -> threading.Event:
+        """
+        Регистрирует потоковый поиск и отменяет предыдущие поиски сессии
+        
+        Пользователь печатает запрос - результаты старого запроса уже не нужны.
+        
+        Args:
+            token: Токен отмены от клиента
+            
+        Returns:
+            Событие отмены нового поиска
+        """
+        event = threading.Event()
+        with self._searches_lock:
+            for old_event in self._searches.values():
+                old_event.set()
+            self._searches = {token: event}
+        return event
+    
+    def finish_search(self, token: str, event: threading.Event):
+        """Снимает завершенный поиск с учета"""
+        with self._searches_lock:
+            if self._searches.get(token) is event:
+                del self._searches[token]
+    
+    def cancel_search(self, token: str) -> bool:
+        """
+        Отменяет потоковый поиск по токену
+        
+        Args:
+            token: Токен отмены
+            
+        Returns:
+            True если поиск шел и был отменен
+        """
+        with self._searches_lock:
+            event = self._searches.pop(token, None)
+        if event is None:
+            return False
+        event.set()
+        return True
+    
+    def close(self):
+        """Сохраняет отложенные изменения и забывает ключевой материал"""
+        try:
+            self.file_manager.close()
+        except Exception as e:
+            print(f"Ошибка закрытия сессии: {e}")
+        self.encryption_manager.forget_keys()
+
+
+class SessionRegistry:
+    """Реестр контекстов {id сессии: SessionContext} с выгрузкой по простою"""
+    
+    def __init__(self, notes_dir: str = "notes", idle_timeout: float = IDLE_TIMEOUT):
+        """
+        Инициализация реестра
+        
+        Args:
+            notes_dir: Директория заметок
+            idle_timeout: Время простоя до выгрузки сессии (сек)
+        """
+        self.notes_dir = notes_dir
+        self.idle_timeout = idle_timeout
+        self._contexts: Dict[str, SessionContext] = {}
+        self._lock = threading.Lock()
+        self._last_sweep = time.monotonic()
+    
+    def _sweep(self) -> List[SessionContext]:
+        """
+        Убирает из реестра простаивающие сессии (вызывается под self._lock)
+        
+        Returns:
+            Убранные контексты, их нужно закрыть вне блокировки
+        """
+        now = time.monotonic()
+        if now - self._last_sweep < SWEEP_INTERVAL:
+            return []
+        self._last_sweep = now
+        
+        expired = [session_id for session_id, context in self._contexts.items()
+                   if now - context.last_used > self.idle_timeout]
+        return [self._contexts.pop(session_id) for session_id in expired]
+    
+    def _close_all(self, contexts: List[SessionContext]):
+        """Закрывает выгруженные контексты"""
+        for context in contexts:
+            context.close()
+    
+    def create(self, password: str) -> Tuple[str, SessionContext]:
+        """
+        Создает контекст для новой сессии
+        
+        Args:
+            password: Пароль пользователя
+            
+        Returns:
+            Пара (id сессии, контекст)
+        """
+        session_id = os.urandom(16).hex()
+        context = SessionContext(password, self.notes_dir)
+        with self._lock:
+            expired = self._sweep()
+            self._contexts[session_id] = context
+        self._close_all(expired)
+        return session_id, context
+    
+    def get(self, session_id: Optional[str], password: str) -> Optional[SessionContext]:
+        """
+        Получает контекст сессии
+        
+        Args:
+            session_id: ID сессии
+            password: Пароль из сессии (должен совпадать с паролем контекста)
+            
+        Returns:
+            Контекст или None, если его нет (например, после перезапуска сервера)
+        """
+        with self._lock:
+            expired = self._sweep()
+            context = self._contexts.get(session_id) if session_id else None
+            if context is not None and context.matches(password):
+                context.last_used = time.monotonic()
+            else:
+                context = None
+        self._close_all(expired)
+        return context
+    
+    def attach(self, session_id: str, password: str) -> SessionContext:
+        """
+        Получает контекст сессии, создавая его под тем же id, если в этом процессе его нет
+        
+        Нужно, когда запросы одной сессии попадают в разные воркеры: каждый
+        воркер держит свой контекст, а id в сессии пользователя не меняется.
+        
+        Args:
+            session_id: ID сессии
+            password: Пароль из сессии
+            
+        Returns:
+            Контекст
+        """
+        context = self.get(session_id, password)
+        if context is not None:
+            return context
+        
+        context = SessionContext(password, self.notes_dir)
+        with self._lock:
+            expired = self._sweep()
+            existing = self._contexts.get(session_id)
+            if existing is not None and existing.matches(password):
+                # Контекст успел создать параллельный запрос
+                existing.last_used = time.monotonic()
+                context, replaced = existing, None
+            else:
+                replaced = existing
+                self._contexts[session_id] = context
+        if replaced is not None:
+            expired.append(replaced)
+        self._close_all(expired)
+        return context
+    
+    def drop(self, session_id: Optional[str]):
+        """
+        Выгружает контекст сессии (выход из системы)
+        
+        Args:
+            session_id: ID сессии
+        """
+        if not session_id:
+            return
+        with self._lock:
+            context = self._contexts.pop(session_id, None)
+        if context is not None:
+            context.close()
+    
+    def drop_all(self):
+        """Выгружает все контексты (смена пароля делает их ключи устаревшими)"""
+        with self._lock:
+            contexts = list(self._contexts.values())
+            self._contexts.clear()
+        self._close_all(contexts)
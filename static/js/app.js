@@ -6,6 +6,8 @@ let canvasEditor = null;
 let kanbanEditor = null;
 let currentNoteType = 'text';
 let currentNoteLinks = [];
+// Последняя сохраненная версия открытой заметки {id, version, content} - основа для PATCH
+let savedNote = null;
 
 // Настройка marked для markdown
 if (typeof marked !== 'undefined') {
@@ -296,6 +298,7 @@ function showApp() {
     document.getElementById('login-screen').style.display = 'none';
     document.getElementById('app').style.display = 'flex';
     loadGlobalTodos();
+    changeFeed.start();
 }
 
 // Настройка обработчиков событий
@@ -595,6 +598,7 @@ async function handleLogin() {
 async function handleLogout() {
     try {
         await fetch('/api/logout', { method: 'POST' });
+        changeFeed.stop();
         currentNoteId = null;
         showLogin();
     } catch (error) {
@@ -602,10 +606,61 @@ async function handleLogout() {
     }
 }
 
-// Загрузка списка заметок
+// Лента изменений: список заметок и глобальный TODO обновляются по событиям сервера
+const changeFeed = new ChangeFeed();
+changeFeed
+    .on('note', applyNoteChange)
+    .on('todos', (event) => {
+        if (!event.todos) return;
+        globalTodos = event.todos;
+        renderTodos('global', globalTodos);
+    })
+    .on('reset', () => {
+        loadNotes();
+        loadGlobalTodos();
+    });
+
+// Применяет изменение заметки к списку без повторной загрузки всего списка
+function applyNoteChange(event) {
+    const index = notesList.findIndex(note => note.id === event.id);
+    if (event.action === 'deleted') {
+        if (index === -1) return;
+        notesList.splice(index, 1);
+    } else if (event.note) {
+        if (index !== -1) notesList.splice(index, 1);
+        // Список отсортирован по дате изменения - измененная заметка первая
+        notesList.unshift(event.note);
+    } else {
+        // Данные приложены к более позднему событию этой же заметки
+        return;
+    }
+    
+    // Во время поиска список на экране - результаты поиска, их не трогаем
+    if (!document.getElementById('search-input').value.trim()) {
+        renderNotesList(notesList);
+    }
+    renderAllTags();
+    updateStats();
+}
+
+// Повторная загрузка списка после действия - только если ленты изменений нет
+async function reloadNotesUnlessLive() {
+    if (!changeFeed.isLive()) {
+        await loadNotes();
+    }
+}
+
+// Размер страницы списка заметок
+const NOTES_PAGE_SIZE = 200;
+
+// Номер загрузки списка: более новая загрузка останавливает догрузку страниц предыдущей
+let notesLoadId = 0;
+
+// Загрузка списка заметок: первая страница отображается сразу, остальные догружаются
 async function loadNotes() {
+    const loadId = ++notesLoadId;
     try {
-        const response = await fetch('/api/notes');
+        const response = await fetch(`/api/notes?limit=${NOTES_PAGE_SIZE}`);
         const data = await response.json();
         
         if (response.ok) {
@@ -613,6 +668,9 @@ async function loadNotes() {
             renderNotesList(notesList);
             renderAllTags();
             updateStats();
+            if (data.next_cursor) {
+                loadMoreNotes(loadId, data.next_cursor);
+            }
         } else {
             console.error('Ошибка загрузки списка заметок:', data.error || 'Неизвестная ошибка');
             if (response.status === 401) {
@@ -625,6 +683,26 @@ async function loadNotes() {
     }
 }
 
+// Догрузка следующих страниц списка заметок
+async function loadMoreNotes(loadId, cursor) {
+    try {
+        while (cursor && loadId === notesLoadId) {
+            const response = await fetch(`/api/notes?limit=${NOTES_PAGE_SIZE}&cursor=${encodeURIComponent(cursor)}`);
+            const data = await response.json();
+            if (!response.ok || loadId !== notesLoadId) return;
+            
+            notesList = notesList.concat(data.notes || []);
+            cursor = data.next_cursor;
+        }
+        if (loadId === notesLoadId) {
+            renderNotesList(notesList);
+            updateStats();
+        }
+    } catch (error) {
+        console.error('Ошибка загрузки заметок:', error);
+    }
+}
+
 // Отображение списка заметок
 function renderNotesList(notes) {
     const notesListDiv = document.getElementById('notes-list');
@@ -675,6 +753,7 @@ async function loadNote(noteId) {
         if (response.ok && data.note) {
             currentNoteId = noteId;
             currentNoteType = data.note.type || 'text';
+            savedNote = { id: noteId, version: data.note.version, content: data.note.content || '' };
             document.getElementById('note-title').value = data.note.title || '';
             
             // Показываем соответствующий редактор
@@ -800,7 +879,7 @@ async function handleCreateNote() {
             document.getElementById('new-note-modal').style.display = 'none';
             document.getElementById('new-note-title').value = '';
             showToast('Заметка создана', 'success');
-            await loadNotes();
+            await reloadNotesUnlessLive();
             if (data.note) {
                 loadNote(data.note.id);
             }
@@ -835,7 +914,7 @@ async function deleteNote(noteId) {
                 renderTodos('note', []);
             }
             showToast('Заметка удалена', 'success');
-            await loadNotes();
+            await reloadNotesUnlessLive();
         }
     } catch (error) {
         console.error('Ошибка удаления заметки:', error);
@@ -899,6 +978,78 @@ function scheduleAutoSave() {
     }, 2000);
 }
 
+// Правка текста: общий префикс и суффикс остаются, середина заменяется
+function diffText(oldText, newText) {
+    const minLength = Math.min(oldText.length, newText.length);
+    let start = 0;
+    while (start < minLength && oldText[start] === newText[start]) start++;
+    let end = 0;
+    while (end < minLength - start &&
+           oldText[oldText.length - 1 - end] === newText[newText.length - 1 - end]) end++;
+    return [{
+        pos: start,
+        delete: oldText.length - start - end,
+        insert: newText.slice(start, newText.length - end)
+    }];
+}
+
+// JSON Patch (RFC 6902) между двумя JSON значениями
+function diffJson(oldValue, newValue, path, ops) {
+    if (oldValue === newValue) return ops;
+    const isObject = value => value !== null && typeof value === 'object' && !Array.isArray(value);
+    
+    if (Array.isArray(oldValue) && Array.isArray(newValue)) {
+        const common = Math.min(oldValue.length, newValue.length);
+        for (let i = 0; i < common; i++) {
+            diffJson(oldValue[i], newValue[i], `${path}/${i}`, ops);
+        }
+        for (let i = oldValue.length - 1; i >= newValue.length; i--) {
+            ops.push({ op: 'remove', path: `${path}/${i}` });
+        }
+        for (let i = oldValue.length; i < newValue.length; i++) {
+            ops.push({ op: 'add', path: `${path}/${i}`, value: newValue[i] });
+        }
+    } else if (isObject(oldValue) && isObject(newValue)) {
+        const escapeKey = key => key.replace(/~/g, '~0').replace(/\//g, '~1');
+        for (const key of Object.keys(oldValue)) {
+            if (!(key in newValue)) ops.push({ op: 'remove', path: `${path}/${escapeKey(key)}` });
+        }
+        for (const key of Object.keys(newValue)) {
+            const keyPath = `${path}/${escapeKey(key)}`;
+            if (key in oldValue) {
+                diffJson(oldValue[key], newValue[key], keyPath, ops);
+            } else {
+                ops.push({ op: 'add', path: keyPath, value: newValue[key] });
+            }
+        }
+    } else if (JSON.stringify(oldValue) !== JSON.stringify(newValue)) {
+        ops.push({ op: 'replace', path, value: newValue });
+    }
+    return ops;
+}
+
+// Тело PATCH относительно последней сохраненной версии или null, если выгоднее отправить заметку целиком
+function buildPatchBody(title, content, tags) {
+    if (!savedNote || savedNote.id !== currentNoteId || typeof savedNote.version !== 'number') return null;
+    
+    const body = { base_version: savedNote.version, title, tags };
+    if (content === savedNote.content) return body;
+    
+    if (currentNoteType === 'canvas' || currentNoteType === 'kanban') {
+        try {
+            const oldValue = savedNote.content ? JSON.parse(savedNote.content) : {};
+            body.json_patch = diffJson(oldValue, JSON.parse(content), '', []);
+        } catch (e) {
+            return null;
+        }
+    } else {
+        body.ops = diffText(savedNote.content, content);
+    }
+    
+    // Если изменилось почти все, PATCH не дает выигрыша
+    return JSON.stringify(body).length < content.length / 2 ? body : null;
+}
+
 // Автосохранение заметки
 async function autoSave() {
     if (!currentNoteId) return;
@@ -915,11 +1066,35 @@ async function autoSave() {
         const tags = currentTags;
         
         try {
-            const response = await fetch(`/api/notes/${currentNoteId}`, {
-                method: 'PUT',
-                headers: { 'Content-Type': 'application/json' },
-                body: JSON.stringify({ title, content, tags })
-            });
+            const noteId = currentNoteId;
+            let response = null;
+            
+            // Сначала пробуем отправить только изменения
+            const patchBody = buildPatchBody(title, content, tags);
+            if (patchBody) {
+                response = await fetch(`/api/notes/${noteId}`, {
+                    method: 'PATCH',
+                    headers: { 'Content-Type': 'application/json' },
+                    body: JSON.stringify(patchBody)
+                });
+                if (response.ok) {
+                    const data = await response.json();
+                    savedNote = { id: noteId, version: data.version, content };
+                }
+            }
+            
+            // Версия на сервере изменилась или PATCH не подошел - сохраняем целиком
+            if (!response || !response.ok) {
+                response = await fetch(`/api/notes/${noteId}`, {
+                    method: 'PUT',
+                    headers: { 'Content-Type': 'application/json' },
+                    body: JSON.stringify({ title, content, tags })
+                });
+                if (response.ok) {
+                    const data = await response.json();
+                    savedNote = { id: noteId, version: data.note.version, content };
+                }
+            }
         
             const saveStatus = document.getElementById('save-status');
         if (response.ok) {
@@ -930,7 +1105,7 @@ async function autoSave() {
                 saveStatus.className = 'save-status';
             }, 2000);
             updateStats();
-            await loadNotes();
+            await reloadNotesUnlessLive();
         } else {
             saveStatus.textContent = 'Ошибка сохранения';
             saveStatus.className = 'save-status';
@@ -1362,26 +1537,30 @@ function updateTagsInput() {
     scheduleAutoSave();
 }
 
-function renderAllTags() {
-    const allTags = new Set();
-    notesList.forEach(note => {
-        if (note.tags) {
-            note.tags.forEach(tag => allTags.add(tag));
+async function renderAllTags() {
+    // Счетчики тегов считает сервер по индексу тегов
+    let tags = [];
+    try {
+        const response = await fetch('/api/tags');
+        const data = await response.json();
+        if (response.ok) {
+            tags = data.tags || [];
         }
-    });
+    } catch (error) {
+        console.error('Ошибка загрузки тегов:', error);
+    }
     
     const container = document.getElementById('tags-list');
     container.innerHTML = '';
     
-    if (allTags.size === 0) {
+    if (tags.length === 0) {
         document.getElementById('tags-container').style.display = 'none';
         return;
     }
     
     document.getElementById('tags-container').style.display = 'block';
     
-    Array.from(allTags).sort().forEach(tag => {
-        const count = notesList.filter(n => n.tags && n.tags.includes(tag)).length;
+    tags.sort((a, b) => a.tag.localeCompare(b.tag)).forEach(({ tag, count }) => {
         const tagEl = document.createElement('span');
         tagEl.className = `tag-item ${activeTagFilter === tag ? 'active' : ''}`;
         tagEl.innerHTML = `
@@ -1393,14 +1572,21 @@ function renderAllTags() {
     });
 }
 
-function filterByTag(tag) {
+async function filterByTag(tag) {
     if (activeTagFilter === tag) {
         activeTagFilter = null;
         renderNotesList(notesList);
     } else {
         activeTagFilter = tag;
-        const filtered = notesList.filter(n => n.tags && n.tags.includes(tag));
-        renderNotesList(filtered);
+        try {
+            const response = await fetch(`/api/notes?tag=${encodeURIComponent(tag)}`);
+            const data = await response.json();
+            if (response.ok) {
+                renderNotesList(data.notes || []);
+            }
+        } catch (error) {
+            console.error('Ошибка фильтрации по тегу:', error);
+        }
     }
     renderAllTags();
 }
@@ -1459,7 +1645,7 @@ async function duplicateNote() {
         
         if (response.ok) {
             showToast('Заметка скопирована', 'success');
-            await loadNotes();
+            await reloadNotesUnlessLive();
             if (data.note) {
                 loadNote(data.note.id);
             }
@@ -1525,6 +1711,9 @@ async function handleChangePassword() {
             document.getElementById('change-password-new').value = '';
             document.getElementById('change-password-confirm').value = '';
             showToast('Пароль успешно изменен', 'success');
+            if (data.rekey && data.rekey.status !== 'done') {
+                pollRekeyStatus();
+            }
         } else {
             errorDiv.textContent = data.error || 'Ошибка смены пароля';
         }
@@ -1533,6 +1722,22 @@ async function handleChangePassword() {
     }
 }
 
+// Ждем окончания фонового перешифрования файлов после смены пароля
+async function pollRekeyStatus() {
+    try {
+        const response = await fetch('/api/rekey-status');
+        if (!response.ok) return;
+        const progress = await response.json();
+        if (progress.status === 'pending' || progress.status === 'running') {
+            setTimeout(pollRekeyStatus, 2000);
+        } else if (progress.status === 'done' && progress.failed > 0) {
+            showToast(`Не удалось перешифровать файлов: ${progress.failed}`, 'warning');
+        }
+    } catch (error) {
+        console.error('Ошибка получения статуса перешифрования:', error);
+    }
+}
+
 function openChangePasswordModal() {
     document.getElementById('change-password-modal').style.display = 'flex';
     document.getElementById('change-password-old').focus();
@@ -1,9 +1,11 @@
 // Компактный календарь с popup и выбором цвета
 class Calendar {
-    constructor(containerId) {
+    constructor(containerId, changeFeed = null) {
         this.container = document.getElementById(containerId);
         if (!this.container) return;
         
+        // Лента изменений: календарь обновляется по событиям сервера, а не перезагрузкой после каждого действия
+        this.changeFeed = changeFeed;
         this.currentDate = new Date();
         this.events = {};
         this.noteLinks = {}; // {date: [{id, title}]}
@@ -18,8 +20,15 @@ class Calendar {
         this.createPopup();
         this.render();
         this.loadEvents();
-        this.loadNoteLinks();
         this.checkHighlightDate();
+        
+        if (this.changeFeed) {
+            this.changeFeed
+                .on('calendar', (event) => {
+                    if (event.events) this.setEvents(event.events);
+                })
+                .on('reset', () => this.loadEvents());
+        }
     }
     
     // Проверка подсветки даты (при переходе с заметки)
@@ -37,18 +46,34 @@ class Calendar {
         }
     }
     
-    // Загрузка связей заметок с датами
-    async loadNoteLinks() {
-        try {
-            const response = await fetch('/api/calendar/all-note-links');
-            const data = await response.json();
-            
-            if (response.ok && data.links) {
-                this.noteLinks = data.links;
-                this.render();
-            }
-        } catch (error) {
-            console.error('Ошибка загрузки связей заметок:', error);
+    // Связи заметок с датами - события note_link в самом календаре, отдельный запрос не нужен
+    buildNoteLinks(events) {
+        const links = {};
+        for (const [date, dateEvents] of Object.entries(events)) {
+            const notes = dateEvents
+                .filter(e => e.type === 'note_link')
+                .map(e => ({ id: e.note_id, title: e.note_title || 'Без названия' }));
+            if (notes.length > 0) links[date] = notes;
+        }
+        return links;
+    }
+    
+    setEvents(events) {
+        this.events = events;
+        this.noteLinks = this.buildNoteLinks(events);
+        this.render();
+        
+        // Открытый день показывает актуальные данные
+        const popup = document.getElementById('calendar-popup');
+        if (this.selectedDate && popup && popup.classList.contains('visible')) {
+            this.showPopup(this.selectedDate);
+        }
+    }
+    
+    // Загрузка календаря заново - только если ленты изменений нет (иначе изменение придет событием)
+    async reloadUnlessLive() {
+        if (!this.changeFeed || !this.changeFeed.isLive()) {
+            await this.loadEvents();
         }
     }
     
@@ -124,8 +149,7 @@ class Calendar {
             const data = await response.json();
             
             if (response.ok && data.events) {
-                this.events = data.events;
-                this.render();
+                this.setEvents(data.events);
             }
         } catch (error) {
             console.error('Ошибка загрузки календаря:', error);
@@ -316,7 +340,8 @@ class Calendar {
                 });
                 
                 if (response.ok) {
-                    await this.loadEvents();
+                    this.applyLocal(date, events => events.concat([marker]));
+                    await this.reloadUnlessLive();
                 }
             } catch (error) {
                 console.error('Ошибка добавления цвета:', error);
@@ -344,7 +369,12 @@ class Calendar {
             });
             
             if (response.ok) {
-                await this.loadEvents();
+                // ID маркера выдает сервер - до события ленты используется временный
+                this.applyLocal(date, events => {
+                    const rest = events.filter(e => e.type !== 'important_marker');
+                    return important ? rest.concat([{ id: 'important_pending', type: 'important_marker' }]) : rest;
+                });
+                await this.reloadUnlessLive();
                 return true;
             }
             return false;
@@ -363,7 +393,8 @@ class Calendar {
             });
             
             if (response.ok) {
-                await this.loadEvents();
+                this.applyLocal(date, events => events.concat([event]));
+                await this.reloadUnlessLive();
                 return true;
             }
             return false;
@@ -382,7 +413,8 @@ class Calendar {
             });
             
             if (response.ok) {
-                await this.loadEvents();
+                this.applyLocal(date, events => events.filter(e => e.id !== eventId));
+                await this.reloadUnlessLive();
                 return true;
             }
             return false;
@@ -392,6 +424,16 @@ class Calendar {
         }
     }
     
+    // Применяет изменение дня сразу после успешного ответа сервера
+    applyLocal(date, change) {
+        const events = Object.assign({}, this.events);
+        events[date] = change(events[date] || []);
+        if (events[date].length === 0) delete events[date];
+        this.events = events;
+        this.noteLinks = this.buildNoteLinks(events);
+        this.render();
+    }
+    
     getDayEvents(date) {
         return this.events[date] || [];
     }
@@ -1769,47 +1769,87 @@ class CanvasEditor {
         }
     }
     
-    loadImage(file) {
+    // Загружает картинку в хранилище вложений, возвращает ID вложения или null
+    async uploadImage(blob) {
+        try {
+            const formData = new FormData();
+            formData.append('file', blob);
+            const response = await fetch('/api/attachments', { method: 'POST', body: formData });
+            if (!response.ok) return null;
+            const data = await response.json();
+            return data.attachment.id;
+        } catch (e) {
+            console.error('Ошибка загрузки вложения:', e);
+            return null;
+        }
+    }
+    
+    attachmentUrl(attachmentId) {
+        return `/api/attachments/${attachmentId}`;
+    }
+    
+    // Переносит картинку, хранящуюся в JSON как data URL, в хранилище вложений
+    async migrateImage(imageObj) {
+        const blob = await (await fetch(imageObj.image.src)).blob();
+        const attachmentId = await this.uploadImage(blob);
+        if (attachmentId && this.images.includes(imageObj)) {
+            imageObj.attachment = attachmentId;
+            // redraw вызывает onChange - холст сохранится уже со ссылкой
+            this.redraw();
+        }
+    }
+    
+    async loadImage(file) {
+        const attachmentId = await this.uploadImage(file);
+        if (attachmentId) {
+            this.addImage(this.attachmentUrl(attachmentId), attachmentId);
+            return;
+        }
+        
+        // Без хранилища вложений картинка хранится в JSON как раньше
         const reader = new FileReader();
-        reader.onload = (e) => {
-            const img = new Image();
-            img.onload = () => {
-                // Позиционируем изображение в центре видимой области canvas
-                const rect = this.container.getBoundingClientRect();
-                const centerX = rect.width / 2;
-                const centerY = rect.height / 2;
-                const canvasPos = this.screenToCanvas(centerX, centerY);
-                
-                // Ограничиваем размер изображения
-                const maxWidth = 400;
-                const maxHeight = 400;
-                let width = img.width;
-                let height = img.height;
-                
-                if (width > maxWidth || height > maxHeight) {
-                    const ratio = Math.min(maxWidth / width, maxHeight / height);
-                    width = width * ratio;
-                    height = height * ratio;
-                }
-                
-                const imageData = {
-                    id: 'img_' + Date.now(),
-                    image: img,
-                    x: canvasPos.x - width / 2,
-                    y: canvasPos.y - height / 2,
-                    width: width,
-                    height: height
-                };
-                this.images.push(imageData);
-                this.selectedImage = imageData;
-                this.selectedNode = null;
-                this.selectedEdge = null;
-                this.selectedDrawing = null;
-                this.redraw();
+        reader.onload = (e) => this.addImage(e.target.result, null);
+        reader.readAsDataURL(file);
+    }
+    
+    addImage(src, attachmentId) {
+        const img = new Image();
+        img.onload = () => {
+            // Позиционируем изображение в центре видимой области canvas
+            const rect = this.container.getBoundingClientRect();
+            const centerX = rect.width / 2;
+            const centerY = rect.height / 2;
+            const canvasPos = this.screenToCanvas(centerX, centerY);
+            
+            // Ограничиваем размер изображения
+            const maxWidth = 400;
+            const maxHeight = 400;
+            let width = img.width;
+            let height = img.height;
+            
+            if (width > maxWidth || height > maxHeight) {
+                const ratio = Math.min(maxWidth / width, maxHeight / height);
+                width = width * ratio;
+                height = height * ratio;
+            }
+            
+            const imageData = {
+                id: 'img_' + Date.now(),
+                attachment: attachmentId,
+                image: img,
+                x: canvasPos.x - width / 2,
+                y: canvasPos.y - height / 2,
+                width: width,
+                height: height
             };
-            img.src = e.target.result;
+            this.images.push(imageData);
+            this.selectedImage = imageData;
+            this.selectedNode = null;
+            this.selectedEdge = null;
+            this.selectedDrawing = null;
+            this.redraw();
         };
-        reader.readAsDataURL(file);
+        img.src = src;
     }
     
     deleteSelected() {
@@ -2802,7 +2842,7 @@ class CanvasEditor {
             frames: this.frames,
             images: this.images.map(img => ({
                 id: img.id,
-                dataUrl: img.image.src,
+                ...(img.attachment ? { attachment: img.attachment } : { dataUrl: img.image.src }),
                 x: img.x,
                 y: img.y,
                 width: img.width,
@@ -2828,17 +2868,22 @@ class CanvasEditor {
                 parsed.images.forEach(imgData => {
                     const img = new Image();
                     img.onload = () => {
-                        this.images.push({
+                        const imageObj = {
                             id: imgData.id,
+                            attachment: imgData.attachment || null,
                             image: img,
                             x: imgData.x,
                             y: imgData.y,
                             width: imgData.width,
                             height: imgData.height
-                        });
+                        };
+                        this.images.push(imageObj);
                         this.redraw();
+                        if (!imageObj.attachment) {
+                            this.migrateImage(imageObj);
+                        }
                     };
-                    img.src = imgData.dataUrl;
+                    img.src = imgData.attachment ? this.attachmentUrl(imgData.attachment) : imgData.dataUrl;
                 });
             }
             
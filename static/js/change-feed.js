@@ -0,0 +1,64 @@
+// Лента изменений сервера (/api/changes): заметки, календарь, TODO, словарь
+// EventSource сам переподключается и продолжает с Last-Event-ID - номера последнего события
+class ChangeFeed {
+    constructor(url = '/api/changes') {
+        this.url = url;
+        this.handlers = {};
+        this.source = null;
+        this.live = false;
+    }
+    
+    // Подписка на события типа (note, calendar, todos, dictionary) или reset
+    on(type, handler) {
+        if (!this.handlers[type]) this.handlers[type] = [];
+        this.handlers[type].push(handler);
+        return this;
+    }
+    
+    emit(type, event) {
+        (this.handlers[type] || []).forEach(handler => {
+            try {
+                handler(event);
+            } catch (error) {
+                console.error('Ошибка обработки изменения:', error);
+            }
+        });
+    }
+    
+    start() {
+        if (this.source || !window.EventSource) return;
+        
+        this.source = new EventSource(this.url);
+        this.source.addEventListener('ready', () => {
+            this.live = true;
+        });
+        this.source.addEventListener('change', (e) => {
+            const event = JSON.parse(e.data);
+            this.emit(event.type, event);
+        });
+        // Пропущенные события уже удалены из журнала - данные нужно загрузить заново
+        this.source.addEventListener('reset', () => {
+            this.emit('reset', null);
+        });
+        this.source.onerror = () => {
+            // Пока соединения нет, изменения загружаются как раньше - запросами после действий
+            this.live = false;
+            if (this.source && this.source.readyState === EventSource.CLOSED) {
+                this.source = null;
+            }
+        };
+    }
+    
+    stop() {
+        if (this.source) {
+            this.source.close();
+            this.source = null;
+        }
+        this.live = false;
+    }
+    
+    // true - изменения приходят по ленте и повторная загрузка после действия не нужна
+    isLive() {
+        return this.live;
+    }
+}
@@ -27,6 +27,7 @@ class GraphView {
         this.targetPositions = new Map();
         this.linkGroups = new Map();
         this.currentFilter = 'all';
+        this.dataVersion = null;
         
         // События
         this.onNodeClick = null;
@@ -70,7 +71,11 @@ class GraphView {
         this.redraw();
     }
     
-    setData(data) {
+    setData(data, version = null) {
+        // Тот же граф уже показан - не сбрасываем раскладку
+        if (version && version === this.dataVersion) return;
+        this.dataVersion = version;
+        
         // Поддержка как {notes, links} так и {nodes, edges}
         this.nodes = data.nodes || data.notes || [];
         this.edges = data.edges || data.links || [];
@@ -6,15 +6,32 @@ let notesList = [];
 let allLinks = [];
 let isGraphExpanded = false;
 
-// Проверка аутентификации
+// Лента изменений: граф, статистика и последние заметки обновляются, когда заметки меняются
+const changeFeed = new ChangeFeed();
+let homeRefreshTimer = null;
+
+function scheduleHomeRefresh() {
+    // Пачка изменений (например, серия сохранений) - одно обновление
+    clearTimeout(homeRefreshTimer);
+    homeRefreshTimer = setTimeout(loadAllData, 1000);
+}
+
+changeFeed
+    .on('note', scheduleHomeRefresh)
+    .on('reset', scheduleHomeRefresh);
+
+// Проверка аутентификации: тот же запрос сразу приносит данные главной страницы
 async function checkAuth() {
     try {
-        const response = await fetch('/api/check-auth');
-        const data = await response.json();
+        const data = await loadBootstrap();
+        if (!data) {
+            showLogin();
+            return;
+        }
         
-        if (data.initialized && data.authenticated) {
-            showHome();
-        } else if (data.initialized && !data.authenticated) {
+        if (data.auth.initialized && data.auth.authenticated) {
+            showHome(data);
+        } else if (data.auth.initialized && !data.auth.authenticated) {
             showLogin();
         } else {
             showInit();
@@ -37,12 +54,17 @@ function showInit() {
     document.getElementById('home-app').style.display = 'none';
 }
 
-function showHome() {
+function showHome(data = null) {
     document.getElementById('login-screen').style.display = 'none';
     document.getElementById('home-app').style.display = 'flex';
     
     initComponents();
-    loadAllData();
+    changeFeed.start();
+    if (data) {
+        renderHomeData(data);
+    } else {
+        loadAllData();
+    }
 }
 
 function initComponents() {
@@ -73,171 +95,163 @@ function initComponents() {
     if (!calendar) {
         const container = document.getElementById('calendar-container');
         if (container) {
-            calendar = new Calendar('calendar-container');
+            calendar = new Calendar('calendar-container', changeFeed);
         }
     }
 }
 
 async function loadAllData() {
-    await Promise.all([
-        loadNotes(),
-        loadGraphData(),
-        loadStats(),
-        loadRecentNotes(),
-        loadAccessHistory()
-    ]);
+    const data = await loadBootstrap();
+    if (data && data.auth.authenticated) {
+        renderHomeData(data);
+    }
 }
 
-async function loadNotes() {
+// Копия данных главной страницы между загрузками: сервер отвечает 304, если данные не изменились
+const BOOTSTRAP_CACHE_KEY = 'zametik-bootstrap-cache';
+
+function readBootstrapCache() {
     try {
-        const response = await fetch('/api/notes');
-        const data = await response.json();
-        
-        if (response.ok) {
-            notesList = data.notes || [];
-        }
+        return JSON.parse(sessionStorage.getItem(BOOTSTRAP_CACHE_KEY));
     } catch (error) {
-        console.error('Ошибка загрузки заметок:', error);
+        return null;
     }
 }
 
-async function loadGraphData() {
+function writeBootstrapCache(etag, data) {
+    if (!etag) return;
     try {
-        const response = await fetch('/api/home');
-        const data = await response.json();
-        
-        if (response.ok) {
-            // Сохраняем данные для модалки связей
-            notesList = data.notes || [];
-            allLinks = data.links || [];
-            
-            if (graphView) {
-                graphView.setData(data);
-            }
-        }
+        sessionStorage.setItem(BOOTSTRAP_CACHE_KEY, JSON.stringify({ etag, data }));
     } catch (error) {
-        console.error('Ошибка загрузки данных графа:', error);
+        // Переполнение хранилища не критично - просто не кешируем
     }
 }
 
-async function loadStats() {
+// Состояние входа, граф, последние заметки, история и статистика одним запросом
+async function loadBootstrap() {
     try {
-        const response = await fetch('/api/notes');
-        const data = await response.json();
+        const cached = readBootstrapCache();
+        const headers = cached ? { 'If-None-Match': cached.etag } : {};
+        const response = await fetch('/api/bootstrap', { headers, cache: 'no-store' });
         
-        if (response.ok && data.notes) {
-            const notes = data.notes;
-            const notesCount = notes.length;
-            
-            const tagsSet = new Set();
-            for (const note of notes) {
-                if (note.tags) {
-                    note.tags.forEach(tag => tagsSet.add(tag));
-                }
-            }
-            
-            document.getElementById('stats-notes-count').textContent = notesCount;
-            document.getElementById('stats-tags-count').textContent = tagsSet.size;
-            document.getElementById('home-notes-count').textContent = `${notesCount} заметок`;
-            
-            // Приветствие
-            const hour = new Date().getHours();
-            let greeting = 'Привет!';
-            if (hour >= 5 && hour < 12) {
-                greeting = 'Доброе утро! ☀️';
-            } else if (hour >= 12 && hour < 18) {
-                greeting = 'Добрый день! 👋';
-            } else if (hour >= 18 && hour < 22) {
-                greeting = 'Добрый вечер! 🌙';
-            } else {
-                greeting = 'Доброй ночи! 🌟';
-            }
-            document.getElementById('home-greeting-text').textContent = greeting;
+        if (response.status === 304 && cached) {
+            return cached.data;
+        }
+        
+        const data = await response.json();
+        if (response.status === 401) {
+            return { auth: { initialized: true, authenticated: false } };
+        }
+        if (!response.ok) {
+            console.error('Ошибка загрузки главной страницы:', data.error || 'Неизвестная ошибка');
+            return null;
         }
+        writeBootstrapCache(response.headers.get('ETag'), data);
+        return data;
     } catch (error) {
-        console.error('Ошибка загрузки статистики:', error);
+        console.error('Ошибка загрузки главной страницы:', error);
+        return null;
     }
 }
 
-async function loadRecentNotes() {
-    try {
-        const response = await fetch('/api/notes');
-        const data = await response.json();
-        
-        if (response.ok && data.notes) {
-            const notes = data.notes
-                .sort((a, b) => new Date(b.modified) - new Date(a.modified))
-                .slice(0, 5);
-            
-            const container = document.getElementById('home-recent-notes');
-            if (!container) return;
-            
-            if (notes.length === 0) {
-                container.innerHTML = '<div class="empty-state">Нет заметок</div>';
-                return;
-            }
-            
-            container.innerHTML = notes.map(note => `
-                <div class="recent-item" data-note-id="${note.id}">
-                    <div class="recent-item-title">${escapeHtml(note.title)}</div>
-                    <div class="recent-item-date">${formatTimeAgo(note.modified)}</div>
-                </div>
-            `).join('');
-            
-            container.querySelectorAll('.recent-item').forEach(item => {
-                item.addEventListener('click', () => {
-                    window.location.href = `/?note=${item.dataset.noteId}`;
-                });
-            });
-        }
-    } catch (error) {
-        console.error('Ошибка загрузки последних заметок:', error);
+function renderHomeData(data) {
+    if (data.graph) renderGraphData(data.graph);
+    if (data.stats) renderStats(data.stats);
+    if (data.recent) renderRecentNotes(data.recent);
+    if (data.history) renderAccessHistory(data.history);
+}
+
+function renderGraphData(graph) {
+    // Сохраняем данные для модалки связей
+    notesList = graph.nodes || [];
+    allLinks = graph.edges || [];
+    
+    if (graphView) {
+        // Версия графа: тот же граф не сбрасывает раскладку
+        graphView.setData(graph, graph.version);
     }
 }
 
-async function loadAccessHistory() {
-    try {
-        const response = await fetch('/api/access-history?limit=10');
-        const data = await response.json();
+function renderStats(stats) {
+    const notesCount = stats.notes_count || 0;
+    
+    document.getElementById('stats-notes-count').textContent = notesCount;
+    document.getElementById('stats-tags-count').textContent = stats.tags_count || 0;
+    document.getElementById('home-notes-count').textContent = `${notesCount} заметок`;
+    
+    // Приветствие
+    const hour = new Date().getHours();
+    let greeting = 'Привет!';
+    if (hour >= 5 && hour < 12) {
+        greeting = 'Доброе утро! ☀️';
+    } else if (hour >= 12 && hour < 18) {
+        greeting = 'Добрый день! 👋';
+    } else if (hour >= 18 && hour < 22) {
+        greeting = 'Добрый вечер! 🌙';
+    } else {
+        greeting = 'Доброй ночи! 🌟';
+    }
+    document.getElementById('home-greeting-text').textContent = greeting;
+}
+
+function renderRecentNotes(notes) {
+    const container = document.getElementById('home-recent-notes');
+    if (!container) return;
+    
+    if (notes.length === 0) {
+        container.innerHTML = '<div class="empty-state">Нет заметок</div>';
+        return;
+    }
+    
+    container.innerHTML = notes.map(note => `
+        <div class="recent-item" data-note-id="${note.id}">
+            <div class="recent-item-title">${escapeHtml(note.title)}</div>
+            <div class="recent-item-date">${formatTimeAgo(note.modified)}</div>
+        </div>
+    `).join('');
+    
+    container.querySelectorAll('.recent-item').forEach(item => {
+        item.addEventListener('click', () => {
+            window.location.href = `/?note=${item.dataset.noteId}`;
+        });
+    });
+}
+
+function renderAccessHistory(history) {
+    const container = document.getElementById('home-access-history');
+    if (!container) return;
+    
+    if (history.length === 0) {
+        container.innerHTML = '<div class="empty-state">Нет истории</div>';
+        return;
+    }
+    
+    // Копия: данные могут быть из кеша и понадобиться снова
+    container.innerHTML = history.slice().reverse().slice(0, 5).map(entry => {
+        const actionText = {
+            'open': '👁️',
+            'edit': '✏️',
+            'create': '➕',
+            'delete': '🗑️'
+        }[entry.action] || '•';
         
-        if (response.ok && data.history) {
-            const container = document.getElementById('home-access-history');
-            if (!container) return;
-            
-            if (data.history.length === 0) {
-                container.innerHTML = '<div class="empty-state">Нет истории</div>';
-                return;
-            }
-            
-            container.innerHTML = data.history.reverse().slice(0, 5).map(entry => {
-                const actionText = {
-                    'open': '👁️',
-                    'edit': '✏️',
-                    'create': '➕',
-                    'delete': '🗑️'
-                }[entry.action] || '•';
-                
-                return `
-                    <div class="history-entry" data-note-id="${entry.note_id}">
-                        <div class="history-entry-action">${actionText}</div>
-                        <div class="history-entry-title">${escapeHtml(entry.note_title)}</div>
-                        <div class="history-entry-time">${formatTimeAgo(entry.date)}</div>
-                    </div>
-                `;
-            }).join('');
-            
-            container.querySelectorAll('.history-entry').forEach(item => {
-                const noteId = item.dataset.noteId;
-                if (noteId) {
-                    item.addEventListener('click', () => {
-                        window.location.href = `/?note=${noteId}`;
-                    });
-                }
+        return `
+            <div class="history-entry" data-note-id="${entry.note_id}">
+                <div class="history-entry-action">${actionText}</div>
+                <div class="history-entry-title">${escapeHtml(entry.note_title)}</div>
+                <div class="history-entry-time">${formatTimeAgo(entry.date)}</div>
+            </div>
+        `;
+    }).join('');
+    
+    container.querySelectorAll('.history-entry').forEach(item => {
+        const noteId = item.dataset.noteId;
+        if (noteId) {
+            item.addEventListener('click', () => {
+                window.location.href = `/?note=${noteId}`;
             });
         }
-    } catch (error) {
-        console.error('Ошибка загрузки истории:', error);
-    }
+    });
 }
 
 function formatTimeAgo(dateStr) {
@@ -1,10 +1,16 @@
 // Поиск с подсветкой
+
+// Сколько результатов запрашивать у сервера
+const SEARCH_RESULTS_LIMIT = 50;
+
 class SearchHighlight {
     constructor(inputId, resultsId) {
         this.input = document.getElementById(inputId);
         this.resultsContainer = document.getElementById(resultsId);
         this.searchTimeout = null;
         this.onNoteClick = null;
+        // Текущий потоковый запрос: прерывается, когда пользователь печатает дальше
+        this.abortController = null;
         
         if (this.input && this.resultsContainer) {
             this.init();
@@ -17,6 +23,7 @@ class SearchHighlight {
             const query = e.target.value.trim();
             
             if (query.length === 0) {
+                this.cancelSearch();
                 this.resultsContainer.innerHTML = '';
                 this.resultsContainer.style.display = 'none';
                 return;
@@ -28,6 +35,14 @@ class SearchHighlight {
             }, 300);
         });
         
+        // Клики по результатам (результаты добавляются по мере прихода)
+        this.resultsContainer.addEventListener('click', (e) => {
+            const item = e.target.closest('.search-result-item');
+            if (item && this.onNoteClick) {
+                this.onNoteClick(item.dataset.noteId);
+            }
+        });
+        
         // Скрываем результаты при клике вне
         document.addEventListener('click', (e) => {
             if (!this.input.contains(e.target) && !this.resultsContainer.contains(e.target)) {
@@ -36,21 +51,68 @@ class SearchHighlight {
         });
     }
     
+    cancelSearch() {
+        if (this.abortController) {
+            // Закрытие соединения останавливает поиск на сервере
+            this.abortController.abort();
+            this.abortController = null;
+        }
+    }
+    
     async search(query) {
+        // Результаты предыдущего запроса уже не нужны
+        this.cancelSearch();
+        const controller = new AbortController();
+        this.abortController = controller;
+        
+        const token = `${Date.now()}-${Math.random().toString(36).slice(2)}`;
+        const params = new URLSearchParams({ q: query, stream: '1', limit: SEARCH_RESULTS_LIMIT, token });
+        const queryLower = query.toLowerCase();
+        let count = 0;
+        
         try {
-            const response = await fetch(`/api/search-full?q=${encodeURIComponent(query)}`);
-            const data = await response.json();
-            
-            if (response.ok && data.results) {
-                this.displayResults(data.results, query);
-            } else {
+            const response = await fetch(`/api/search-full?${params}`, { signal: controller.signal });
+            if (!response.ok || !response.body) {
                 this.resultsContainer.innerHTML = '<div class="search-no-results">Ошибка поиска</div>';
                 this.resultsContainer.style.display = 'block';
+                return;
+            }
+            
+            this.resultsContainer.innerHTML = '';
+            this.resultsContainer.style.display = 'block';
+            
+            // NDJSON: одна строка - один результат, показываем их по мере прихода
+            const reader = response.body.getReader();
+            const decoder = new TextDecoder();
+            let buffer = '';
+            while (true) {
+                const { value, done } = await reader.read();
+                if (done) break;
+                buffer += decoder.decode(value, { stream: true });
+                const lines = buffer.split('\n');
+                buffer = lines.pop();
+                for (const line of lines) {
+                    if (!line) continue;
+                    const message = JSON.parse(line);
+                    if (message.result) {
+                        this.resultsContainer.insertAdjacentHTML('beforeend', this.renderResult(message.result, queryLower));
+                        count++;
+                    }
+                }
+            }
+            
+            if (count === 0) {
+                this.resultsContainer.innerHTML = '<div class="search-no-results">Ничего не найдено</div>';
             }
         } catch (error) {
+            if (error.name === 'AbortError') return;
             console.error('Ошибка поиска:', error);
             this.resultsContainer.innerHTML = '<div class="search-no-results">Ошибка подключения</div>';
             this.resultsContainer.style.display = 'block';
+        } finally {
+            if (this.abortController === controller) {
+                this.abortController = null;
+            }
         }
     }
     
@@ -62,44 +124,36 @@ class SearchHighlight {
         }
         
         const queryLower = query.toLowerCase();
-        let html = '';
+        this.resultsContainer.innerHTML = results.map(result => this.renderResult(result, queryLower)).join('');
+        this.resultsContainer.style.display = 'block';
+    }
+    
+    renderResult(result, queryLower) {
+        const titleHighlighted = this.highlightText(result.title, queryLower);
+        let contentPreview = '';
         
-        results.forEach(result => {
-            const titleHighlighted = this.highlightText(result.title, queryLower);
-            let contentPreview = '';
-            
-            // Находим первое совпадение в содержимом для превью
-            const contentMatch = result.matches.find(m => m.field === 'content');
-            if (contentMatch && contentMatch.context) {
-                const contextHighlighted = this.highlightText(contentMatch.context, queryLower);
-                contentPreview = `<div class="search-result-preview">${contextHighlighted}</div>`;
+        // Находим первое совпадение в содержимом для превью
+        const contentMatch = result.matches.find(m => m.field === 'content');
+        if (contentMatch && contentMatch.context) {
+            const contextHighlighted = this.highlightText(contentMatch.context, queryLower);
+            contentPreview = `<div class="search-result-preview">${contextHighlighted}</div>`;
+            // Сервер присылает только первые совпадения, всего их match_count
+            if (result.match_count > 1) {
+                contentPreview += `<div class="search-result-count">Совпадений: ${result.match_count}</div>`;
             }
-            
-            html += `
-                <div class="search-result-item" data-note-id="${result.id}">
-                    <div class="search-result-title">${titleHighlighted}</div>
-                    ${contentPreview}
-                    ${result.tags && result.tags.length > 0 ? `
-                        <div class="search-result-tags">
-                            ${result.tags.map(tag => `<span class="search-result-tag">${this.escapeHtml(tag)}</span>`).join('')}
-                        </div>
-                    ` : ''}
-                </div>
-            `;
-        });
-        
-        this.resultsContainer.innerHTML = html;
-        this.resultsContainer.style.display = 'block';
+        }
         
-        // Обработчики кликов
-        this.resultsContainer.querySelectorAll('.search-result-item').forEach(item => {
-            item.addEventListener('click', () => {
-                const noteId = item.dataset.noteId;
-                if (this.onNoteClick) {
-                    this.onNoteClick(noteId);
-                }
-            });
-        });
+        return `
+            <div class="search-result-item" data-note-id="${result.id}">
+                <div class="search-result-title">${titleHighlighted}</div>
+                ${contentPreview}
+                ${result.tags && result.tags.length > 0 ? `
+                    <div class="search-result-tags">
+                        ${result.tags.map(tag => `<span class="search-result-tag">${this.escapeHtml(tag)}</span>`).join('')}
+                    </div>
+                ` : ''}
+            </div>
+        `;
     }
     
     highlightText(text, query) {
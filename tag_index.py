@@ -0,0 +1,80 @@
+"""
+Индекс тегов заметок (тег -> заметки)
+"""
+from typing import List, Dict, Set
+
+
+class TagIndex:
+    """Обратный индекс {тег: множество ID заметок} для фильтрации по тегам"""
+    
+    def __init__(self, notes: Dict[str, Dict]):
+        """
+        Строит индекс по метаданным заметок
+        
+        Args:
+            notes: Словарь {id: метаданные заметки} из metadata.json
+        """
+        self.tag_notes: Dict[str, Set[str]] = {}
+        self.note_tags: Dict[str, List[str]] = {}
+        for note_id, note_data in notes.items():
+            self.set_tags(note_id, note_data.get("tags", []))
+    
+    def set_tags(self, note_id: str, tags: List[str]):
+        """
+        Заменяет теги заметки
+        
+        Args:
+            note_id: ID заметки
+            tags: Список тегов
+        """
+        self.remove_note(note_id)
+        if not tags:
+            return
+        self.note_tags[note_id] = list(tags)
+        for tag in tags:
+            self.tag_notes.setdefault(tag, set()).add(note_id)
+    
+    def remove_note(self, note_id: str):
+        """
+        Удаляет заметку из индекса
+        
+        Args:
+            note_id: ID заметки
+        """
+        for tag in self.note_tags.pop(note_id, []):
+            notes = self.tag_notes.get(tag)
+            if notes is None:
+                continue
+            notes.discard(note_id)
+            if not notes:
+                del self.tag_notes[tag]
+    
+    def get_counts(self) -> Dict[str, int]:
+        """Получает количество заметок по тегам"""
+        return {tag: len(notes) for tag, notes in self.tag_notes.items()}
+    
+    def find(self, tags: List[str], match_all: bool = True) -> Set[str]:
+        """
+        Находит заметки по тегам
+        
+        Args:
+            tags: Теги фильтра
+            match_all: True - заметка должна иметь все теги (И), False - любой из них (ИЛИ)
+            
+        Returns:
+            Множество ID заметок
+        """
+        sets = [self.tag_notes.get(tag, set()) for tag in tags]
+        if not sets:
+            return set()
+        if not match_all:
+            return set().union(*sets)
+        
+        # Пересечение начинаем с самого маленького множества
+        sets.sort(key=len)
+        result = set(sets[0])
+        for notes in sets[1:]:
+            result &= notes
+            if not result:
+                break
+        return result
@@ -0,0 +1,30 @@
+"""
+Общие настройки тестов: модули приложения лежат в корне репозитория
+"""
+import sys
+import pytest
+from pathlib import Path
+
+sys.path.insert(0, str(Path(__file__).resolve().parent.parent))
+
+
+@pytest.fixture
+def app(tmp_path):
+    """Приложение с данными во временной директории"""
+    from app import create_app
+    return create_app({
+        'TESTING': True,
+        'SECRET_KEY': b'test-secret-key',
+        'NOTES_DIR': str(tmp_path / 'notes'),
+        'AUTH_CONFIG_FILE': str(tmp_path / 'auth_config.json'),
+        'SESSION_FILE_DIR': str(tmp_path / 'flask_session'),
+    })
+
+
+@pytest.fixture
+def client(app):
+    """Клиент, вошедший с паролем secret1"""
+    client = app.test_client()
+    response = client.post('/api/init', json={'password': 'secret1'})
+    assert response.status_code == 200, response.get_json()
+    return client
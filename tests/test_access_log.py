@@ -0,0 +1,47 @@
+"""
+Тесты журнала заходов
+"""
+from access_log import AccessLog, TAIL_BLOCK_SIZE
+
+
+def test_tail_returns_newest_in_order(tmp_path):
+    log = AccessLog(tmp_path / "access.log", retention=100)
+    assert log.is_empty()
+    for i in range(5):
+        log.append({"note_id": str(i)})
+    assert [entry["note_id"] for entry in log.tail(3)] == ["2", "3", "4"]
+    assert [entry["note_id"] for entry in log.tail(10)] == ["0", "1", "2", "3", "4"]
+
+
+def test_segments_rotate_and_bound_size(tmp_path):
+    log = AccessLog(tmp_path / "access.log", retention=3)
+    for i in range(10):
+        log.append({"note_id": str(i)})
+    # Хранится от retention до 2 * retention последних записей
+    assert [entry["note_id"] for entry in log.tail(100)] == ["6", "7", "8", "9"]
+    assert log.previous_file.exists()
+
+
+def test_tail_reads_across_blocks(tmp_path):
+    log = AccessLog(tmp_path / "access.log", retention=10000)
+    padding = "x" * 100
+    count = 3 * TAIL_BLOCK_SIZE // 100
+    for i in range(count):
+        log.append({"note_id": str(i), "pad": padding})
+    assert [entry["note_id"] for entry in log.tail(5)] == [str(i) for i in range(count - 5, count)]
+
+
+def test_broken_line_skipped(tmp_path):
+    log = AccessLog(tmp_path / "access.log")
+    log.append({"note_id": "a"})
+    # Недописанная строка после сбоя
+    with open(log.log_file, 'a', encoding='utf-8') as f:
+        f.write('{"note_id": "bro')
+    assert log.tail(10) == [{"note_id": "a"}]
+
+
+def test_version_changes_on_append(tmp_path):
+    log = AccessLog(tmp_path / "access.log")
+    version = log.get_version()
+    log.append({"note_id": "a"})
+    assert log.get_version() != version
@@ -0,0 +1,126 @@
+"""
+Тесты атомарной записи и блокировок файлов
+"""
+import os
+import time
+import threading
+import pytest
+from atomic_io import LOCKS_DIR, atomic_write, atomic_write_bytes, file_lock, sweep_lock_files
+from encryption import EncryptionManager
+from file_manager import FileManager
+
+try:
+    import fcntl
+except ImportError:
+    fcntl = None
+
+
+def test_atomic_write_replaces_content(tmp_path):
+    path = tmp_path / "data.bin"
+    atomic_write_bytes(path, b"old")
+    atomic_write_bytes(path, b"new")
+    assert path.read_bytes() == b"new"
+    assert [p.name for p in tmp_path.iterdir()] == ["data.bin"]
+
+
+def test_failed_write_keeps_old_content(tmp_path):
+    path = tmp_path / "data.bin"
+    atomic_write_bytes(path, b"old")
+    
+    def write(f):
+        f.write(b"partial")
+        raise RuntimeError("сбой")
+    
+    with pytest.raises(RuntimeError):
+        atomic_write(path, write)
+    assert path.read_bytes() == b"old"
+    assert [p.name for p in tmp_path.iterdir()] == ["data.bin"]
+
+
+def test_file_lock_reentrant_and_exclusive_between_threads(tmp_path):
+    path = tmp_path / "data.bin"
+    order = []
+    
+    def other():
+        with file_lock(path):
+            order.append("other")
+    
+    with file_lock(path):
+        with file_lock(path):
+            thread = threading.Thread(target=other)
+            thread.start()
+            time.sleep(0.1)
+            order.append("owner")
+    thread.join(5)
+    assert order == ["owner", "other"]
+    assert (tmp_path / LOCKS_DIR / "data.bin.lock").exists()
+
+
+def test_file_lock_non_blocking(tmp_path):
+    path = tmp_path / "data.bin"
+    results = []
+    
+    def other():
+        with file_lock(path, blocking=False) as acquired:
+            results.append(acquired)
+    
+    with file_lock(path) as acquired:
+        assert acquired
+        thread = threading.Thread(target=other)
+        thread.start()
+        thread.join(5)
+    other()
+    assert results == [False, True]
+
+
+@pytest.mark.skipif(fcntl is None, reason="нужен fcntl")
+def test_file_lock_visible_to_other_processes(tmp_path):
+    path = tmp_path / "data.bin"
+    with file_lock(path):
+        pid = os.fork()
+        if pid == 0:
+            fd = os.open(tmp_path / LOCKS_DIR / "data.bin.lock", os.O_RDWR)
+            try:
+                fcntl.flock(fd, fcntl.LOCK_EX | fcntl.LOCK_NB)
+                os._exit(1)
+            except BlockingIOError:
+                os._exit(0)
+        _, status = os.waitpid(pid, 0)
+    assert os.WEXITSTATUS(status) == 0
+
+
+def test_sweep_removes_only_orphan_lock_files(tmp_path):
+    kept = tmp_path / "kept.enc"
+    kept.write_bytes(b"x")
+    for path in (kept, tmp_path / "deleted.enc"):
+        with file_lock(path):
+            pass
+    # Файл блокировки прежнего размещения
+    (tmp_path / "legacy.enc.lock").write_bytes(b"")
+    
+    assert sweep_lock_files(tmp_path) == 2
+    assert sorted(p.name for p in (tmp_path / LOCKS_DIR).iterdir()) == ["kept.enc.lock"]
+    assert not (tmp_path / "legacy.enc.lock").exists()
+
+
+def test_update_racing_delete_leaves_no_file(tmp_path):
+    notes_dir = tmp_path / "notes"
+    file_manager = FileManager(str(notes_dir), EncryptionManager("secret", notes_dir))
+    note = file_manager.create_note("T", "text")
+    file_path = notes_dir / f"{note['id']}.enc"
+    results = []
+    
+    with file_lock(file_path):
+        # Обновление ждет блокировку заметки, пока ее удаляют
+        thread = threading.Thread(target=lambda: results.append(
+            file_manager.update_note(note["id"], content="late write")))
+        thread.start()
+        time.sleep(0.2)
+        assert file_manager.delete_note(note["id"])
+    thread.join(10)
+    
+    assert not file_path.exists()
+    assert file_manager.get_note(note["id"]) is None
+    # Файл блокировки не удаляется, пока сервер работает
+    assert (notes_dir / LOCKS_DIR / f"{file_path.name}.lock").exists()
+    file_manager.close()
@@ -0,0 +1,66 @@
+"""
+Тесты хранилища вложений и сборки мусора
+"""
+import io
+import os
+import time
+import hashlib
+import pytest
+from attachment_store import AttachmentStore, extract_attachment_refs
+from encryption import EncryptionManager
+
+
+@pytest.fixture
+def store(tmp_path):
+    return AttachmentStore(tmp_path / "attachments", EncryptionManager("secret", tmp_path))
+
+
+def test_save_and_open_round_trip(store):
+    data = os.urandom(200 * 1024)
+    attachment_id, size = store.save(io.BytesIO(data))
+    assert size == len(data)
+    assert store.exists(attachment_id)
+    assert b"".join(store.open(attachment_id)) == data
+
+
+def test_same_content_stored_once(store):
+    first, _ = store.save(io.BytesIO(b"image"))
+    second, _ = store.save(io.BytesIO(b"image"))
+    assert first == second
+    assert len(list(store.attachments_dir.glob("*.enc"))) == 1
+
+
+def test_id_does_not_reveal_content_hash(tmp_path, store):
+    attachment_id, _ = store.save(io.BytesIO(b"known image"))
+    assert AttachmentStore.is_valid_id(attachment_id)
+    assert attachment_id != hashlib.sha256(b"known image").hexdigest()
+    # Другой пароль - другой ключ HMAC
+    other = AttachmentStore(tmp_path / "other", EncryptionManager("other", tmp_path / "other"))
+    assert other.save(io.BytesIO(b"known image"))[0] != attachment_id
+
+
+def test_invalid_id_rejected(store):
+    assert not store.exists("../metadata")
+    with pytest.raises(ValueError):
+        list(store.open("../metadata"))
+
+
+def test_collect_garbage_keeps_referenced_and_recent(store):
+    kept, _ = store.save(io.BytesIO(b"kept"))
+    dropped, _ = store.save(io.BytesIO(b"dropped"))
+    recent, _ = store.save(io.BytesIO(b"recent"))
+    old = time.time() - 2 * 60 * 60
+    for attachment_id in (kept, dropped):
+        os.utime(store.attachments_dir / f"{attachment_id}.enc", (old, old))
+    
+    assert store.collect_garbage([kept]) == [dropped]
+    assert store.exists(kept)
+    assert store.exists(recent)
+    assert not store.exists(dropped)
+
+
+def test_extract_refs():
+    first, second = "a" * 64, "b" * 64
+    content = f'{{"nodes": [{{"attachment": "{second}"}}, {{"src": "/api/attachments/{first}"}}, {{"attachment": "{second}"}}]}}'
+    assert extract_attachment_refs(content) == [first, second]
+    assert extract_attachment_refs("") == []
@@ -0,0 +1,97 @@
+"""
+Тесты ленты изменений: номера событий и сброс при потере истории
+"""
+import time
+import threading
+from change_feed import CHANGE_POLL_INTERVAL, ChangeFeed
+
+
+def test_empty_feed(tmp_path):
+    feed = ChangeFeed(tmp_path / "changes.log")
+    assert feed.last_seq() == 0
+    assert feed.read(0) == ([], False)
+
+
+def test_read_after_seq(tmp_path):
+    feed = ChangeFeed(tmp_path / "changes.log")
+    seqs = [feed.publish("note", "created", str(i)) for i in range(3)]
+    assert seqs == [1, 2, 3]
+    
+    events, reset = feed.read(1)
+    assert not reset
+    assert [event["seq"] for event in events] == [2, 3]
+    assert [event["id"] for event in events] == ["1", "2"]
+    assert feed.read(3) == ([], False)
+
+
+def test_read_ahead_of_feed_resets(tmp_path):
+    feed = ChangeFeed(tmp_path / "changes.log")
+    feed.publish("todos", "updated")
+    # Номер из другого журнала (например, после очистки данных)
+    assert feed.read(5) == ([], True)
+
+
+def test_read_of_dropped_events_resets(tmp_path):
+    feed = ChangeFeed(tmp_path / "changes.log", retention=2)
+    for i in range(7):
+        feed.publish("note", "updated", str(i))
+    assert feed.last_seq() == 7
+    # В журнале остается не больше двух сегментов: начало истории удалено
+    assert feed.read(0) == ([], True)
+    events, reset = feed.read(6)
+    assert not reset
+    assert [event["seq"] for event in events] == [7]
+
+
+def test_seq_shared_between_feeds(tmp_path):
+    first = ChangeFeed(tmp_path / "changes.log")
+    second = ChangeFeed(tmp_path / "changes.log")
+    first.publish("note", "created", "a")
+    # Вторая лента (другой воркер) продолжает нумерацию по журналу на диске
+    assert second.publish("note", "deleted", "a") == 2
+    events, reset = first.read(1)
+    assert not reset
+    assert events[0]["action"] == "deleted"
+
+
+def test_wait_returns_published_event(tmp_path):
+    feed = ChangeFeed(tmp_path / "changes.log")
+    feed.publish("calendar", "updated")
+    events, reset = feed.wait(0, timeout=0.1)
+    assert not reset
+    assert [event["type"] for event in events] == ["calendar"]
+    assert feed.wait(1, timeout=0.05) == ([], False)
+
+
+def test_wait_reads_journal_outside_condition(tmp_path):
+    feed = ChangeFeed(tmp_path / "changes.log")
+    feed.publish("note", "created", "a")
+    read = feed.read
+    reads = []
+    
+    def slow_read(after):
+        # Первое чтение еще не видит события и долго читает файлы
+        result = read(after)
+        reads.append(result)
+        if len(reads) == 1:
+            time.sleep(0.3)
+        return result
+    
+    feed.read = slow_read
+    result = []
+    started = time.monotonic()
+    waiter = threading.Thread(target=lambda: result.append(feed.wait(1, timeout=5)))
+    waiter.start()
+    time.sleep(0.1)
+    
+    publish_started = time.monotonic()
+    feed.publish("note", "updated", "a")
+    # publish не ждет, пока ожидающий читает журнал
+    assert time.monotonic() - publish_started < 0.2
+    waiter.join(5)
+    
+    # Событие, опубликованное во время чтения, не ждет следующей проверки журнала
+    assert time.monotonic() - started < CHANGE_POLL_INTERVAL
+    events, reset = result[0]
+    assert not reset
+    assert [event["seq"] for event in events] == [2]
@@ -0,0 +1,82 @@
+"""
+Тесты сессии в зашифрованной cookie
+"""
+import pytest
+from app import create_app
+
+
+@pytest.fixture
+def cookie_app(tmp_path):
+    return create_app({
+        'TESTING': True,
+        'SECRET_KEY': b'test-secret-key',
+        'SESSION_BACKEND': 'cookie',
+        'NOTES_DIR': str(tmp_path / 'notes'),
+        'AUTH_CONFIG_FILE': str(tmp_path / 'auth_config.json'),
+    })
+
+
+@pytest.fixture
+def cookie_client(cookie_app):
+    client = cookie_app.test_client()
+    assert client.post('/api/init', json={'password': 'secret1'}).status_code == 200
+    return client
+
+
+def _session_cookie(client, app):
+    return client.get_cookie(app.config['SESSION_COOKIE_NAME']).value
+
+
+def test_session_kept_in_encrypted_cookie(cookie_app, cookie_client, tmp_path):
+    assert cookie_client.post('/api/notes', json={'title': 't', 'content': 'c'}).status_code == 201
+    assert cookie_client.get('/api/check-auth').get_json()['authenticated'] is True
+    
+    value = _session_cookie(cookie_client, cookie_app)
+    assert 'secret1' not in value
+    # Сессии не хранятся на сервере
+    assert sorted(p.name for p in tmp_path.iterdir()) == ['.locks', 'auth_config.json', 'notes']
+
+
+def test_cookie_usable_by_other_worker_with_same_secret(cookie_app, cookie_client):
+    value = _session_cookie(cookie_client, cookie_app)
+    
+    worker = create_app(dict(cookie_app.config)).test_client()
+    worker.set_cookie(cookie_app.config['SESSION_COOKIE_NAME'], value)
+    assert worker.get('/api/notes').status_code == 200
+    
+    stranger = create_app(dict(cookie_app.config, SECRET_KEY=b'other-key')).test_client()
+    stranger.set_cookie(cookie_app.config['SESSION_COOKIE_NAME'], value)
+    assert stranger.get('/api/notes').status_code == 401
+
+
+def test_tampered_cookie_rejected(cookie_app, cookie_client):
+    name = cookie_app.config['SESSION_COOKIE_NAME']
+    value = _session_cookie(cookie_client, cookie_app)
+    cookie_client.set_cookie(name, value[:-4] + ('AAAA' if value[-4:] != 'AAAA' else 'BBBB'))
+    assert cookie_client.get('/api/notes').status_code == 401
+
+
+def test_expired_cookie_rejected(cookie_app, cookie_client, monkeypatch):
+    import cookie_session
+    expires_at = cookie_app.permanent_session_lifetime.total_seconds()
+    real_time = cookie_session.time.time
+    monkeypatch.setattr(cookie_session.time, 'time', lambda: real_time() + expires_at + 60)
+    assert cookie_client.get('/api/notes').status_code == 401
+
+
+def test_logout_deletes_cookie(cookie_app, cookie_client):
+    assert cookie_client.post('/api/logout').status_code == 200
+    assert cookie_client.get_cookie(cookie_app.config['SESSION_COOKIE_NAME']) is None
+    assert cookie_client.get('/api/notes').status_code == 401
+
+
+def test_password_change_revokes_copied_cookie(cookie_app, cookie_client):
+    name = cookie_app.config['SESSION_COOKIE_NAME']
+    copy = cookie_app.test_client()
+    copy.set_cookie(name, _session_cookie(cookie_client, cookie_app))
+    assert copy.get('/api/notes').status_code == 200
+    
+    assert cookie_client.post('/api/change-password',
+                              json={'old_password': 'secret1', 'new_password': 'secret2'}).status_code == 200
+    assert copy.get('/api/notes').status_code == 401
+    assert cookie_client.get('/api/notes').status_code == 200
@@ -0,0 +1,162 @@
+"""
+Тесты совместимости форматов шифрования (v2, v3, потоковый v4 и самый старый)
+"""
+import io
+import os
+import base64
+import time
+import struct
+import threading
+import pytest
+from cryptography.hazmat.primitives.ciphers.aead import AESGCM
+from encryption import (
+    EncryptionManager, HEADER_V3, HEADER_V4, KDF_PBKDF2_SHA256, MAGIC,
+    MAX_PBKDF2_ITERATIONS, PBKDF2_ITERATIONS, TAG_SIZE, VAULT_HEADER_FILE,
+)
+
+
+@pytest.fixture(scope="module")
+def manager(tmp_path_factory):
+    return EncryptionManager("secret", tmp_path_factory.mktemp("vault"))
+
+
+def test_v2_round_trip(manager):
+    encrypted = manager.encrypt("привет")
+    assert base64.b64decode(encrypted)[:len(MAGIC) + 1] == MAGIC + bytes([2])
+    assert manager.decrypt(encrypted) == "привет"
+    assert manager.decrypt_bytes(encrypted.encode('ascii')) == "привет".encode('utf-8')
+
+
+def test_v3_round_trip(manager):
+    blob = manager.encrypt_bytes(b"data")
+    assert EncryptionManager.is_binary_format(blob)
+    assert blob[len(MAGIC)] == 3
+    assert manager.decrypt_bytes(blob) == b"data"
+
+
+@pytest.mark.parametrize("size", [0, 1, 100, 300])
+def test_v4_round_trip(manager, size):
+    data = os.urandom(size)
+    dst = io.BytesIO()
+    manager.encrypt_stream(io.BytesIO(data), dst, chunk_size=100)
+    blob = dst.getvalue()
+    assert blob[len(MAGIC)] == 4
+    assert b"".join(manager.decrypt_stream(io.BytesIO(blob))) == data
+    assert manager.decrypt_bytes(blob) == data
+
+
+def test_legacy_format_readable(manager):
+    salt, nonce = os.urandom(16), os.urandom(12)
+    key = manager._derive_key(salt)
+    plaintext = b"old note"
+    ciphertext = AESGCM(key).encrypt(nonce, plaintext, None)
+    combined = salt + nonce + ciphertext + manager._calculate_hash(plaintext).encode('utf-8')
+    assert manager.decrypt(base64.b64encode(combined).decode('ascii')) == "old note"
+
+
+def test_vault_salt_shared_by_managers(tmp_path):
+    first = EncryptionManager("secret", tmp_path)
+    encrypted = first.encrypt("x")
+    second = EncryptionManager("secret", tmp_path)
+    assert (tmp_path / VAULT_HEADER_FILE).exists()
+    # Соль мастер-ключа идет сразу после MAGIC и версии
+    salt = slice(len(MAGIC) + 1, len(MAGIC) + 17)
+    assert base64.b64decode(second.encrypt("y"))[salt] == base64.b64decode(encrypted)[salt]
+    assert second.decrypt(encrypted) == "x"
+
+
+def test_wrong_password_rejected(manager, tmp_path):
+    other = EncryptionManager("other", tmp_path)
+    with pytest.raises(ValueError):
+        other.decrypt_bytes(manager.encrypt_bytes(b"data"))
+    with pytest.raises(ValueError):
+        other.decrypt(manager.encrypt("data"))
+
+
+def test_v3_truncated_rejected(manager):
+    blob = manager.encrypt_bytes(b"data")
+    for length in (HEADER_V3.size, len(blob) - 1):
+        with pytest.raises(ValueError):
+            manager.decrypt_bytes(blob[:length])
+
+
+def test_v4_truncated_rejected(manager):
+    dst = io.BytesIO()
+    manager.encrypt_stream(io.BytesIO(b"a" * 250), dst, chunk_size=100)
+    blob = dst.getvalue()
+    sealed_size = 100 + TAG_SIZE
+    # Обрезка по границе сегмента: последний оставшийся сегмент не помечен последним
+    for length in (HEADER_V4.size, HEADER_V4.size + sealed_size, HEADER_V4.size + 2 * sealed_size, len(blob) - 1):
+        with pytest.raises(ValueError):
+            manager.decrypt_bytes(blob[:length])
+
+
+def test_v4_reordered_segments_rejected(manager):
+    dst = io.BytesIO()
+    manager.encrypt_stream(io.BytesIO(b"a" * 100 + b"b" * 100 + b"c"), dst, chunk_size=100)
+    blob = dst.getvalue()
+    sealed_size = 100 + TAG_SIZE
+    first = blob[HEADER_V4.size:HEADER_V4.size + sealed_size]
+    second = blob[HEADER_V4.size + sealed_size:HEADER_V4.size + 2 * sealed_size]
+    swapped = blob[:HEADER_V4.size] + second + first + blob[HEADER_V4.size + 2 * sealed_size:]
+    with pytest.raises(ValueError):
+        manager.decrypt_bytes(swapped)
+
+
+def test_v2_truncated_rejected(manager):
+    combined = base64.b64decode(manager.encrypt("data"))
+    with pytest.raises(ValueError):
+        manager.decrypt(base64.b64encode(combined[:-1]).decode('ascii'))
+
+
+def test_header_iterations_bounded(manager):
+    blob = bytearray(manager.encrypt_bytes(b"data"))
+    # Поле итераций KDF в заголовке v3 (после MAGIC, версии и id KDF)
+    struct.pack_into(">I", blob, len(MAGIC) + 2, MAX_PBKDF2_ITERATIONS + 1)
+    with pytest.raises(ValueError, match="итераций"):
+        manager.decrypt_bytes(bytes(blob))
+
+
+def test_header_unknown_kdf_rejected(manager):
+    blob = bytearray(manager.encrypt_bytes(b"data"))
+    blob[len(MAGIC) + 1] = KDF_PBKDF2_SHA256 + 1
+    with pytest.raises(ValueError):
+        manager.decrypt_bytes(bytes(blob))
+
+
+def test_fallback_reads_old_password(manager, tmp_path):
+    new_manager = EncryptionManager("new", tmp_path)
+    new_manager.fallback = manager
+    blob = manager.encrypt_bytes(b"old")
+    assert new_manager.decrypt_bytes(blob) == b"old"
+    assert b"".join(new_manager.decrypt_stream(io.BytesIO(blob))) == b"old"
+
+
+def test_master_keys_for_different_salts_derived_concurrently(tmp_path, monkeypatch):
+    manager = EncryptionManager("secret", tmp_path)
+    active, peak, calls = [0], [0], []
+    lock = threading.Lock()
+    
+    def slow_derive(salt, iterations=PBKDF2_ITERATIONS):
+        with lock:
+            calls.append(salt)
+            active[0] += 1
+            peak[0] = max(peak[0], active[0])
+        time.sleep(0.2)
+        with lock:
+            active[0] -= 1
+        return salt * 2
+    
+    monkeypatch.setattr(manager, "_derive_key", slow_derive)
+    salts = [b"a" * 16, b"b" * 16, b"a" * 16, b"b" * 16]
+    threads = [threading.Thread(target=manager._get_master_key, args=(salt,)) for salt in salts]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join(5)
+    
+    # Одна соль - один PBKDF2, разные соли не ждут друг друга
+    assert sorted(calls) == [b"a" * 16, b"b" * 16]
+    assert peak[0] == 2
+    assert manager._get_master_key(b"a" * 16) == b"a" * 32
+    assert manager._derive_locks == {}
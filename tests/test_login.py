@@ -0,0 +1,22 @@
+"""
+Тесты входа: контекст сессии и мастер-ключ готовы до первого запроса к заметкам
+"""
+from encryption import PBKDF2_ITERATIONS
+
+
+def _session_contexts(app):
+    registry = app.extensions['zametik']['session_registry']
+    return list(registry._contexts.values())
+
+
+def test_login_derives_master_key(app, client):
+    assert client.post('/api/logout').status_code == 200
+    assert client.post('/api/login', json={'password': 'secret1'}).status_code == 200
+    
+    [context] = _session_contexts(app)
+    manager = context.encryption_manager
+    assert (manager._get_write_salt(), PBKDF2_ITERATIONS) in manager._master_keys
+    
+    # Первый запрос к заметкам не выводит мастер-ключ заново
+    manager._derive_key = None
+    assert client.post('/api/notes', json={'title': 't', 'content': 'c'}).status_code == 201
@@ -0,0 +1,129 @@
+"""
+Тесты слияния метаданных и кеша metadata.json
+"""
+import os
+import json
+import time
+import threading
+import multiprocessing
+import pytest
+from metadata_store import MetadataStore, merge_metadata
+
+
+def test_merge_keeps_changes_of_both_sides():
+    base = {"notes": {"a": {"title": "A"}, "b": {"title": "B"}}}
+    ours = {"notes": {"a": {"title": "A2"}, "b": {"title": "B"}}}
+    theirs = {"notes": {"a": {"title": "A"}, "b": {"title": "B3"}, "c": {"title": "C"}}}
+    assert merge_metadata(base, ours, theirs) == {
+        "notes": {"a": {"title": "A2"}, "b": {"title": "B3"}, "c": {"title": "C"}}
+    }
+
+
+def test_merge_our_change_wins_on_conflict():
+    base = {"notes": {"a": {"title": "A", "tags": []}}}
+    ours = {"notes": {"a": {"title": "ours", "tags": []}}}
+    theirs = {"notes": {"a": {"title": "theirs", "tags": ["x"]}}}
+    assert merge_metadata(base, ours, theirs) == {"notes": {"a": {"title": "ours", "tags": ["x"]}}}
+
+
+def test_merge_deletions():
+    base = {"notes": {"a": {}, "b": {}}}
+    ours = {"notes": {"b": {}}}
+    theirs = {"notes": {"a": {}}}
+    # Мы удалили a, они удалили b: не остается ни одной
+    assert merge_metadata(base, ours, theirs) == {"notes": {}}
+
+
+def test_merge_our_additions():
+    base = {"notes": {}}
+    ours = {"notes": {"new": {"title": "N"}}, "settings": {"x": 1}}
+    theirs = {"notes": {"other": {"title": "O"}}}
+    assert merge_metadata(base, ours, theirs) == {
+        "notes": {"new": {"title": "N"}, "other": {"title": "O"}},
+        "settings": {"x": 1},
+    }
+
+
+def test_load_merges_file_written_by_other_process(tmp_path):
+    metadata_file = tmp_path / "metadata.json"
+    metadata_file.write_text(json.dumps({"notes": {"a": {"title": "A"}}}), encoding='utf-8')
+    store = MetadataStore(metadata_file, flush_delay=60, max_flush_interval=60)
+    
+    data = store.load()
+    with store.lock:
+        data["notes"]["a"]["title"] = "ours"
+        store.mark_dirty()
+    
+    other = MetadataStore(metadata_file)
+    with other.lock:
+        other.load()["notes"]["b"] = {"title": "B"}
+        other.mark_dirty()
+        assert other.flush()
+    
+    merged = store.load()
+    # Словарь обновлен на месте, изменения обеих сторон видны до нашей записи
+    assert merged is data
+    assert merged["notes"] == {"a": {"title": "ours"}, "b": {"title": "B"}}
+    assert store.flush()
+    assert json.loads(metadata_file.read_text(encoding='utf-8'))["notes"] == merged["notes"]
+
+
+def test_burst_of_changes_uses_one_flush_thread(tmp_path):
+    metadata_file = tmp_path / "metadata.json"
+    store = MetadataStore(metadata_file, flush_delay=0.05, max_flush_interval=1)
+    threads_before = threading.active_count()
+    for i in range(50):
+        with store.lock:
+            store.load()["notes"][str(i)] = {"title": str(i)}
+            store.mark_dirty()
+    assert threading.active_count() <= threads_before + 1
+    
+    deadline = time.monotonic() + 5
+    while time.monotonic() < deadline and not metadata_file.exists():
+        time.sleep(0.02)
+    assert len(json.loads(metadata_file.read_text(encoding='utf-8'))["notes"]) == 50
+
+
+def test_flush_merges_in_place(tmp_path):
+    metadata_file = tmp_path / "metadata.json"
+    metadata_file.write_text(json.dumps({"notes": {}}), encoding='utf-8')
+    store = MetadataStore(metadata_file, flush_delay=60, max_flush_interval=60)
+    data = store.load()
+    with store.lock:
+        data["notes"]["a"] = {"title": "A"}
+        store.mark_dirty()
+    
+    metadata_file.write_text(json.dumps({"notes": {"b": {"title": "B"}}}), encoding='utf-8')
+    # flush без предшествующего load: слияние должно попасть в тот же словарь
+    assert store.flush()
+    assert data["notes"] == {"a": {"title": "A"}, "b": {"title": "B"}}
+
+
+@pytest.mark.skipif(not hasattr(os, "fork"), reason="нужен fork")
+def test_flush_thread_restarts_after_fork(tmp_path):
+    metadata_file = tmp_path / "metadata.json"
+    store = MetadataStore(metadata_file, flush_delay=0.01, max_flush_interval=1)
+    with store.lock:
+        store.load()["notes"]["parent"] = {}
+        store.mark_dirty()
+    assert store.flush()
+    
+    context = multiprocessing.get_context("fork")
+    process = context.Process(target=_add_note_in_child, args=(store, metadata_file))
+    process.start()
+    process.join(10)
+    assert process.exitcode == 0
+    assert "child" in json.loads(metadata_file.read_text(encoding='utf-8'))["notes"]
+
+
+def _add_note_in_child(store, metadata_file):
+    """Изменяет метаданные в дочернем процессе и ждет отложенной записи"""
+    with store.lock:
+        store.load()["notes"]["child"] = {}
+        store.mark_dirty()
+    deadline = time.monotonic() + 5
+    while time.monotonic() < deadline:
+        if "child" in json.loads(metadata_file.read_text(encoding='utf-8'))["notes"]:
+            os._exit(0)
+        time.sleep(0.02)
+    os._exit(1)
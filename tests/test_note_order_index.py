@@ -0,0 +1,75 @@
+"""
+Тесты индекса порядка заметок и постраничных курсоров
+"""
+from note_order_index import NoteOrderIndex
+
+
+def make_notes(count):
+    return {
+        f"n{i}": {"title": f"Title {i}", "created": f"2024-01-{i + 1:02d}", "modified": f"2024-02-{i + 1:02d}"}
+        for i in range(count)
+    }
+
+
+def collect_pages(index, field, descending, limit, note_ids=None):
+    """Проходит все страницы, продолжая с позиции последней заметки"""
+    pages = []
+    after = None
+    while True:
+        page = index.page(field, descending, after, limit, note_ids)
+        if not page:
+            return pages
+        pages.append(page)
+        after = index.get_position(page[-1], field)
+
+
+def test_page_order():
+    index = NoteOrderIndex(make_notes(5))
+    assert len(index) == 5
+    assert index.page("modified") == ["n4", "n3", "n2", "n1", "n0"]
+    assert index.page("created", descending=False, limit=2) == ["n0", "n1"]
+
+
+def test_cursor_pages_cover_all_notes():
+    index = NoteOrderIndex(make_notes(7))
+    assert collect_pages(index, "modified", True, 3) == [["n6", "n5", "n4"], ["n3", "n2", "n1"], ["n0"]]
+    assert collect_pages(index, "created", False, 3) == [["n0", "n1", "n2"], ["n3", "n4", "n5"], ["n6"]]
+
+
+def test_equal_values_ordered_by_id():
+    notes = {note_id: {"title": "same"} for note_id in ("b", "a", "c")}
+    index = NoteOrderIndex(notes)
+    assert collect_pages(index, "title", False, 1) == [["a"], ["b"], ["c"]]
+    assert collect_pages(index, "title", True, 2) == [["c", "b"], ["a"]]
+
+
+def test_title_sort_ignores_case():
+    index = NoteOrderIndex({"x": {"title": "beta"}, "y": {"title": "Alpha"}, "z": {}})
+    assert index.page("title", descending=False) == ["y", "x", "z"]
+
+
+def test_set_note_moves_position():
+    notes = make_notes(3)
+    index = NoteOrderIndex(notes)
+    index.set_note("n0", dict(notes["n0"], modified="2025-01-01"))
+    assert index.page("modified") == ["n0", "n2", "n1"]
+    index.set_note("new", {"title": "New", "created": "2023-01-01", "modified": "2023-01-01"})
+    assert index.page("modified")[-1] == "new"
+
+
+def test_cursor_stable_after_removal():
+    index = NoteOrderIndex(make_notes(5))
+    first = index.page("modified", limit=2)
+    after = index.get_position(first[-1], "modified")
+    # Удаление заметки, на которой остановился курсор, не сбивает следующую страницу
+    index.remove_note(first[-1])
+    assert index.get_position(first[-1], "modified") is None
+    assert index.page("modified", after=after, limit=2) == ["n2", "n1"]
+    index.remove_note("missing")
+    assert len(index) == 4
+
+
+def test_page_of_subset():
+    index = NoteOrderIndex(make_notes(6))
+    subset = {"n1", "n3", "n5", "unknown"}
+    assert collect_pages(index, "modified", True, 2, subset) == [["n5", "n3"], ["n1"]]
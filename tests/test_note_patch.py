@@ -0,0 +1,157 @@
+"""
+Тесты правок текста и JSON Patch
+"""
+import os
+import json
+import multiprocessing
+import pytest
+from encryption import EncryptionManager
+from file_manager import FileManager
+from note_patch import PatchError, VersionConflict, apply_json_patch, apply_text_ops
+
+
+def test_text_ops_applied_in_order():
+    content = apply_text_ops("hello world", [
+        {"pos": 0, "delete": 5, "insert": "goodbye"},
+        {"pos": 7, "delete": 0, "insert": ","},
+    ])
+    assert content == "goodbye, world"
+
+
+def test_text_ops_count_utf16_units():
+    # Эмодзи занимает две единицы UTF-16, как в JavaScript
+    assert apply_text_ops("a😀b", [{"pos": 3, "delete": 1, "insert": "c"}]) == "a😀c"
+
+
+def test_text_ops_reject_split_surrogate():
+    with pytest.raises(PatchError):
+        apply_text_ops("a😀b", [{"pos": 2, "delete": 1}])
+
+
+@pytest.mark.parametrize("op", [
+    {"pos": -1, "delete": 0},
+    {"pos": 2, "delete": 5},
+    {"pos": 0, "insert": 5},
+    {"pos": "x"},
+])
+def test_text_ops_reject_invalid(op):
+    with pytest.raises(PatchError):
+        apply_text_ops("abc", [op])
+
+
+def test_json_patch_operations():
+    content = json.dumps({"items": [1, 2], "meta": {"name": "a"}})
+    result = apply_json_patch(content, [
+        {"op": "add", "path": "/items/-", "value": 3},
+        {"op": "replace", "path": "/meta/name", "value": "b"},
+        {"op": "move", "from": "/items/0", "path": "/first"},
+        {"op": "copy", "from": "/meta", "path": "/copy"},
+        {"op": "remove", "path": "/copy/name"},
+        {"op": "test", "path": "/first", "value": 1},
+    ])
+    assert json.loads(result) == {"items": [2, 3], "meta": {"name": "b"}, "first": 1, "copy": {}}
+
+
+def test_json_patch_escaped_pointer():
+    result = apply_json_patch('{"a/b": {"~c": 1}}', [{"op": "replace", "path": "/a~1b/~0c", "value": 2}])
+    assert json.loads(result) == {"a/b": {"~c": 2}}
+
+
+def test_json_patch_empty_content_is_object():
+    assert json.loads(apply_json_patch("", [{"op": "add", "path": "/a", "value": 1}])) == {"a": 1}
+
+
+@pytest.mark.parametrize("patch", [
+    [{"op": "test", "path": "/a", "value": 2}],
+    [{"op": "remove", "path": "/missing"}],
+    [{"op": "add", "path": "/list/5", "value": 1}],
+    [{"op": "add", "path": "/list/01", "value": 1}],
+    [{"op": "move", "from": "/obj", "path": "/obj/inner"}],
+    [{"op": "remove", "path": ""}],
+    [{"op": "unknown", "path": "/a"}],
+    [{"op": "add", "path": "a", "value": 1}],
+])
+def test_json_patch_rejects_invalid(patch):
+    with pytest.raises(PatchError):
+        apply_json_patch('{"a": 1, "list": [], "obj": {}}', patch)
+
+
+def test_json_patch_rejects_non_json_content():
+    with pytest.raises(PatchError):
+        apply_json_patch("not json", [])
+
+
+@pytest.fixture
+def file_manager(tmp_path):
+    notes_dir = tmp_path / "notes"
+    file_manager = FileManager(str(notes_dir), EncryptionManager("secret", notes_dir))
+    yield file_manager
+    file_manager.close()
+
+
+def test_patch_note_bumps_version(file_manager):
+    note = file_manager.create_note("T", "hello")
+    assert file_manager.patch_note(note["id"], 1, ops=[{"pos": 5, "insert": " world"}]) == 2
+    assert file_manager.get_note(note["id"])["content"] == "hello world"
+    assert file_manager.patch_note("missing", 1, ops=[]) is None
+
+
+def test_patch_note_stale_version_conflicts(file_manager):
+    note = file_manager.create_note("T", "hello")
+    file_manager.patch_note(note["id"], 1, ops=[{"pos": 0, "insert": "a"}])
+    with pytest.raises(VersionConflict) as info:
+        file_manager.patch_note(note["id"], 1, ops=[{"pos": 0, "insert": "b"}])
+    assert info.value.version == 2
+    assert file_manager.get_note(note["id"])["content"] == "ahello"
+
+
+@pytest.mark.skipif(not hasattr(os, "fork"), reason="нужен fork")
+def test_patch_conflicts_across_processes(tmp_path, file_manager):
+    note = file_manager.create_note("T", "base")
+    assert file_manager.flush_metadata()
+    
+    # Два воркера одновременно отправляют PATCH с одной base_version
+    context = multiprocessing.get_context("fork")
+    barrier = context.Barrier(2)
+    results = context.Queue()
+    processes = [context.Process(target=_patch_in_worker,
+                                 args=(tmp_path / "notes", note["id"], text, barrier, results))
+                 for text in ("A", "B")]
+    for process in processes:
+        process.start()
+    outcomes = sorted(results.get(timeout=30) for _ in processes)
+    for process in processes:
+        process.join(10)
+    
+    assert outcomes == ["conflict:2", "ok:2"]
+    reader = FileManager(str(tmp_path / "notes"), EncryptionManager("secret", tmp_path / "notes"))
+    assert reader.get_note(note["id"])["content"] in ("Abase", "Bbase")
+
+
+def _patch_in_worker(notes_dir, note_id, text, barrier, results):
+    """PATCH из отдельного процесса со своим менеджером"""
+    file_manager = FileManager(str(notes_dir), EncryptionManager("secret", notes_dir))
+    barrier.wait()
+    try:
+        version = file_manager.patch_note(note_id, 1, ops=[{"pos": 0, "insert": text}])
+        results.put(f"ok:{version}")
+    except VersionConflict as e:
+        results.put(f"conflict:{e.version}")
+
+
+def test_patch_route_status_codes(client):
+    note = client.post('/api/notes', json={'title': 'T', 'content': 'hello'}).get_json()['note']
+    url = f"/api/notes/{note['id']}"
+    
+    response = client.patch(url, json={'base_version': 1, 'ops': [{'pos': 0, 'insert': '>'}]})
+    assert response.status_code == 200
+    assert response.get_json() == {'version': 2}
+    
+    response = client.patch(url, json={'base_version': 1, 'ops': [{'pos': 0, 'insert': '>'}]})
+    assert response.status_code == 409
+    assert response.get_json()['version'] == 2
+    
+    response = client.patch(url, json={'base_version': 2, 'ops': [{'pos': 100, 'delete': 1}]})
+    assert response.status_code == 422
+    assert client.patch(url, json={'ops': []}).status_code == 400
+    assert client.patch('/api/notes/missing', json={'base_version': 1, 'ops': []}).status_code == 404
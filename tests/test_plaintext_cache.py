@@ -0,0 +1,76 @@
+"""
+Тесты кеша расшифрованного содержимого заметок
+"""
+from encryption import EncryptionManager
+from file_manager import FileManager, GET_NOTE_ATTEMPTS
+from plaintext_cache import PlaintextCache
+
+
+def test_get_requires_same_stamp():
+    cache = PlaintextCache()
+    cache.put("a", (1, 3), 2, "abc")
+    assert cache.get("a", (1, 3)) == (2, "abc")
+    assert cache.get("a", (2, 3)) is None
+    # Устаревшая запись удаляется
+    assert cache.size == 0
+
+
+def test_lru_bounded_by_bytes():
+    cache = PlaintextCache(max_bytes=10)
+    cache.put("a", (1, 4), 1, "aaaa")
+    cache.put("b", (1, 4), 1, "bbbb")
+    assert cache.get("a", (1, 4)) is not None
+    cache.put("c", (1, 4), 1, "cccc")
+    # Вытеснена давно не читанная запись
+    assert cache.get("b", (1, 4)) is None
+    assert cache.get("a", (1, 4)) == (1, "aaaa")
+    assert cache.size == 8
+    
+    # Кириллица - по два байта UTF-8 на символ
+    cache.put("d", (1, 12), 1, "дддддд")
+    assert cache.get("d", (1, 12)) is None
+    assert cache.size == 8
+
+
+def test_evicted_content_wiped():
+    cache = PlaintextCache(max_bytes=4)
+    cache.put("a", (1, 4), 1, "aaaa")
+    data = cache._entries["a"][2]
+    cache.put("b", (1, 4), 1, "bbbb")
+    assert data == bytearray(4)
+    cache.clear()
+    assert cache.size == 0 and not cache._entries
+
+
+def test_get_note_served_from_cache(tmp_path):
+    notes_dir = tmp_path / "notes"
+    file_manager = FileManager(str(notes_dir), EncryptionManager("secret", notes_dir))
+    note_id = file_manager.create_note("t", "текст")["id"]
+    file_manager._content_cache.clear()
+    
+    assert file_manager.get_note(note_id)["content"] == "текст"
+    file_manager._read_note_content = None
+    assert file_manager.get_note(note_id)["content"] == "текст"
+
+
+def test_get_note_consistent_while_note_rewritten(tmp_path):
+    notes_dir = tmp_path / "notes"
+    file_manager = FileManager(str(notes_dir), EncryptionManager("secret", notes_dir))
+    note_id = file_manager.create_note("t", "v1")["id"]
+    writer = FileManager(str(notes_dir), EncryptionManager("secret", notes_dir))
+    read_content = file_manager._read_note_content
+    rewrites = []
+    
+    def read_while_rewritten(nid):
+        # Пока заметку читают без блокировки, ее успевает переписать другой менеджер
+        if len(rewrites) < GET_NOTE_ATTEMPTS:
+            rewrites.append(nid)
+            writer.update_note(nid, content=f"v{len(rewrites) + 1}")
+        return read_content(nid)
+    
+    file_manager._read_note_content = read_while_rewritten
+    file_manager._content_cache.clear()
+    note = file_manager.get_note(note_id)
+    
+    assert note["content"] == f"v{GET_NOTE_ATTEMPTS + 1}"
+    assert note["version"] == writer.get_note(note_id)["version"]
@@ -0,0 +1,83 @@
+"""
+Тесты ранжирования BM25 и стеммера
+"""
+from encryption import EncryptionManager
+from file_manager import FileManager
+from ranking import RankIndex, analyze, stem
+
+
+def test_stem_word_forms():
+    assert stem("заметки") == stem("заметка") == stem("заметкой")
+    assert stem("красивые") == stem("красивая")
+    assert stem("ёлка") == stem("елка")
+    assert stem("notes") == "notes"
+
+
+def test_analyze_lowercases_and_stems():
+    assert analyze("Заметки, NOTES!") == [stem("заметки"), "notes"]
+
+
+def make_index():
+    index = RankIndex()
+    index.update("title", {"title": "Python", "tags": "", "body": "разные слова"})
+    index.update("tags", {"title": "Другое", "tags": "python", "body": "разные слова"})
+    index.update("body", {"title": "Третье", "tags": "", "body": "немного про python и другое"})
+    return index
+
+
+def test_field_weights_order_results():
+    total, results = make_index().search("python")
+    assert total == 3
+    assert [note_id for note_id, _ in results] == ["title", "tags", "body"]
+
+
+def test_all_words_required():
+    total, results = make_index().search("python разные")
+    assert total == 2
+    assert {note_id for note_id, _ in results} == {"title", "tags"}
+    assert make_index().search("python отсутствует") == (0, [])
+
+
+def test_last_word_matches_prefix():
+    total, results = make_index().search("pyth")
+    assert total == 3
+
+
+def test_pagination():
+    index = make_index()
+    _, everything = index.search("python", limit=3)
+    total, page = index.search("python", limit=1, offset=1)
+    assert total == 3
+    assert page == everything[1:2]
+
+
+def test_update_and_remove():
+    index = make_index()
+    index.update("body", {"title": "", "tags": "", "body": "ничего"})
+    assert index.search("python")[0] == 2
+    index.remove("title")
+    index.remove("missing")
+    assert "title" not in index
+    assert sorted(index.note_ids()) == ["body", "tags"]
+    assert index.search("python")[0] == 1
+
+
+def test_file_manager_rank_sees_changes_from_other_manager(tmp_path):
+    notes_dir = tmp_path / "notes"
+    writer = FileManager(str(notes_dir), EncryptionManager("secret", notes_dir))
+    reader = FileManager(str(notes_dir), EncryptionManager("secret", notes_dir))
+    try:
+        note = writer.create_note("Первая", "про python")
+        assert reader.rank_notes("python")[0] == 1
+        
+        writer.update_note(note["id"], content="про java")
+        second = writer.create_note("Вторая", "тоже python")
+        total, results = reader.rank_notes("python")
+        assert total == 1
+        assert results[0]["id"] == second["id"]
+        
+        writer.delete_note(second["id"])
+        assert reader.rank_notes("python") == (0, [])
+    finally:
+        writer.close()
+        reader.close()
@@ -0,0 +1,129 @@
+"""
+Тесты смены пароля: отзыв сессий со старым паролем и перешифрование файлов
+"""
+import os
+import time
+import pytest
+from pathlib import Path
+from atomic_io import file_lock
+from encryption import EncryptionManager
+from rekey_job import REKEY_STATE_FILE, RekeyJob, resume_rekey, get_rekey_job
+
+try:
+    import fcntl
+except ImportError:
+    fcntl = None
+
+
+def _wait_rekey(app):
+    job = get_rekey_job(app.config['NOTES_DIR'])
+    deadline = time.monotonic() + 30
+    while job.active and time.monotonic() < deadline:
+        time.sleep(0.05)
+    assert not job.active
+    return job
+
+
+def test_change_password_revokes_other_sessions(app, client):
+    other = app.test_client()
+    assert other.post('/api/login', json={'password': 'secret1'}).status_code == 200
+    
+    response = client.post('/api/change-password',
+                           json={'old_password': 'secret1', 'new_password': 'secret2'})
+    assert response.status_code == 200
+    _wait_rekey(app)
+    
+    # Сессия со старым паролем отозвана и не может писать файлы старым ключом
+    assert other.post('/api/notes', json={'title': 't', 'content': 'c'}).status_code == 401
+    assert other.get('/api/check-auth').get_json()['authenticated'] is False
+    assert client.post('/api/notes', json={'title': 't', 'content': 'c'}).status_code == 201
+    
+    assert other.post('/api/login', json={'password': 'secret1'}).status_code == 401
+    assert other.post('/api/login', json={'password': 'secret2'}).status_code == 200
+    assert other.get('/api/notes').status_code == 200
+
+
+def test_change_password_revokes_sessions_of_other_workers(app, client, tmp_path):
+    # Второй экземпляр приложения - как другой воркер со своим AuthManager
+    from app import create_app
+    worker = create_app(dict(app.config))
+    other = worker.test_client()
+    assert other.post('/api/login', json={'password': 'secret1'}).status_code == 200
+    assert other.get('/api/notes').status_code == 200
+    
+    assert client.post('/api/change-password',
+                       json={'old_password': 'secret1', 'new_password': 'secret2'}).status_code == 200
+    _wait_rekey(app)
+    
+    assert other.get('/api/notes').status_code == 401
+
+
+def test_rekey_reencrypts_notes(app, client):
+    note_id = client.post('/api/notes', json={'title': 'план', 'content': 'текст'}).get_json()['note']['id']
+    assert client.post('/api/change-password',
+                       json={'old_password': 'secret1', 'new_password': 'secret2'}).status_code == 200
+    job = _wait_rekey(app)
+    assert job.status == "done" and not job.failed
+    
+    notes_dir = Path(app.config['NOTES_DIR'])
+    blob = (notes_dir / f"{note_id}.enc").read_bytes()
+    assert EncryptionManager('secret2', notes_dir).decrypt_bytes(blob)
+    assert client.get(f'/api/notes/{note_id}').get_json()['note']['content'] == 'текст'
+
+
+def test_resume_rekey_continues_interrupted_job(tmp_path):
+    notes_dir = tmp_path / "notes"
+    notes_dir.mkdir()
+    old = EncryptionManager("old", notes_dir)
+    for name in ("a.enc", "b.enc"):
+        (notes_dir / name).write_bytes(old.encrypt_bytes(name.encode('utf-8')))
+    
+    # Задача "упала" после сохранения состояния, не перешифровав ни одного файла
+    interrupted = RekeyJob(notes_dir, ["old"], "new")
+    interrupted.status = "running"
+    interrupted._save_state()
+    
+    job = resume_rekey(notes_dir, "new")
+    assert job is not None
+    job._thread.join(30)
+    assert job.status == "done"
+    new = EncryptionManager("new", notes_dir)
+    assert new.decrypt_bytes((notes_dir / "a.enc").read_bytes()) == b"a.enc"
+    assert resume_rekey(notes_dir, "new") is None
+
+
+@pytest.mark.skipif(fcntl is None, reason="нужен fcntl")
+def test_resume_rekey_skipped_while_other_process_runs_job(tmp_path):
+    notes_dir = tmp_path / "notes"
+    notes_dir.mkdir()
+    old = EncryptionManager("old", notes_dir)
+    (notes_dir / "a.enc").write_bytes(old.encrypt_bytes(b"a"))
+    interrupted = RekeyJob(notes_dir, ["old"], "new")
+    interrupted.status = "running"
+    interrupted._save_state()
+    
+    # Другой воркер выполняет задачу и держит блокировку файла состояния
+    ready_r, ready_w = os.pipe()
+    release_r, release_w = os.pipe()
+    pid = os.fork()
+    if pid == 0:
+        with file_lock(notes_dir / REKEY_STATE_FILE):
+            os.write(ready_w, b"1")
+            os.read(release_r, 1)
+        os._exit(0)
+    os.read(ready_r, 1)
+    
+    try:
+        job = resume_rekey(notes_dir, "new")
+        job._thread.join(30)
+        assert job.status == "skipped"
+        assert old.decrypt_bytes((notes_dir / "a.enc").read_bytes()) == b"a"
+    finally:
+        os.write(release_w, b"1")
+        os.waitpid(pid, 0)
+    
+    # Другой воркер упал, не закончив задачу - ее продолжает следующий вход
+    job = resume_rekey(notes_dir, "new")
+    job._thread.join(30)
+    assert job.status == "done"
+    assert EncryptionManager("new", notes_dir).decrypt_bytes((notes_dir / "a.enc").read_bytes()) == b"a"
@@ -0,0 +1,77 @@
+"""
+Тесты зашифрованного поискового индекса
+"""
+import pytest
+from encryption import EncryptionManager
+from search_index import SearchIndex, make_matches
+
+
+@pytest.fixture(scope="module")
+def manager(tmp_path_factory):
+    return EncryptionManager("secret", tmp_path_factory.mktemp("vault"))
+
+
+@pytest.fixture
+def index(tmp_path, manager):
+    return SearchIndex(tmp_path / "search_index", manager, save_delay=60, max_save_interval=60)
+
+
+def test_candidates_match_substrings(index):
+    index.update("a", "Привет, мир! Hello world")
+    index.update("b", "Другой текст")
+    assert index.candidates("мир") == {"a"}
+    assert index.candidates("ello wor") == {"a"}
+    assert index.candidates("кст") == {"b"}
+    assert index.candidates("мир текст") == set()
+
+
+def test_match_positions_use_token_positions(index):
+    text = "abc abcabc, abc"
+    index.update("a", text)
+    positions = index.match_positions("a", "abc")
+    assert positions == [i for i in range(len(text)) if text.startswith("abc", i)]
+    assert index.match_positions("a", "c, a") == [text.index("c, a")]
+    assert index.match_positions("a", "abc abd") == []
+    
+    matches = make_matches(text, positions, 3)
+    assert [(match["start"], match["end"]) for match in matches] == [(pos, pos + 3) for pos in positions]
+
+
+def test_remove_and_update(index):
+    index.update("a", "first version")
+    index.update("a", "second")
+    assert index.candidates("first") == set()
+    assert index.candidates("second") == {"a"}
+    index.remove("a")
+    assert index.candidates("second") == set()
+    assert index.indexed_ids() == set()
+
+
+def test_save_and_load_round_trip(tmp_path, manager, index):
+    index.update("a", "persisted words", mtime=5)
+    index.mark_unreadable("b", 7)
+    assert index.dirty
+    assert index.save()
+    assert not index.dirty
+    
+    loaded = SearchIndex(tmp_path / "search_index", manager)
+    assert loaded.load()
+    assert loaded.candidates("words") == {"a"}
+    assert loaded.is_current("a", 5)
+    assert loaded.is_current("b", 7)
+    # Файл индекса зашифрован
+    for segment_file in (tmp_path / "search_index").glob("*.enc"):
+        assert b"persisted" not in segment_file.read_bytes()
+
+
+def test_save_rewrites_only_changed_segments(tmp_path, index):
+    for i in range(20):
+        index.update(f"note-{i}", f"text {i}")
+    assert index.save()
+    files = {path.name: path.stat().st_mtime_ns for path in (tmp_path / "search_index").glob("*.enc")}
+    
+    index.update("note-3", "changed")
+    assert index.save()
+    changed = [path.name for path in (tmp_path / "search_index").glob("*.enc")
+               if path.stat().st_mtime_ns != files.get(path.name)]
+    assert changed == [index._segment_file(index._segment("note-3")).name]
@@ -0,0 +1,50 @@
+"""
+Тесты индекса тегов
+"""
+from tag_index import TagIndex
+
+
+def make_index():
+    return TagIndex({
+        "a": {"tags": ["work", "urgent"]},
+        "b": {"tags": ["work"]},
+        "c": {"tags": ["home"]},
+        "d": {},
+    })
+
+
+def test_counts():
+    assert make_index().get_counts() == {"work": 2, "urgent": 1, "home": 1}
+
+
+def test_find_all_and_any():
+    index = make_index()
+    assert index.find(["work", "urgent"]) == {"a"}
+    assert index.find(["work", "home"]) == set()
+    assert index.find(["urgent", "home"], match_all=False) == {"a", "c"}
+    assert index.find(["missing"]) == set()
+    assert index.find([]) == set()
+
+
+def test_find_result_is_a_copy():
+    index = make_index()
+    index.find(["work"]).clear()
+    index.find(["work"], match_all=False).clear()
+    assert index.find(["work"]) == {"a", "b"}
+
+
+def test_set_tags_replaces_old_tags():
+    index = make_index()
+    index.set_tags("a", ["home"])
+    assert index.find(["home"]) == {"a", "c"}
+    assert index.find(["urgent"]) == set()
+    assert "urgent" not in index.get_counts()
+
+
+def test_remove_note():
+    index = make_index()
+    index.remove_note("c")
+    index.remove_note("missing")
+    assert "home" not in index.get_counts()
+    index.set_tags("b", [])
+    assert index.find(["work"]) == {"a"}
@@ -0,0 +1,33 @@
+"""
+Точка входа для production-сервера
+
+Пример запуска на нескольких ядрах:
+    gunicorn -w 4 -b 0.0.0.0:5000 wsgi:app
+
+Лента изменений /api/changes держит соединение открытым (до нескольких минут),
+поэтому при ее использовании нужны потоковые воркеры, иначе каждая вкладка
+занимает воркер целиком:
+    gunicorn -w 4 -k gthread --threads 16 -b 0.0.0.0:5000 wsgi:app
+
+Настройки берутся из переменных окружения:
+    ZAMETIK_SESSION_BACKEND - 'filesystem' (по умолчанию) или 'cookie'
+        (см. create_app)
+    ZAMETIK_NOTES_DIR - директория заметок (по умолчанию notes)
+    ZAMETIK_SECRET_KEY_FILE - файл секретного ключа (один на все воркеры)
+    ZAMETIK_COOKIE_SECURE - '1', если сервер доступен только по HTTPS
+    ZAMETIK_CRYPTO_WORKERS - потоков криптографии на воркер (по умолчанию по числу
+        ядер; при нескольких воркерах разумно ядра / число воркеров)
+
+Какие кеши общие, а какие свои у каждого воркера - см. create_app.
+"""
+import os
+from app import create_app, SECRET_KEY_FILE
+
+
+app = create_app({
+    'SESSION_BACKEND': os.environ.get('ZAMETIK_SESSION_BACKEND', 'filesystem'),
+    'NOTES_DIR': os.environ.get('ZAMETIK_NOTES_DIR', 'notes'),
+    'SECRET_KEY_FILE': os.environ.get('ZAMETIK_SECRET_KEY_FILE', SECRET_KEY_FILE),
+    'SESSION_COOKIE_SECURE': os.environ.get('ZAMETIK_COOKIE_SECURE') == '1',
+    'CRYPTO_WORKERS': int(os.environ.get('ZAMETIK_CRYPTO_WORKERS', 0)) or None,
+})